@@ -1,3 +1,5 @@
+import time
+_t_inicio = time.perf_counter()
 #Dash
 from dash import Dash
 import dash_bootstrap_components as dbc
@@ -8,11 +10,31 @@ from callbacks.callbacks import register_callbacks
 #OPC
 from utils.opc_client import opc_client_instance
 
+# Objetivo de arranque en frío hasta la primera página servida [s]
+OBJETIVO_ARRANQUE_S = 3.0
+
 app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], suppress_callback_exceptions=True)
 
-app.layout = create_layout()
+# El layout se construye recién con la primera petición y se reutiliza en las siguientes
+_layout = None
+def servir_layout():
+    global _layout
+    if _layout is None:
+        _layout = create_layout()
+        arranque = time.perf_counter() - _t_inicio
+        estado = 'OK' if arranque <= OBJETIVO_ARRANQUE_S else 'sobre el objetivo de {:.1f} s'.format(OBJETIVO_ARRANQUE_S)
+        print('Primera página servida a {:.2f} s del arranque ({})'.format(arranque, estado))
+    return _layout
+
+app.layout = servir_layout
 
 register_callbacks(app)
 
+# La conexión OPC se establece en segundo plano: el supervisor conecta, restaura la
+# suscripción de muestreo que alimenta la caché de los callbacks y reconecta si el servidor cae
+opc_client_instance.iniciar_muestreo()
+opc_client_instance.iniciar_supervisor()
+print('App lista en {:.2f} s'.format(time.perf_counter() - _t_inicio))
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,166 @@
+# calculos/ejecutorControl.py
+import threading
+import time
+from calculos.metricasLazo import MetricasLazo
+
+'''
+Ejecutor del lazo cerrado en un thread propio, a periodo fijo.
+
+Antes el PID corría dentro de un callback de Dash disparado por el intervalo del navegador: la
+frecuencia de control dependía de los timers del browser, cada pestaña abierta ejecutaba un paso
+extra y una página lenta detenía el control. Aquí un thread lee las mediciones (caché del
+muestreo del Cliente), calcula todos los lazos del banco de PIDs en una llamada con el dt medido
+desde el cálculo anterior y escribe los actuadores en un solo Write. El dashboard solo observa
+(ultimo, estadisticas, metricas_lazos) y cambia parámetros con aplicar(), que se intercambian de
+forma atómica entre dos pasos de control.
+
+El controlador puede ser el PIDBank o cualquier objeto con compute(mediciones, dt), setpoint
+(uno por actuador) y reset(), p. ej. MPCController o LQRController, que además reciben H3, H4
+y γ. usar() lo reemplaza entre dos pasos conservando las referencias.
+'''
+
+
+class EjecutorControl():
+    def __init__(self, cliente, controlador, medidas, actuadores, periodo=1.0, plazo=None):
+        # Las mediciones van al controlador en el orden de medidas y la salida i se escribe en
+        # actuadores[i]; las primeras len(actuadores) medidas son las variables controladas
+        self.cliente = cliente
+        self.controlador = controlador
+        self.medidas = list(medidas)
+        self.actuadores = list(actuadores)
+        self.periodo = periodo
+        self.plazo = plazo if plazo is not None else periodo
+
+        self._lock = threading.Lock()  # protege el controlador y sus parámetros durante un paso
+        self._detener = threading.Event()
+        self._thread = None
+        self._ultimo_calculo = None
+        self.ultimo = None
+        self.metricas = [MetricasLazo() for _ in self.actuadores]  # una por lazo, en el mismo orden
+        self.stats = {'ticks': 0, 'atrasos': 0, 'omitidos': 0, 'sin_medicion': 0, 'errores': 0,
+                      'dt_ultimo': None, 'jitter_ultimo': None, 'jitter_max': 0.0, 'jitter_medio': 0.0,
+                      'calculo_ultimo': None, 'calculo_max': 0.0, 'ultimo_error': None}
+
+    def activo(self):
+        return self._thread is not None
+
+    def iniciar(self):
+        if self._thread is not None:
+            return
+        self._detener.clear()
+        self._ultimo_calculo = None  # el primer paso usa el periodo nominal como dt
+        with self._lock:
+            for metricas in self.metricas:
+                metricas.interrumpir()  # el tiempo detenido no entra en IAE, ISE ni esfuerzo
+        self._thread = threading.Thread(target=self._correr, name='ejecutor_control', daemon=True)
+        self._thread.start()
+
+    def detener(self):
+        self._detener.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def aplicar(self, cambios, reiniciar=False):
+        """
+        Cambia parámetros de uno o varios canales en una sola sección crítica: el siguiente paso
+        los usa todos juntos y nunca un paso ve una mezcla de valores nuevos y anteriores.
+        cambios: {canal: {'Kp': ..., 'Ki': ..., 'Kd': ..., 'setpoint': ..., 'anti_windup_gain': ...}};
+        las claves ausentes o en None conservan su valor, igual que las que el controlador no tiene
+        (p. ej. las ganancias PID con el MPC).
+        """
+        with self._lock:
+            for canal, params in cambios.items():
+                for nombre, valor in params.items():
+                    if valor is not None and hasattr(self.controlador, nombre):
+                        getattr(self.controlador, nombre)[canal] = valor
+                if reiniciar:
+                    self.controlador.reset(canal)
+                # Cada referencia aplicada empieza un tramo nuevo de métricas (aunque repita el valor)
+                if params.get('setpoint') is not None:
+                    self.metricas[canal].reiniciar()
+
+    def paso(self, ahora=None):
+        ahora = time.perf_counter() if ahora is None else ahora
+        medidas = self.medidas
+        valores = self.cliente.read_snapshot()['valores']
+        mediciones = [valores.get(key) for key in medidas]
+        if None in mediciones:
+            self.stats['sin_medicion'] += 1
+            return None
+        with self._lock:
+            if medidas is not self.medidas:  # usar() cambió el controlador durante la lectura
+                return None
+            dt = self.periodo if self._ultimo_calculo is None else ahora - self._ultimo_calculo
+            self._ultimo_calculo = ahora
+            salidas = [float(u) for u in self.controlador.compute(mediciones, dt)]
+            setpoints = [float(sp) for sp in self.controlador.setpoint]
+        self.cliente.escribir_varios(dict(zip(self.actuadores, salidas)))
+        t = time.time()
+        with self._lock:
+            for metricas, y, u, sp in zip(self.metricas, mediciones, salidas, setpoints):
+                metricas.actualizar(t, y, u, sp)
+        self.stats['dt_ultimo'] = dt
+        self.ultimo = {'t': t, 'dt': dt, 'mediciones': dict(zip(medidas, mediciones)),
+                       'salidas': dict(zip(self.actuadores, salidas)), 'setpoints': setpoints}
+        return salidas
+
+    def usar(self, controlador, medidas=None):
+        """
+        Cambia el controlador entre dos pasos de control. El nuevo parte reiniciado con las
+        referencias del anterior, así que las métricas de los lazos siguen en su tramo.
+        """
+        with self._lock:
+            if controlador is self.controlador:
+                return
+            controlador.setpoint[:] = self.controlador.setpoint
+            controlador.reset()
+            self.controlador = controlador
+            if medidas is not None:
+                self.medidas = list(medidas)
+            self._ultimo_calculo = None
+
+    # Paso fijo contra el reloj monotónico; si un paso se atrasa más de un periodo no se recupera en ráfaga
+    def _correr(self):
+        siguiente = time.perf_counter()
+        while not self._detener.is_set():
+            inicio = time.perf_counter()
+            try:
+                self.paso(inicio)
+            except Exception as e:
+                self.stats['errores'] += 1
+                self.stats['ultimo_error'] = str(e)
+            fin = time.perf_counter()
+            self._registrar(inicio - siguiente, fin - inicio, fin - siguiente)
+
+            siguiente += self.periodo
+            espera = siguiente - time.perf_counter()
+            if espera > 0:
+                self._detener.wait(espera)
+            elif espera < -self.periodo:
+                self.stats['omitidos'] += int(-espera // self.periodo)
+                siguiente = time.perf_counter()
+
+    def _registrar(self, jitter, calculo, respuesta):
+        stats = self.stats
+        stats['ticks'] += 1
+        stats['jitter_ultimo'] = jitter
+        stats['jitter_max'] = max(stats['jitter_max'], abs(jitter))
+        stats['jitter_medio'] += (abs(jitter) - stats['jitter_medio']) / stats['ticks']
+        stats['calculo_ultimo'] = calculo
+        stats['calculo_max'] = max(stats['calculo_max'], calculo)
+        if respuesta > self.plazo:
+            stats['atrasos'] += 1
+
+    def metricas_lazos(self, desde=None, hasta=None):
+        # Métricas del tramo actual de cada lazo y, si se pide una ventana (epoch), su resumen
+        with self._lock:
+            return {medida: {'tramo': metricas.estado(),
+                             'ventana': metricas.resumen(desde, hasta) if desde is not None or hasta is not None else None}
+                    for medida, metricas in zip(self.medidas, self.metricas)}
+
+    def estadisticas(self):
+        stats = dict(self.stats)
+        stats['activo'] = self.activo()
+        stats['periodo'] = self.periodo
+        return stats
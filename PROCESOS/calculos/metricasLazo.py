@@ -0,0 +1,127 @@
+# calculos/metricasLazo.py
+from bisect import bisect_left, bisect_right
+from collections import deque
+
+'''
+Métricas de desempeño de un lazo de control calculadas en línea, en O(1) por muestra.
+
+Desde el último cambio de referencia: IAE, ISE, ITAE, sobrepaso, tiempo de subida (10-90 %),
+tiempo de establecimiento en la banda ± que dibuja el dashboard, error estacionario (promedio
+desde que entró a la banda) y esfuerzo de control (∫u² dt y variación total de u). Un cambio de
+referencia, o reiniciar(), empieza un tramo nuevo. La primera muestra de un tramo, o la primera
+tras interrumpir() (lazo detenido), no integra nada: el intervalo sin control no cuenta.
+
+Además se guardan las integrales acumuladas desde el inicio con su instante, de modo que
+resumen(desde, hasta) entrega IAE/ISE/esfuerzo de cualquier ventana como una diferencia, sin
+volver a recorrer los buffers.
+'''
+
+BANDA = 0.01  # cm, banda ± alrededor de la referencia (la que dibujan las figuras del modo automático)
+
+CAMPOS = ('iae', 'ise', 'itae', 'sobrepaso', 'tiempo_subida', 'establecimiento', 'error_estacionario',
+          'esfuerzo', 'variacion_u')
+
+
+class MetricasLazo():
+    def __init__(self, banda=BANDA, largo_acumulados=3600):
+        self.banda = banda
+        self.setpoint = None
+        # Integrales acumuladas desde la creación: (t, iae, ise, esfuerzo) por muestra
+        self._tiempos = deque(maxlen=largo_acumulados)
+        self._acumulados = deque(maxlen=largo_acumulados)
+        self._total = (0.0, 0.0, 0.0)
+        self._t_prev = None
+        self._u_prev = None
+        self._continua = False  # la muestra anterior es del mismo intervalo de control (se integra dt)
+
+    def reiniciar(self):
+        # El tramo nuevo empieza con la siguiente muestra (que fija el valor inicial del salto)
+        self.setpoint = None
+
+    def interrumpir(self):
+        # El lazo se detuvo: la siguiente muestra no integra el intervalo transcurrido
+        self._continua = False
+
+    def _nuevo_tramo(self, t, y, setpoint):
+        self.setpoint = setpoint
+        self.t0 = t
+        self.y0 = y
+        self.salto = setpoint - y
+        self.iae = self.ise = self.itae = 0.0
+        self.esfuerzo = self.variacion_u = 0.0
+        self.sobrepaso = 0.0
+        self._t10 = self._t90 = None
+        self._dentro = False
+        self._t_entrada = None
+        self._suma_error = 0.0
+        self._n_dentro = 0
+        self.muestras = 0
+        self._continua = False
+
+    def actualizar(self, t, y, u, setpoint):
+        if self.setpoint is None or setpoint != self.setpoint:
+            self._nuevo_tramo(t, y, setpoint)
+        dt = t - self._t_prev if self._continua else 0.0
+        error = setpoint - y
+
+        # Integrales del tramo (rectángulo con la muestra actual) y acumuladas globales
+        self.iae += abs(error) * dt
+        self.ise += error * error * dt
+        self.itae += (t - self.t0) * abs(error) * dt
+        self.esfuerzo += u * u * dt
+        if self._u_prev is not None and self.muestras > 0:
+            self.variacion_u += abs(u - self._u_prev)
+        iae, ise, esfuerzo = self._total
+        self._total = (iae + abs(error) * dt, ise + error * error * dt, esfuerzo + u * u * dt)
+        self._tiempos.append(t)
+        self._acumulados.append(self._total)
+
+        # Sobrepaso y tiempo de subida respecto del salto de referencia del tramo
+        if abs(self.salto) > self.banda:
+            avance = (y - self.y0) / self.salto
+            self.sobrepaso = max(self.sobrepaso, 100.0 * (avance - 1.0))
+            if self._t10 is None and avance >= 0.1:
+                self._t10 = t
+            if self._t90 is None and avance >= 0.9:
+                self._t90 = t
+
+        # Establecimiento: instante de la última entrada a la banda; error estacionario desde entonces
+        if abs(error) <= self.banda:
+            if not self._dentro:
+                self._dentro = True
+                self._t_entrada = t
+                self._suma_error = 0.0
+                self._n_dentro = 0
+            self._suma_error += error
+            self._n_dentro += 1
+        else:
+            self._dentro = False
+
+        self.muestras += 1
+        self._continua = True
+        self._t_prev = t
+        self._u_prev = u
+
+    def estado(self):
+        """Métricas del tramo actual; las que aún no se alcanzan quedan en None."""
+        if self.setpoint is None:
+            return None
+        return {'setpoint': self.setpoint, 't_inicio': self.t0, 'duracion': (self._t_prev or self.t0) - self.t0,
+                'muestras': self.muestras, 'iae': self.iae, 'ise': self.ise, 'itae': self.itae,
+                'sobrepaso': self.sobrepaso,
+                'tiempo_subida': self._t90 - self._t10 if self._t90 is not None else None,
+                'establecimiento': self._t_entrada - self.t0 if self._dentro else None,
+                'error_estacionario': self._suma_error / self._n_dentro if self._dentro else None,
+                'esfuerzo': self.esfuerzo, 'variacion_u': self.variacion_u}
+
+    def resumen(self, desde=None, hasta=None):
+        """IAE, ISE y esfuerzo entre los instantes desde y hasta (dentro de lo guardado)."""
+        if not self._tiempos:
+            return None
+        i = 0 if desde is None else bisect_left(self._tiempos, desde)
+        j = len(self._tiempos) - 1 if hasta is None else bisect_right(self._tiempos, hasta) - 1
+        if j <= i:
+            return {'duracion': 0.0, 'iae': 0.0, 'ise': 0.0, 'esfuerzo': 0.0}
+        inicio, fin = self._acumulados[i], self._acumulados[j]
+        return {'duracion': self._tiempos[j] - self._tiempos[i], 'iae': fin[0] - inicio[0],
+                'ise': fin[1] - inicio[1], 'esfuerzo': fin[2] - inicio[2]}
@@ -1,18 +1,50 @@
 # calculos/pidManager.py
-from utils.pid_controller import PIDController
+import os
+from utils.pid_controller import PIDBank
+from utils.mpc_controller import MPCController
+from utils.lqr_controller import LQRController, TablaLQR
+from utils.opc_client import opc_client_instance
+from calculos.ejecutorControl import EjecutorControl
 
 # PIDs SOLO para u1 (h1) y u2 (h2). γ se ajusta manualmente.
-pid_h1 = PIDController(Kp=0.3, Ki=0, Kd=0, setpoint=0, dt=1.0, anti_windup_gain=0)
-pid_h2 = PIDController(Kp=0.3, Ki=0, Kd=0, setpoint=0, dt=1.0, anti_windup_gain=0)
+# Ambos lazos son canales de un mismo banco: se pueden calcular juntos con banco.compute([h1, h2])
+banco = PIDBank(2, Kp=0.3, Ki=0, Kd=0, setpoint=0, dt=1.0, anti_windup_gain=0)
+pid_h1 = banco.canal(0)
+pid_h2 = banco.canal(1)
+
+# Alternativa a los PID: MPC multivariable de h1 y h2 (mide los cuatro niveles y γ)
+mpc = MPCController(Ts=1.0, output_limits=(0, 0.999))
+
+# Otra alternativa: LQR con acción integral y ganancias interpoladas de una tabla de Riccati. La
+# tabla se calcula al elegirlo por primera vez (unos segundos) y queda guardada en data/
+RUTA_TABLA_LQR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'tabla_lqr.pkl')
+lqr = None
+
+# Controladores que puede elegir el dashboard: (controlador, medidas que recibe)
+CONTROLADORES = {
+    'pid': (banco, ['H1', 'H2']),
+    'mpc': (mpc, list(MPCController.MEDIDAS)),
+}
+
+# El lazo cerrado corre en su propio thread a periodo fijo (no en un callback de Dash)
+ejecutor_control = EjecutorControl(opc_client_instance, banco, medidas=['H1', 'H2'],
+                                   actuadores=['valvula1', 'valvula2'], periodo=1.0)
 
 def apply_params(kp, ki, kd, h1_ref, h2_ref, aw):
-    # Asigna parámetros y reinicia integradores/derivadas
-    pid_h1.Kp, pid_h1.Ki, pid_h1.Kd = kp, ki, kd
-    pid_h1.setpoint = h1_ref
-    pid_h1.anti_windup_gain = aw
-    pid_h1.reset()
-
-    pid_h2.Kp, pid_h2.Ki, pid_h2.Kd = kp, ki, kd
-    pid_h2.setpoint = h2_ref
-    pid_h2.anti_windup_gain = aw
-    pid_h2.reset()
\ No newline at end of file
+    # Asigna parámetros y reinicia integradores/derivadas (ambos lazos en un solo cambio atómico)
+    params = {'Kp': kp, 'Ki': ki, 'Kd': kd, 'anti_windup_gain': aw}
+    ejecutor_control.aplicar({0: dict(params, setpoint=h1_ref), 1: dict(params, setpoint=h2_ref)}, reiniciar=True)
+
+def usar_controlador(nombre):
+    # Cambia el controlador del ejecutor ('pid', 'mpc' o 'lqr') conservando las referencias
+    global lqr
+    if nombre == 'lqr' and lqr is None:
+        lqr = LQRController(TablaLQR(Ts=ejecutor_control.periodo, ruta_cache=RUTA_TABLA_LQR), output_limits=(0, 0.999))
+        CONTROLADORES['lqr'] = (lqr, list(LQRController.MEDIDAS))
+    controlador, medidas = CONTROLADORES[nombre]
+    ejecutor_control.usar(controlador, medidas)
+
+def controlador_activo():
+    # Nombre del controlador que está usando el ejecutor
+    return next(nombre for nombre, (controlador, _) in CONTROLADORES.items()
+                if controlador is ejecutor_control.controlador)
@@ -0,0 +1,130 @@
+# calculos/simulacionLazo.py
+import copy
+from bisect import bisect_right
+import numpy as np
+from utils.pid_controller import PIDBank
+from utils.QuadrupleTank import QuadrupleTankEnsemble, RelojVirtual
+
+'''
+Simulación del lazo cerrado fuera de línea: PIDs conectados directamente al modelo de los
+cuatro tanques, sin servidor OPC, sin el simulador en tiempo real y sin el dashboard.
+
+El tiempo lo lleva un RelojVirtual sin aceleración (tan rápido como se pueda) y las
+referencias y razones γ siguen programas por tramos [(t, (valor1, valor2)), ...]. Se simulan
+N ensayos a la vez sobre un QuadrupleTankEnsemble: con un PIDBank de 2N canales (h1 y h2 de
+cada ensayo) todos los controladores se calculan en una llamada por periodo de control.
+También acepta la pareja (pid_h1, pid_h2) de pidManager como un solo ensayo, o un controlador
+por realimentación de estado (con MEDIDAS, p. ej. MPCController o LQRController) que recibe
+los cuatro niveles y γ.
+
+    escenario = Escenario(duracion=600, referencias=[(0, (30, 30)), (300, (25, 32))])
+    r = simular(banco_desde_ganancias([[0.3, 0.01, 0, 0], [0.5, 0.02, 0, 0.1]]), escenario)
+    r['x'][:, 1, 0]  # h1 del segundo ensayo
+'''
+
+
+def _programa(tramos, t):
+    # Valor vigente en t de un programa por tramos constantes [(t0, valor0), (t1, valor1), ...]
+    tiempos = [tramo[0] for tramo in tramos]
+    return tramos[max(0, bisect_right(tiempos, t) - 1)][1]
+
+
+class Escenario():
+    def __init__(self, duracion=300.0, Ts=1.0, referencias=((0.0, (30.0, 30.0)),), gammas=((0.0, (0.7, 0.6)),),
+                 x0=(40, 40, 40, 40), Hmax=50, voltmax=10, integrador='rk4', paso_max=0.1, ruido=0.0, semilla=None):
+        # Ts: periodo de control (dt de los PID); paso_max: sub-paso de integración de la planta
+        # (con RK4, 0.1 s difiere en menos de 1e-5 cm de 0.01 s y es diez veces más rápido).
+        # referencias=None deja las referencias que ya tienen los controladores.
+        # ruido: desviación estándar (cm) del ruido gaussiano en las mediciones de h1 y h2
+        self.duracion = duracion
+        self.Ts = Ts
+        self.referencias = None if referencias is None else tuple((t, tuple(v)) for t, v in referencias)
+        self.gammas = tuple((t, tuple(v)) for t, v in gammas)
+        self.x0 = tuple(x0)
+        self.Hmax = Hmax
+        self.voltmax = voltmax
+        self.integrador = integrador
+        self.paso_max = paso_max
+        self.ruido = ruido
+        self.semilla = semilla
+
+    def clave(self):
+        # Identifica al escenario (p. ej. para cachear resultados de simulación)
+        return (self.duracion, self.Ts, self.referencias, self.gammas, self.x0, self.Hmax, self.voltmax,
+                self.integrador, self.paso_max, self.ruido, self.semilla)
+
+    def referencia(self, t):
+        return None if self.referencias is None else _programa(self.referencias, t)
+
+    def gamma(self, t):
+        return _programa(self.gammas, t)
+
+
+def banco_desde_ganancias(ganancias, output_limits=(0, 0.999), dt=1.0):
+    """
+    PIDBank de 2N canales para N ensayos. ganancias: (N, 4) con [Kp, Ki, Kd, anti_windup_gain]
+    iguales para ambos lazos, o (N, 2, 4) con las de h1 y h2 por separado.
+    """
+    ganancias = np.asarray(ganancias, dtype=float)
+    if ganancias.ndim == 2:
+        ganancias = np.repeat(ganancias[:, None, :], 2, axis=1)
+    g = ganancias.reshape(-1, 4)
+    return PIDBank(len(g), Kp=g[:, 0], Ki=g[:, 1], Kd=g[:, 2], dt=dt, anti_windup_gain=g[:, 3],
+                   output_limits=output_limits)
+
+
+def simular(controlador, escenario=None, modelo=None, copiar=True):
+    """
+    Simula el lazo cerrado y retorna las trayectorias como arreglos:
+        't' (K,), 'x' (K, N, 4) niveles, 'u' (K, N, 2) voltajes aplicados,
+        'referencia' (K, N, 2) y 'gamma' (K, 2), con K = duracion / Ts muestras.
+    controlador: PIDBank de 2N canales (h1, h2 de cada ensayo), pareja (pid_h1, pid_h2) o un
+    controlador de estado (con MEDIDAS: compute([H1, H2, H3, H4, γ1, γ2], dt) -> (u1, u2)).
+    modelo: QuadrupleTankEnsemble de N plantas (por defecto, N plantas nominales del escenario).
+    Con copiar=True se simula sobre una copia y el controlador entregado no se modifica.
+    """
+    escenario = escenario if escenario is not None else Escenario()
+    if copiar:
+        controlador = copy.deepcopy(controlador)
+    banco = controlador if isinstance(controlador, PIDBank) else None
+    N = len(banco) // 2 if banco is not None else 1
+    if modelo is None:
+        modelo = QuadrupleTankEnsemble(escenario.x0, escenario.Hmax, escenario.voltmax, N,
+                                       integrador=escenario.integrador, paso_max=escenario.paso_max)
+    rng = np.random.default_rng(escenario.semilla)
+
+    reloj = RelojVirtual(escenario.Ts, aceleracion=None)
+    K = int(round(escenario.duracion / escenario.Ts))
+    t = np.empty(K)
+    x = np.empty((K, N, 4))
+    u = np.empty((K, N, 2))
+    referencia = np.empty((K, N, 2))
+    gamma = np.empty((K, 2))
+    for k in range(K):
+        t[k] = reloj.ahora()
+        x[k] = modelo.x
+        gamma[k] = escenario.gamma(t[k])
+        medicion = modelo.x.copy()
+        if escenario.ruido:
+            medicion[:, :2] += rng.normal(0.0, escenario.ruido, (N, 2))
+
+        ref = escenario.referencia(t[k])
+        if banco is not None:
+            if ref is not None:
+                banco.setpoint[:] = np.tile(ref, N)
+            referencia[k] = banco.setpoint.reshape(N, 2)
+            u[k] = banco.compute(medicion[:, :2].ravel(), escenario.Ts).reshape(N, 2)
+        elif hasattr(controlador, 'MEDIDAS'):
+            if ref is not None:
+                controlador.setpoint[:] = ref
+            referencia[k, 0] = controlador.setpoint
+            u[k, 0] = controlador.compute(np.r_[medicion[0], gamma[k]], escenario.Ts)
+        else:
+            for i, pid in enumerate(controlador):
+                if ref is not None:
+                    pid.setpoint = ref[i]
+                referencia[k, 0, i] = pid.setpoint
+                u[k, 0, i] = pid.compute(float(medicion[0, i]), escenario.Ts)
+
+        modelo.paso(reloj.siguiente_paso(), volt=u[k], gamma=gamma[k])
+    return {'t': t, 'x': x, 'u': u, 'referencia': referencia, 'gamma': gamma}
@@ -0,0 +1,270 @@
+# calculos/sintonizacion.py
+import itertools
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from calculos.simulacionLazo import Escenario, simular, banco_desde_ganancias
+from calculos.metricasLazo import BANDA
+
+'''
+Sintonización automática de los PID de h1 y h2 sobre el lazo cerrado simulado (simulacionLazo).
+
+Cada candidato es un juego [Kp, Ki, Kd, anti_windup_gain] (el mismo para ambos lazos) o, con
+separados=True, uno para h1 y otro para h2. Los candidatos se reparten en lotes entre un pool de
+procesos y cada proceso simula su lote completo en una sola corrida vectorizada (un PIDBank y un
+QuadrupleTankEnsemble con un ensayo por candidato). Cada candidato se califica con IAE, ISE,
+sobrepaso, tiempo de establecimiento y esfuerzo del actuador; el costo es la suma ponderada
+según pesos. Las métricas se guardan en caché por (ganancias, escenario, banda), en memoria y
+opcionalmente en disco, así que repetir o refinar una búsqueda no vuelve a simular.
+
+Búsquedas: grilla, aleatoria y Nelder-Mead (varios inicios, uno por proceso). La tabla ordenada
+por costo se aplica a pid_h1/pid_h2 con aplicar(fila, ejecutor_control).
+
+    python -m calculos.sintonizacion --aleatoria 400   (desde PROCESOS/)
+'''
+
+PARAMETROS = ('Kp', 'Ki', 'Kd', 'anti_windup_gain')
+METRICAS = ('iae', 'ise', 'sobrepaso', 'establecimiento', 'esfuerzo')
+PESOS = {'iae': 1.0}
+
+
+def metricas(resultado, banda=BANDA):
+    """
+    Métricas por ensayo de una simulación (simular), sumando o tomando el peor de ambos lazos:
+        iae, ise: integral del error absoluto / cuadrático [cm·s, cm²·s]
+        sobrepaso: máximo sobrepaso en % del salto de referencia, sobre todos los tramos
+        establecimiento: peor tiempo [s] desde un cambio de referencia hasta quedar dentro de ±banda
+                         (inf si al terminar el tramo sigue fuera)
+        esfuerzo: integral de u² [V²·s]
+    Retorna {nombre: arreglo (N,)}.
+    """
+    t = resultado['t']
+    dt = t[1] - t[0] if len(t) > 1 else 1.0
+    h = resultado['x'][:, :, :2]
+    ref = resultado['referencia']
+    error = ref - h
+    salida = {'iae': np.abs(error).sum(axis=(0, 2)) * dt,
+              'ise': (error**2).sum(axis=(0, 2)) * dt,
+              'esfuerzo': (resultado['u']**2).sum(axis=(0, 2)) * dt}
+
+    N, K = h.shape[1], len(t)
+    cambios = [k for k in range(1, K) if np.any(ref[k] != ref[k - 1])]
+    sobrepaso = np.zeros(N)
+    establecimiento = np.zeros(N)
+    for a, b in zip([0] + cambios, cambios + [K]):
+        objetivo = ref[a]
+        salto = objetivo - h[a]
+        amplitud = np.abs(salto)
+        exceso = np.max((h[a:b] - objetivo) * np.sign(salto), axis=0)
+        relativo = np.where(amplitud > banda, 100.0 * np.maximum(exceso, 0) / np.maximum(amplitud, banda), 0.0)
+        sobrepaso = np.maximum(sobrepaso, relativo.max(axis=1))
+
+        fuera = np.any(np.abs(h[a:b] - objetivo) > banda, axis=2)  # (b - a, N)
+        ultimo = (b - a - 1) - np.argmax(fuera[::-1], axis=0)
+        tramo = np.where(fuera.any(axis=0), (ultimo + 1) * dt, 0.0)
+        tramo = np.where(fuera[-1], np.inf, tramo)
+        establecimiento = np.maximum(establecimiento, tramo)
+    salida['sobrepaso'] = sobrepaso
+    salida['establecimiento'] = establecimiento
+    return salida
+
+
+def costo(fila, pesos=None):
+    pesos = PESOS if pesos is None else pesos
+    total = 0.0
+    for nombre, peso in pesos.items():
+        if peso:
+            total += peso * fila[nombre]
+    return total
+
+
+def _ganancias(candidatos, separados):
+    ganancias = np.asarray(candidatos, dtype=float)
+    return ganancias.reshape(len(candidatos), 2, 4) if separados else ganancias
+
+
+# Se ejecutan en los procesos del pool: un lote de candidatos en una sola simulación vectorizada
+def _evaluar_lote(candidatos, escenario, banda, separados):
+    resultado = metricas(simular(banco_desde_ganancias(_ganancias(candidatos, separados)), escenario, copiar=False), banda)
+    return [{nombre: float(resultado[nombre][i]) for nombre in METRICAS} for i in range(len(candidatos))]
+
+
+def _nelder_mead(inicio, escenario, banda, separados, pesos, limites, max_evaluaciones, conocidos):
+    # conocidos: {candidato: métricas} ya en caché; retorna los puntos visitados con sus métricas
+    from scipy.optimize import minimize
+    inferior, superior = np.asarray(limites, dtype=float).T
+    evaluados = dict(conocidos)
+    visitados = {}
+
+    def objetivo(v):
+        candidato = tuple(round(float(x), 10) for x in np.clip(v, inferior, superior))
+        if candidato not in evaluados:
+            evaluados[candidato] = _evaluar_lote([candidato], escenario, banda, separados)[0]
+        visitados[candidato] = evaluados[candidato]
+        valor = costo(evaluados[candidato], pesos)
+        return valor if np.isfinite(valor) else 1e12
+
+    # Simplex inicial con aristas del 10 % de cada rango (no del 5 % del valor, que con Ki=0 es casi nulo)
+    x0 = np.clip(np.asarray(inicio, dtype=float), inferior, superior)
+    simplex = [x0] + [x0 + np.eye(len(x0))[i] * 0.1 * (superior[i] - inferior[i]) for i in range(len(x0))]
+    minimize(objetivo, x0, method='Nelder-Mead',
+             options={'initial_simplex': np.array(simplex), 'maxfev': max_evaluaciones, 'xatol': 1e-4, 'fatol': 1e-3})
+    return visitados
+
+
+class Sintonizador():
+    def __init__(self, escenario=None, pesos=None, banda=BANDA, separados=False, n_procesos=None,
+                 tam_lote=64, ruta_cache=None):
+        self.escenario = escenario if escenario is not None else Escenario()
+        self.pesos = dict(PESOS if pesos is None else pesos)
+        self.banda = banda
+        self.separados = separados
+        self.n_procesos = n_procesos or os.cpu_count() or 1
+        self.tam_lote = tam_lote
+        self.ruta_cache = ruta_cache
+        self.cache = {}
+        if ruta_cache is not None and os.path.exists(ruta_cache):
+            with open(ruta_cache, 'rb') as f:
+                self.cache = pickle.load(f)
+        self.stats = {'evaluados': 0, 'desde_cache': 0}
+
+    @property
+    def nombres(self):
+        if not self.separados:
+            return list(PARAMETROS)
+        return ['h1_' + p for p in PARAMETROS] + ['h2_' + p for p in PARAMETROS]
+
+    def _clave(self, candidato):
+        return (candidato, self.escenario.clave(), self.banda)
+
+    def _normalizar(self, candidato):
+        candidato = tuple(round(float(v), 10) for v in candidato)
+        if len(candidato) != len(self.nombres):
+            raise ValueError('Se esperaban {} parámetros: {}'.format(len(self.nombres), self.nombres))
+        return candidato
+
+    def _guardar_cache(self):
+        if self.ruta_cache is not None:
+            with open(self.ruta_cache, 'wb') as f:
+                pickle.dump(self.cache, f)
+
+    def _fila(self, candidato):
+        fila = dict(zip(self.nombres, candidato))
+        fila.update(self.cache[self._clave(candidato)])
+        fila['costo'] = costo(fila, self.pesos)
+        return fila
+
+    def evaluar(self, candidatos):
+        """Califica los candidatos (simulando solo los que no están en caché) y retorna la tabla ordenada."""
+        candidatos = list(dict.fromkeys(self._normalizar(c) for c in candidatos))
+        faltantes = [c for c in candidatos if self._clave(c) not in self.cache]
+        self.stats['desde_cache'] += len(candidatos) - len(faltantes)
+        if faltantes:
+            # Lotes de a lo más tam_lote, al menos uno por proceso
+            n = min(self.tam_lote, max(1, -(-len(faltantes) // self.n_procesos)))
+            lotes = [faltantes[i:i + n] for i in range(0, len(faltantes), n)]
+            if self.n_procesos == 1 or len(lotes) == 1:
+                resultados = [_evaluar_lote(lote, self.escenario, self.banda, self.separados) for lote in lotes]
+            else:
+                with ProcessPoolExecutor(min(self.n_procesos, len(lotes))) as pool:
+                    resultados = list(pool.map(_evaluar_lote, lotes, itertools.repeat(self.escenario),
+                                               itertools.repeat(self.banda), itertools.repeat(self.separados)))
+            for lote, filas in zip(lotes, resultados):
+                for candidato, fila in zip(lote, filas):
+                    self.cache[self._clave(candidato)] = fila
+            self.stats['evaluados'] += len(faltantes)
+            self._guardar_cache()
+        return self.tabla([self._fila(c) for c in candidatos])
+
+    def grilla(self, **valores):
+        """Producto cartesiano: grilla(Kp=[0.1, 0.3], Ki=[0, 0.01], ...); los omitidos valen 0."""
+        ejes = [list(valores.get(nombre, [0.0])) for nombre in self.nombres]
+        return self.evaluar(itertools.product(*ejes))
+
+    def aleatoria(self, limites, n, semilla=None):
+        """n candidatos uniformes en limites: {'Kp': (0, 1), 'Ki': (0, 0.05), ...}; los omitidos valen 0."""
+        rng = np.random.default_rng(semilla)
+        inferior, superior = np.array([limites.get(nombre, (0.0, 0.0)) for nombre in self.nombres], dtype=float).T
+        return self.evaluar(rng.uniform(inferior, superior, (n, len(self.nombres))))
+
+    def nelder_mead(self, inicios, limites, max_evaluaciones=100):
+        """
+        Nelder-Mead desde cada inicio (un proceso por inicio), acotado a limites. Todos los puntos
+        visitados quedan en caché; retorna la tabla ordenada de esos puntos.
+        """
+        rangos = [limites.get(nombre, (0.0, 0.0)) for nombre in self.nombres]
+        inicios = [self._normalizar(inicio) for inicio in inicios]
+        conocidos = {clave[0]: fila for clave, fila in self.cache.items()
+                     if clave[1:] == (self.escenario.clave(), self.banda)}
+        argumentos = (self.escenario, self.banda, self.separados, self.pesos, rangos, max_evaluaciones, conocidos)
+        if self.n_procesos == 1 or len(inicios) == 1:
+            visitados = [_nelder_mead(inicio, *argumentos) for inicio in inicios]
+        else:
+            with ProcessPoolExecutor(min(self.n_procesos, len(inicios))) as pool:
+                visitados = list(pool.map(_nelder_mead, inicios, *[itertools.repeat(a) for a in argumentos]))
+        candidatos = []
+        for evaluados in visitados:
+            for candidato, fila in evaluados.items():
+                if self._clave(candidato) in self.cache:
+                    self.stats['desde_cache'] += 1
+                else:
+                    self.cache[self._clave(candidato)] = fila
+                    self.stats['evaluados'] += 1
+                candidatos.append(candidato)
+        self._guardar_cache()
+        return self.tabla([self._fila(c) for c in dict.fromkeys(candidatos)])
+
+    def tabla(self, filas=None, n=None):
+        # Sin filas: todo lo que hay en caché para este escenario y banda
+        if filas is None:
+            filas = [self._fila(clave[0]) for clave in self.cache
+                     if clave[1:] == (self.escenario.clave(), self.banda) and len(clave[0]) == len(self.nombres)]
+        filas = sorted(filas, key=lambda fila: fila['costo'])
+        return filas if n is None else filas[:n]
+
+    def parametros(self, fila):
+        """Fila de la tabla -> {canal: {'Kp': ..., ...}} para EjecutorControl.aplicar."""
+        if not self.separados:
+            params = {nombre: fila[nombre] for nombre in PARAMETROS}
+            return {0: dict(params), 1: dict(params)}
+        return {i: {nombre: fila['h{}_{}'.format(i + 1, nombre)] for nombre in PARAMETROS} for i in range(2)}
+
+    def aplicar(self, fila, ejecutor):
+        # Las ganancias de ambos lazos cambian juntas entre dos pasos de control
+        ejecutor.aplicar(self.parametros(fila))
+
+
+def imprimir(tabla, n=10):
+    if not tabla:
+        return
+    columnas = [c for c in tabla[0] if c not in METRICAS and c != 'costo'] + ['costo'] + list(METRICAS)
+    print(' '.join('{:>16}'.format(c) for c in columnas))
+    for fila in tabla[:n]:
+        print(' '.join('{:>16.5g}'.format(fila[c]) for c in columnas))
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description='Sintonización de los PID de h1 y h2 sobre el lazo simulado')
+    parser.add_argument('--aleatoria', type=int, default=200, help='Candidatos de la búsqueda aleatoria')
+    parser.add_argument('--nelder-mead', type=int, default=4, help='Inicios de Nelder-Mead desde los mejores aleatorios')
+    parser.add_argument('--duracion', type=float, default=600.0)
+    parser.add_argument('--procesos', type=int, default=None)
+    parser.add_argument('--cache', default=None, help='Archivo de caché de simulaciones')
+    args = parser.parse_args()
+
+    escenario = Escenario(duracion=args.duracion, referencias=[(0, (30, 30)), (args.duracion / 2, (25, 32))])
+    limites = {'Kp': (0.0, 1.0), 'Ki': (0.0, 0.05), 'Kd': (0.0, 1.0), 'anti_windup_gain': (0.0, 1.0)}
+    sintonizador = Sintonizador(escenario, n_procesos=args.procesos, ruta_cache=args.cache)
+    t = time.time()
+    tabla = sintonizador.aleatoria(limites, args.aleatoria, semilla=0)
+    print('Aleatoria: {} candidatos en {:.1f} s'.format(args.aleatoria, time.time() - t))
+    if args.nelder_mead:
+        t = time.time()
+        inicios = [[fila[nombre] for nombre in sintonizador.nombres] for fila in tabla[:args.nelder_mead]]
+        sintonizador.nelder_mead(inicios, limites)
+        print('Nelder-Mead: {} inicios en {:.1f} s'.format(len(inicios), time.time() - t))
+    imprimir(sintonizador.tabla())
+    print(sintonizador.stats)
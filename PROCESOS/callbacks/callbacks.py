@@ -1,13 +1,14 @@
 from dash import Input, Output, State, no_update, html, dcc
-import plotly.graph_objects as go
 from collections import deque
 import time
 import io
-import numpy as np
-import pandas as pd
+# plotly.graph_objects, numpy y pandas se importan al usarse (figuras y exportación) para no
+# cargarlos en el arranque
 
 from utils.opc_client import opc_client_instance
-from calculos.pidManager import pid_h1, pid_h2, apply_params  # apply_params queda por compatibilidad
+import calculos.pidManager as pidManager
+from calculos.pidManager import pid_h1, pid_h2, mpc, ejecutor_control, usar_controlador, controlador_activo, apply_params  # apply_params queda por compatibilidad
+from calculos.metricasLazo import BANDA
 
 def register_callbacks(app):
     # -----------------------------
@@ -33,7 +34,64 @@ def register_callbacks(app):
             historial['t0'] = t
         return t - historial['t0']
 
+    # -----------------------------
+    # Relleno de buffers desde el historial del servidor (HistoryRead)
+    # -----------------------------
+    periodo_muestreo = 1.0  # s, igual al intervalo 'interval-update'
+    claves_historial = {'h1': 'H1', 'h2': 'H2', 'h3': 'H3', 'h4': 'H4',
+                        'v1': 'valvula1', 'v2': 'valvula2', 'g1': 'razon1', 'g2': 'razon2'}
+    estado_buffer = {'generacion': 0, 'ventana': buffer_size * periodo_muestreo}
+
+    def _rellenar_desde_historial(ventana):
+        """
+        Reconstruye los buffers con los últimos `ventana` s del historial del servidor,
+        remuestreados a `periodo_muestreo` (se mantiene el último valor de cada variable).
+        Así las figuras no parten vacías al arrancar, tras una reconexión o al ampliar la ventana.
+        """
+        from bisect import bisect_right
+        fin = time.time()
+        inicio = fin - ventana
+        series = opc_client_instance.leer_historial(list(claves_historial.values()), inicio, fin)
+        n = max(1, int(ventana / periodo_muestreo))
+        grilla = [fin - (n - 1 - i) * periodo_muestreo for i in range(n)]
+
+        nuevos = {k: deque(maxlen=n) for k in ('t',) + tuple(claves_historial)}
+        tiempos = {k: [t for t, _ in series[clave]] for k, clave in claves_historial.items()}
+        for t in grilla:
+            fila = {}
+            for k, clave in claves_historial.items():
+                i = bisect_right(tiempos[k], t)
+                fila[k] = series[clave][i - 1][1] if i else None
+            if None in (fila['h1'], fila['h2'], fila['h3'], fila['h4'], fila['v1'], fila['v2']):
+                continue  # sin datos aún en ese instante
+            nuevos['t'].append(t - inicio)
+            for k, valor in fila.items():
+                if valor is not None:
+                    nuevos[k].append(valor)
+
+        historial['t0'] = inicio
+        historial.update(nuevos)
+        estado_buffer['ventana'] = ventana
+        return len(nuevos['t'])
+
+    def _redimensionar_buffers(ventana):
+        n = max(1, int(ventana / periodo_muestreo))
+        for k in ('t',) + tuple(claves_historial):
+            historial[k] = deque(historial[k], maxlen=n)
+        estado_buffer['ventana'] = ventana
+
+    # Al arrancar y tras cada reconexión (nueva generación de conexión) se rellena el hueco
+    def _verificar_relleno():
+        generacion = opc_client_instance.generacion_conexion
+        if generacion and generacion != estado_buffer['generacion']:
+            estado_buffer['generacion'] = generacion
+            try:
+                _rellenar_desde_historial(estado_buffer['ventana'])
+            except Exception as e:
+                print(f"⚠️ No se pudo rellenar desde el historial: {e}")
+
     def build_fig(x, y, title, yref=None, band=None):
+        import plotly.graph_objects as go
         fig = go.Figure()
         fig.add_scatter(x=list(x), y=list(y), mode='lines', name=title)
 
@@ -62,6 +120,7 @@ def register_callbacks(app):
         return fig
 
     def build_dual_u(x, y1, y2):
+        import plotly.graph_objects as go
         fig = go.Figure()
         fig.add_scatter(x=list(x), y=list(y1), mode='lines', name='u1 (V)')
         fig.add_scatter(x=list(x), y=list(y2), mode='lines', name='u2 (V)')
@@ -70,49 +129,6 @@ def register_callbacks(app):
                           margin=dict(l=20, r=20, t=40, b=20), height=300)
         return fig
 
-    # -----------------------------
-    # Helpers PID
-    # -----------------------------
-    def _apply_one_pid(pid, kp=None, ki=None, kd=None, aw=None, sp=None):
-        """
-        Aplica parámetros a un objeto PID con la mejor compatibilidad posible.
-        Prioriza métodos; si no existen, asigna atributos.
-        """
-        for meth in ('update_params', 'set_params', 'set_gains'):
-            if hasattr(pid, meth):
-                try:
-                    getattr(pid, meth)(
-                        kp if kp is not None else pid.Kp,
-                        ki if ki is not None else pid.Ki,
-                        kd if kd is not None else pid.Kd,
-                        aw if aw is not None else getattr(pid, 'anti_windup_gain', None)
-                    )
-                    break
-                except TypeError:
-                    getattr(pid, meth)(
-                        kp if kp is not None else pid.Kp,
-                        ki if ki is not None else pid.Ki,
-                        kd if kd is not None else pid.Kd
-                    )
-                    break
-                except Exception:
-                    pass
-
-        if kp is not None and hasattr(pid, 'Kp'): pid.Kp = kp
-        if ki is not None and hasattr(pid, 'Ki'): pid.Ki = ki
-        if kd is not None and hasattr(pid, 'Kd'): pid.Kd = kd
-        if aw is not None:
-            if hasattr(pid, 'anti_windup_gain'):
-                pid.anti_windup_gain = aw
-            elif hasattr(pid, 'aw'):
-                pid.aw = aw
-
-        if sp is not None:
-            if hasattr(pid, 'setpoint'):
-                pid.setpoint = sp
-            elif hasattr(pid, 'r'):
-                pid.r = sp
-
     # -----------------------------
     # Visualización en tiempo real (MODO MANUAL)
     # -----------------------------
@@ -126,21 +142,14 @@ def register_callbacks(app):
     )
     def update_niveles(_n):
         try:
+            _verificar_relleno()
             t_rel = _rel_time()
 
-            h1 = opc_client_instance.read_tank_level(1)
-            h2 = opc_client_instance.read_tank_level(2)
-            h3 = opc_client_instance.read_tank_level(3)
-            h4 = opc_client_instance.read_tank_level(4)
-
-            v1 = opc_client_instance.read_valve_voltage(1)
-            v2 = opc_client_instance.read_valve_voltage(2)
-
-            try:
-                g1 = opc_client_instance.read_flow_ratio(1)
-                g2 = opc_client_instance.read_flow_ratio(2)
-            except Exception:
-                g1 = g2 = None
+            # Una sola lectura (un RTT) para todas las variables del intervalo
+            valores = opc_client_instance.read_snapshot()['valores']
+            h1, h2, h3, h4 = valores['H1'], valores['H2'], valores['H3'], valores['H4']
+            v1, v2 = valores['valvula1'], valores['valvula2']
+            g1, g2 = valores['razon1'], valores['razon2']
 
             if None in (h1, h2, h3, h4, v1, v2):
                 raise ValueError("Datos no disponibles")
@@ -166,6 +175,7 @@ def register_callbacks(app):
         except Exception as e:
             mensaje_error = f"Error: {e}"
             def error_fig(title):
+                import plotly.graph_objects as go
                 return go.Figure().update_layout(
                     title=title,
                     xaxis_title='Tiempo [s]',
@@ -184,6 +194,24 @@ def register_callbacks(app):
                 error_fig('Voltajes aplicados'),
             )
 
+    @app.callback(
+        Output('mensaje-ventana', 'children'),
+        Input('ventana-historial', 'value'),
+        prevent_initial_call=True
+    )
+    def cambiar_ventana(ventana):
+        if not ventana or ventana < periodo_muestreo:
+            return no_update
+        try:
+            if ventana > estado_buffer['ventana']:
+                n = _rellenar_desde_historial(float(ventana))
+                return f"Ventana ampliada a {ventana:g} s ({n} muestras desde el historial)"
+            _redimensionar_buffers(float(ventana))
+            return f"Ventana de {ventana:g} s"
+        except Exception as e:
+            _redimensionar_buffers(float(ventana))
+            return f"⚠️ Ventana de {ventana:g} s sin relleno del historial: {e}"
+
     # -----------------------------
     # MODO MANUAL: escribir u y γ
     # -----------------------------
@@ -199,18 +227,26 @@ def register_callbacks(app):
     def aplicar_modo_manual(_n_clicks, v1, v2, gamma1, gamma2):
         mensajes = []
         try:
+            valores = {}
             if v1 is not None:
-                opc_client_instance.escribir("valvula1", float(v1))
+                valores["valvula1"] = float(v1)
                 mensajes.append("✅ Válvula 1 escrita")
             if v2 is not None:
-                opc_client_instance.escribir("valvula2", float(v2))
+                valores["valvula2"] = float(v2)
                 mensajes.append("✅ Válvula 2 escrita")
             if gamma1 is not None:
-                opc_client_instance.escribir("razon1", float(gamma1))
+                valores["razon1"] = float(gamma1)
                 mensajes.append("✅ Razón γ1 escrita")
             if gamma2 is not None:
-                opc_client_instance.escribir("razon2", float(gamma2))
+                valores["razon2"] = float(gamma2)
                 mensajes.append("✅ Razón γ2 escrita")
+            # Escribir una válvula a mano toma el control: se detiene el lazo automático
+            if 'valvula1' in valores or 'valvula2' in valores:
+                if ejecutor_control.activo():
+                    ejecutor_control.detener()
+                    mensajes.append("⏸️ Control automático detenido")
+            if valores:
+                opc_client_instance.escribir_varios(valores)
 
             if not mensajes:
                 return "⚠️ No se ingresó ningún valor."
@@ -238,28 +274,65 @@ def register_callbacks(app):
         Input('intervalo-automatico', 'n_intervals'),
         State('modo-switch', 'value')
     )
-    def ejecutar_PID_en_lazo_cerrado(_n, switch_value):
+    def observar_lazo_cerrado(_n, switch_value):
+        # El PID corre en ejecutor_control (thread propio); aquí solo se muestra su estado
         try:
-            h1 = opc_client_instance.read_tank_level(1)
-            h2 = opc_client_instance.read_tank_level(2)
-            if h1 is None or h2 is None:
-                return "⚠️ No se pudo leer el nivel de los tanques."
-
-            v1 = pid_h1.compute(h1)
-            v2 = pid_h2.compute(h2)
-
-            opc_client_instance.escribir("valvula1", float(v1))
-            opc_client_instance.escribir("valvula2", float(v2))
-
+            stats = ejecutor_control.estadisticas()
+            if not stats['activo']:
+                return "⏸️ Control automático detenido: presiona 'Aplicar PID' para iniciarlo."
+            ultimo = ejecutor_control.ultimo
+            if ultimo is None:
+                return "⚠️ Control automático iniciado, sin mediciones de los tanques todavía."
+            v1, v2 = ultimo['salidas']['valvula1'], ultimo['salidas']['valvula2']
+            nombre = controlador_activo().upper()
+            texto = (f"✅ {nombre} ejecutado: V1={v1:.2f}, V2={v2:.2f} | dt={ultimo['dt']:.3f} s | "
+                     f"jitter medio/máx={1e3*stats['jitter_medio']:.1f}/{1e3*stats['jitter_max']:.1f} ms | "
+                     f"cálculo máx={1e3*stats['calculo_max']:.1f} ms | atrasos={stats['atrasos']} | "
+                     f"omitidos={stats['omitidos']} | errores={stats['errores']}")
+            if nombre == 'MPC':
+                texto += (f" | QP máx={1e3*mpc.stats['tiempo_max']:.1f} ms "
+                          f"(presupuesto {1e3*mpc.presupuesto:.0f} ms, excedido {mpc.stats['sobre_presupuesto']})")
+            elif nombre == 'LQR':
+                lqr = pidManager.lqr
+                texto += (f" | interpolación de K máx={1e6*lqr.stats['interpolacion_max']:.0f} µs | "
+                          f"saturado={lqr.stats['saturado']} | sin ganancia={lqr.stats['sin_ganancia']}")
             if switch_value:
-                return (f"✅ PID ejecutado: V1={v1:.2f}, V2={v2:.2f} | "
-                        "Sugerencia: para FASE NO MÍNIMA ajusta γ en Modo Manual a γ1+γ2<1.")
-            else:
-                return f"✅ PID ejecutado: V1={v1:.2f}, V2={v2:.2f}"
+                texto += " | Sugerencia: para FASE NO MÍNIMA ajusta γ en Modo Manual a γ1+γ2<1."
+            return texto
 
         except Exception as e:
             return f"❌ Error en lazo cerrado PID: {e}"
 
+    # -----------------------------
+    # MODO AUTOMÁTICO: métricas de desempeño de cada lazo (calculadas en el ejecutor)
+    # -----------------------------
+    @app.callback(
+        Output('auto-metricas', 'children'),
+        Input('intervalo-automatico', 'n_intervals')
+    )
+    def mostrar_metricas(_n):
+        def fmt(valor, formato='{:.3g}'):
+            return '—' if valor is None else formato.format(valor)
+        try:
+            lazos = ejecutor_control.metricas_lazos()
+            if all(lazo['tramo'] is None for lazo in lazos.values()):
+                return html.Small("Métricas de los lazos: sin datos (control automático detenido).", style={'color': 'gray'})
+            columnas = [('Referencia [cm]', 'setpoint', '{:.2f}'), ('Tramo [s]', 'duracion', '{:.0f}'),
+                        ('IAE', 'iae', '{:.3g}'), ('ISE', 'ise', '{:.3g}'), ('ITAE', 'itae', '{:.3g}'),
+                        ('Sobrepaso [%]', 'sobrepaso', '{:.1f}'), ('Subida [s]', 'tiempo_subida', '{:.0f}'),
+                        (f'Establecimiento ±{BANDA:g} [s]', 'establecimiento', '{:.0f}'),
+                        ('Error estacionario', 'error_estacionario', '{:.3g}'),
+                        ('Esfuerzo ∫u²dt', 'esfuerzo', '{:.3g}')]
+            encabezado = html.Tr([html.Th('Lazo')] + [html.Th(nombre) for nombre, _, _ in columnas])
+            filas = []
+            for medida, lazo in lazos.items():
+                tramo = lazo['tramo'] or {}
+                filas.append(html.Tr([html.Td(medida.lower())] +
+                                     [html.Td(fmt(tramo.get(clave), formato)) for _, clave, formato in columnas]))
+            return html.Table([html.Thead(encabezado), html.Tbody(filas)], className='table table-sm')
+        except Exception as e:
+            return html.Small(f"❌ Error en métricas de los lazos: {e}", style={'color': 'red'})
+
     # -----------------------------
     # MODO AUTOMÁTICO: figuras con referencia
     # -----------------------------
@@ -280,13 +353,15 @@ def register_callbacks(app):
             historial['h1'].append(h1)
             historial['h2'].append(h2)
 
-            delta = 0.01  # banda ±0.01
-            f1 = build_fig(historial['t'], historial['h1'], 'h1 (cm)', yref=getattr(pid_h1, 'setpoint', None), band=delta)
-            f2 = build_fig(historial['t'], historial['h2'], 'h2 (cm)', yref=getattr(pid_h2, 'setpoint', None), band=delta)
+            delta = BANDA  # banda ±0.01, la misma de las métricas de los lazos
+            setpoint = ejecutor_control.controlador.setpoint  # del controlador activo (PID o MPC)
+            f1 = build_fig(historial['t'], historial['h1'], 'h1 (cm)', yref=float(setpoint[0]), band=delta)
+            f2 = build_fig(historial['t'], historial['h2'], 'h2 (cm)', yref=float(setpoint[1]), band=delta)
             return f1, f2
         except Exception as e:
             msg = f"Error: {e}"
             def err(title):
+                import plotly.graph_objects as go
                 return go.Figure().update_layout(
                     title=title,
                     annotations=[{'text': msg, 'xref':'paper','yref':'paper',
@@ -322,29 +397,48 @@ def register_callbacks(app):
         if not n_clicks:
             return "⚠️ No se aplicaron cambios."
         try:
-            _apply_one_pid(
-                pid_h1,
-                kp=kp1 if kp1 is not None else getattr(pid_h1, 'Kp', None),
-                ki=ki1 if ki1 is not None else getattr(pid_h1, 'Ki', None),
-                kd=kd1 if kd1 is not None else getattr(pid_h1, 'Kd', None),
-                aw=aw1 if aw1 is not None else getattr(pid_h1, 'anti_windup_gain', getattr(pid_h1, 'aw', None)),
-                sp=h1ref if h1ref is not None else getattr(pid_h1, 'setpoint', None)
-            )
-            _apply_one_pid(
-                pid_h2,
-                kp=kp2 if kp2 is not None else getattr(pid_h2, 'Kp', None),
-                ki=ki2 if ki2 is not None else getattr(pid_h2, 'Ki', None),
-                kd=kd2 if kd2 is not None else getattr(pid_h2, 'Kd', None),
-                aw=aw2 if aw2 is not None else getattr(pid_h2, 'anti_windup_gain', getattr(pid_h2, 'aw', None)),
-                sp=h2ref if h2ref is not None else getattr(pid_h2, 'setpoint', None)
-            )
+            # Ambos lazos cambian juntos entre dos pasos del ejecutor; sin valor se conserva el actual
+            ejecutor_control.aplicar({
+                0: {'Kp': kp1, 'Ki': ki1, 'Kd': kd1, 'anti_windup_gain': aw1, 'setpoint': h1ref},
+                1: {'Kp': kp2, 'Ki': ki2, 'Kd': kd2, 'anti_windup_gain': aw2, 'setpoint': h2ref},
+            })
+            ejecutor_control.iniciar()
+            nombre = controlador_activo()
+            if nombre != 'pid':
+                setpoint = ejecutor_control.controlador.setpoint
+                return (f"✅ Referencias del {nombre.upper()}: h1={setpoint[0]:.4g} cm, h2={setpoint[1]:.4g} cm, control "
+                        f"automático cada {ejecutor_control.periodo:g} s (las ganancias PID no se usan con {nombre.upper()}).")
 
             msg_h1 = f"h1: Kp={getattr(pid_h1,'Kp',None):.4g}, Ki={getattr(pid_h1,'Ki',None):.4g}, Kd={getattr(pid_h1,'Kd',None):.4g}, AW={getattr(pid_h1,'anti_windup_gain', getattr(pid_h1,'aw', None))}, ref={getattr(pid_h1,'setpoint',None)}"
             msg_h2 = f"h2: Kp={getattr(pid_h2,'Kp',None):.4g}, Ki={getattr(pid_h2,'Ki',None):.4g}, Kd={getattr(pid_h2,'Kd',None):.4g}, AW={getattr(pid_h2,'anti_windup_gain', getattr(pid_h2,'aw', None))}, ref={getattr(pid_h2,'setpoint',None)}"
-            return f"✅ PID actualizados.\n{msg_h1}\n{msg_h2}"
+            return f"✅ PID actualizados, control automático cada {ejecutor_control.periodo:g} s.\n{msg_h1}\n{msg_h2}"
         except Exception as e:
             return f"❌ Error al actualizar PID: {e}"
 
+    # -----------------------------
+    # Controlador del modo automático (PID, MPC o LQR)
+    # -----------------------------
+    @app.callback(
+        Output('auto-controlador-msg', 'children'),
+        Input('auto-controlador', 'value'),
+        prevent_initial_call=True
+    )
+    def elegir_controlador(nombre):
+        try:
+            # El cambio ocurre entre dos pasos del ejecutor y conserva las referencias
+            usar_controlador(nombre)
+            if nombre == 'mpc':
+                return (f"MPC activo: horizonte {mpc.Np} pasos (control {mpc.Nc}), "
+                        f"u en [{mpc.u_min[0]:g}, {mpc.u_max[0]:g}].")
+            if nombre == 'lqr':
+                tabla = pidManager.lqr.tabla
+                origen = 'leída de disco' if tabla.stats['desde_cache'] else f"calculada en {tabla.stats['tiempo_calculo']:.1f} s"
+                return (f"LQR activo: tabla de {tabla.stats['puntos']} puntos (h1, h2, γ1, γ2) {origen}, "
+                        f"{tabla.stats['sin_solucion']} sin solución (γ1+γ2=1).")
+            return "PID activo."
+        except Exception as e:
+            return f"❌ Error al cambiar de controlador: {e}"
+
     # -----------------------------
     # Alarmas
     # -----------------------------
@@ -354,8 +448,14 @@ def register_callbacks(app):
     )
     def actualizar_estado_conexion(_n):
         try:
-            ok = opc_client_instance.is_connected() if hasattr(opc_client_instance, "is_connected") else True
-            return f"Estado OPC UA: {'Conectado' if ok else 'Desconectado'}"
+            salud = opc_client_instance.estado_conexion()
+            if salud['conectado']:
+                extra = ""
+                if salud['reconexiones']:
+                    extra = f" (reconexiones: {salud['reconexiones']}, última en {salud['ultima_latencia_reconexion']:.1f} s)"
+                return f"Estado OPC UA: Conectado{extra}"
+            desde = salud.get('tiempo_desconectado')
+            return "Estado OPC UA: Desconectado" + (f" hace {desde:.0f} s, reintentando…" if desde is not None else "")
         except Exception:
             return "Estado OPC UA: Desconectado"
 
@@ -440,8 +540,7 @@ def register_callbacks(app):
 
         # Referencias actuales (constantes por fila)
         if 'refs' in selected_blocks:
-            r1 = getattr(pid_h1, 'setpoint', None)
-            r2 = getattr(pid_h2, 'setpoint', None)
+            r1, r2 = (float(sp) for sp in ejecutor_control.controlador.setpoint)
             data['h1_ref_cm'] = [r1] * N
             data['h2_ref_cm'] = [r2] * N
 
@@ -479,6 +578,22 @@ def register_callbacks(app):
                 data['gamma1'] = [g1_now] * N
                 data['gamma2'] = [g2_now] * N
 
+        # Métricas de los lazos (constantes por fila): tramo actual y resumen de la ventana exportada
+        if 'metricas' in selected_blocks:
+            desde = hasta = None
+            if N > 0 and historial['t0'] is not None:
+                desde, hasta = historial['t0'] + data['t_s'][0], historial['t0'] + data['t_s'][-1]
+            for medida, lazo in ejecutor_control.metricas_lazos(desde, hasta).items():
+                prefijo = medida.lower()
+                tramo = lazo['tramo'] or {}
+                for clave in ('iae', 'ise', 'itae', 'sobrepaso', 'tiempo_subida', 'establecimiento',
+                              'error_estacionario', 'esfuerzo'):
+                    data[f'{prefijo}_{clave}'] = [tramo.get(clave)] * N
+                ventana = lazo['ventana'] or {}
+                for clave in ('iae', 'ise', 'esfuerzo'):
+                    data[f'{prefijo}_{clave}_ventana'] = [ventana.get(clave)] * N
+
+        import pandas as pd
         df = pd.DataFrame(data)
         return df
 
@@ -525,6 +640,7 @@ def register_callbacks(app):
 
             elif fmt == 'npy':
                 # NPY con dict {col: ndarray}
+                import numpy as np
                 buf = io.BytesIO()
                 np.save(buf, {c: df[c].to_numpy() for c in df.columns}, allow_pickle=True)
                 raw = buf.getvalue()
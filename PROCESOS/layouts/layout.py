@@ -36,6 +36,11 @@ def create_layout():
 
                 html.Hr(),
                 html.H4("Niveles (gráficos separados)"),
+                dbc.Row([
+                    dbc.Col(dbc.Label("Ventana de tiempo (s)"), width="auto"),
+                    dbc.Col(dbc.Input(id='ventana-historial', type='number', min=10, step=10, value=100, debounce=True), width=2),
+                    dbc.Col(html.Small(id='mensaje-ventana', style={'color': 'gray'}), width="auto"),
+                ], className="g-2", align="center"),
                 dcc.Graph(id='nivel-manual-1'),
                 dcc.Graph(id='nivel-manual-2'),
                 dcc.Graph(id='nivel-manual-3'),
@@ -52,7 +57,19 @@ def create_layout():
             dcc.Tab(label='Modo Automático', children=[
                 dcc.Interval(id='intervalo-automatico', interval=1000, n_intervals=0),
                 html.Br(),
-                html.H4("Control automático con PID (u1, u2)"),
+                html.H4("Control automático (u1, u2)"),
+                dbc.RadioItems(
+                    id='auto-controlador',
+                    options=[
+                        {'label': 'PID por lazo', 'value': 'pid'},
+                        {'label': 'MPC (h1 y h2 juntos)', 'value': 'mpc'},
+                        {'label': 'LQR con integral (ganancias programadas)', 'value': 'lqr'},
+                    ],
+                    value='pid',
+                    inline=True
+                ),
+                html.Div(id='auto-controlador-msg', style={'textAlign': 'center'}),
+                html.Br(),
                 dbc.Row([
                     dbc.Col(dbc.Input(id='auto-h1-ref', type='number', placeholder='Referencia h1 (cm)', min=0, step=0.1), width=6),
                     dbc.Col(dbc.Input(id='auto-h2-ref', type='number', placeholder='Referencia h2 (cm)', min=0, step=0.1), width=6),
@@ -99,6 +116,8 @@ def create_layout():
                 ], className="g-2", justify="center"),
                 html.Br(),
                 html.Div(id='modo-automatico', style={'color': 'green', 'textAlign': 'center'}),
+                html.Br(),
+                html.Div(id='auto-metricas'),
 
                 html.Hr(),
                 html.H4("Niveles con referencia"),
@@ -167,8 +186,9 @@ def create_layout():
                             {'label': 'Voltajes (u1, u2)', 'value': 'voltajes'},
                             {'label': 'Parámetros PID (Kp, Ki, Kd, AW)', 'value': 'pid'},
                             {'label': 'Razones de flujo (γ1, γ2)', 'value': 'razones'},
+                            {'label': 'Métricas de los lazos (IAE, ISE, sobrepaso, establecimiento, ...)', 'value': 'metricas'},
                         ],
-                        value=['niveles', 'refs', 'voltajes', 'pid', 'razones'],
+                        value=['niveles', 'refs', 'voltajes', 'pid', 'razones', 'metricas'],
                         inline=False
                     ), width=12, lg=6),
 
@@ -0,0 +1,45 @@
+import threading
+import time
+from types import SimpleNamespace
+from opcua import ua
+from utils.despachador import Despachador
+
+
+def _nodo(i):
+    return SimpleNamespace(nodeid=ua.NodeId(i, 2))
+
+
+def test_envios_concurrentes_con_los_workers_sin_crear():
+    for _ in range(20):
+        recibidos = []
+        despachador = Despachador(lambda nombre, val: recibidos.append(val), n_workers=8)
+        errores = []
+        inicio = threading.Barrier(8)
+
+        def enviar(i):
+            inicio.wait()
+            try:
+                despachador.enviar(_nodo(i), i)
+            except Exception as e:
+                errores.append(e)
+
+        hilos = [threading.Thread(target=enviar, args=(i,)) for i in range(8)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        assert errores == []
+        assert len(despachador._workers) == 8
+        limite = time.monotonic() + 2
+        while len(recibidos) < 8 and time.monotonic() < limite:
+            time.sleep(0.01)
+        assert sorted(recibidos) == list(range(8))
+
+
+def test_cola_llena_cuenta_descartadas():
+    bloqueo = threading.Event()
+    despachador = Despachador(lambda nombre, val: bloqueo.wait(), n_workers=1, capacidad=1)
+    for i in range(5):
+        despachador.enviar(_nodo(1), i)
+    bloqueo.set()
+    assert 3 <= despachador.descartadas <= 4
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from utils.lqr_controller import LQRController, TablaLQR
+from calculos.simulacionLazo import Escenario, simular
+from calculos.sintonizacion import metricas
+
+# Baja desde 40 cm a 30/30 y luego escalones opuestos 30 → 25 (h1) y 30 → 35 (h2)
+ESCENARIO = Escenario(duracion=600, referencias=[(0, (30, 30)), (300, (25, 35))])
+
+
+@pytest.fixture(scope='module')
+def tabla():
+    # Grilla reducida alrededor de las referencias y γ del escenario (la completa tarda segundos)
+    return TablaLQR(alturas=np.arange(20.0, 41.0, 5.0), gammas=np.arange(0.5, 0.81, 0.1), Ts=ESCENARIO.Ts)
+
+
+def test_sigue_los_escalones_en_lazo_cerrado(tabla):
+    resultado = simular(LQRController(tabla), ESCENARIO)
+    h = resultado['x'][:, 0, :2]
+    assert np.abs(h[299] - (30, 30)).max() < 0.05
+    assert np.abs(h[-1] - (25, 35)).max() < 0.05
+
+    m = metricas(resultado)
+    assert m['establecimiento'][0] < 200
+    assert m['sobrepaso'][0] < 10
+    u = resultado['u'][:, 0]
+    assert u.min() >= 0.0 and u.max() <= 0.999
+
+
+def test_tabla_en_disco_da_las_mismas_ganancias(tabla, tmp_path):
+    ruta = str(tmp_path / 'tabla_lqr.pkl')
+    ejes = dict(alturas=tabla.ejes[0], gammas=tabla.ejes[2], Ts=tabla.Ts, ruta_cache=ruta)
+    TablaLQR(**ejes)
+    cargada = TablaLQR(**ejes)
+    assert cargada.stats['desde_cache']
+    assert np.array_equal(cargada.datos, tabla.datos)
@@ -0,0 +1,53 @@
+import pytest
+from calculos.metricasLazo import MetricasLazo
+
+
+def _tramo(metricas, tiempos, y, u, setpoint):
+    for t in tiempos:
+        metricas.actualizar(t, y, u, setpoint)
+
+
+def test_integra_con_el_intervalo_entre_muestras():
+    metricas = MetricasLazo()
+    _tramo(metricas, range(5), y=20.0, u=0.5, setpoint=30.0)
+    estado = metricas.estado()
+    assert estado['iae'] == pytest.approx(40.0)     # 4 intervalos de 1 s con error 10
+    assert estado['ise'] == pytest.approx(400.0)
+    assert estado['esfuerzo'] == pytest.approx(1.0)
+    assert estado['duracion'] == pytest.approx(4.0)
+
+
+def test_reiniciar_no_integra_el_intervalo_detenido():
+    metricas = MetricasLazo()
+    _tramo(metricas, range(5), y=20.0, u=0.5, setpoint=30.0)
+    total = metricas.resumen()['iae']
+    metricas.reiniciar()
+    metricas.actualizar(605.0, 20.0, 1.0, 30.0)
+    estado = metricas.estado()
+    assert estado['muestras'] == 1
+    assert estado['iae'] == 0.0 and estado['esfuerzo'] == 0.0
+    assert metricas.resumen()['iae'] == pytest.approx(total)
+    metricas.actualizar(606.0, 20.0, 1.0, 30.0)
+    assert metricas.estado()['iae'] == pytest.approx(10.0)
+
+
+def test_interrumpir_mantiene_el_tramo_sin_integrar_la_pausa():
+    metricas = MetricasLazo()
+    _tramo(metricas, range(5), y=20.0, u=0.5, setpoint=30.0)
+    metricas.interrumpir()
+    _tramo(metricas, (605.0, 606.0), y=20.0, u=0.5, setpoint=30.0)
+    estado = metricas.estado()
+    assert estado['muestras'] == 7
+    assert estado['iae'] == pytest.approx(50.0)
+
+
+def test_cambio_de_referencia_empieza_un_tramo_sin_arrastrar_dt():
+    metricas = MetricasLazo()
+    _tramo(metricas, range(5), y=20.0, u=0.5, setpoint=30.0)
+    metricas.actualizar(10.0, 20.0, 0.5, 25.0)
+    estado = metricas.estado()
+    assert estado['setpoint'] == 25.0 and estado['t_inicio'] == 10.0
+    assert estado['iae'] == 0.0
+    metricas.actualizar(11.0, 22.0, 0.5, 25.0)
+    assert metricas.estado()['iae'] == pytest.approx(3.0)
+    assert metricas.resumen()['iae'] == pytest.approx(43.0)
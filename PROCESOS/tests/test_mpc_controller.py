@@ -0,0 +1,24 @@
+import numpy as np
+from utils.mpc_controller import MPCController
+from calculos.simulacionLazo import Escenario, simular
+from calculos.sintonizacion import metricas
+
+# Baja desde 40 cm a 30/30 y luego escalones opuestos 30 → 25 (h1) y 30 → 35 (h2)
+ESCENARIO = Escenario(duracion=600, referencias=[(0, (30, 30)), (300, (25, 35))])
+
+
+def test_sigue_los_escalones_en_lazo_cerrado():
+    resultado = simular(MPCController(Ts=ESCENARIO.Ts), ESCENARIO)
+    h = resultado['x'][:, 0, :2]
+    assert np.abs(h[299] - (30, 30)).max() < 0.05
+    assert np.abs(h[-1] - (25, 35)).max() < 0.05
+
+    m = metricas(resultado)
+    assert m['establecimiento'][0] < 200
+    assert m['sobrepaso'][0] < 10
+
+
+def test_respeta_los_limites_de_entrada():
+    resultado = simular(MPCController(Ts=ESCENARIO.Ts, output_limits=(0.1, 0.8)), ESCENARIO)
+    u = resultado['u'][:, 0]
+    assert u.min() >= 0.1 - 1e-9 and u.max() <= 0.8 + 1e-9
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from utils.pid_controller import PIDController, PIDBank
+from calculos.simulacionLazo import Escenario, simular, banco_desde_ganancias
+
+
+def _ganancias(n, rng):
+    # [Kp, Ki, Kd, anti_windup_gain]; la mitad de los canales sin anti-windup
+    g = rng.uniform([0.05, 0.0, 0.0, 0.0], [1.0, 0.05, 0.5, 0.5], (n, 4))
+    g[::2, 3] = 0.0
+    return g
+
+
+def test_banco_calcula_lo_mismo_que_un_pid_por_canal():
+    rng = np.random.default_rng(0)
+    g = _ganancias(8, rng)
+    setpoints = rng.uniform(10, 40, 8)
+    banco = PIDBank(8, Kp=g[:, 0], Ki=g[:, 1], Kd=g[:, 2], setpoint=setpoints, anti_windup_gain=g[:, 3])
+    pids = [PIDController(*fila[:3], setpoint=sp, anti_windup_gain=fila[3]) for fila, sp in zip(g, setpoints)]
+    for _ in range(200):
+        mediciones = rng.uniform(0, 50, 8)
+        dt = rng.uniform(0.5, 1.5)  # dt medido, distinto del nominal
+        esperado = [pid.compute(float(m), dt) for pid, m in zip(pids, mediciones)]
+        assert banco.compute(mediciones, dt) == pytest.approx(esperado, abs=1e-12)
+    assert banco.integral == pytest.approx([pid.integral for pid in pids], abs=1e-9)
+
+
+def test_canal_tiene_la_interfaz_de_pidcontroller():
+    banco = PIDBank(2, Kp=0.3, Ki=0.02, Kd=0.1, setpoint=30, anti_windup_gain=0.2)
+    canal = banco.canal(1)
+    pid = PIDController(0.3, 0.02, 0.1, setpoint=30, anti_windup_gain=0.2)
+    for medicion in (20.0, 25.0, 28.0, 31.0, 29.5):
+        assert canal.compute(medicion) == pytest.approx(pid.compute(medicion), abs=1e-12)
+    canal.setParams(0.5, 0.01, 0.0, 25, 0.0)
+    pid.setParams(0.5, 0.01, 0.0, 25, 0.0)
+    assert canal.compute(27.0, 0.5) == pytest.approx(pid.compute(27.0, 0.5), abs=1e-12)
+    banco.canal(0).compute(20.0)
+    canal.reset()
+    assert canal.integral == 0 and banco.integral[0] != 0  # reinicia solo su canal
+
+
+def test_lazo_cerrado_con_banco_igual_a_pareja_de_pids():
+    escenario = Escenario(duracion=200, referencias=[(0, (30, 30)), (100, (25, 35))])
+    ganancias = [0.4, 0.02, 0.0, 0.1]
+    banco = simular(banco_desde_ganancias([ganancias]), escenario)
+    pareja = simular((PIDController(*ganancias[:3], anti_windup_gain=ganancias[3]),
+                      PIDController(*ganancias[:3], anti_windup_gain=ganancias[3])), escenario)
+    assert banco['u'] == pytest.approx(pareja['u'], abs=1e-9)
+    assert banco['x'] == pytest.approx(pareja['x'], abs=1e-9)
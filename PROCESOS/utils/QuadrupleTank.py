@@ -1,16 +1,49 @@
 import numpy as np
-from scipy.integrate import odeint
-import scipy.integrate as integrator
-import matplotlib.pyplot as plt
-import pygame
 import time
 import sys
-from opc_client import Cliente # cliente OPCUA
+import os
 import random
-import threading
+try:
+    from utils.despachador import Despachador
+except ImportError:  # ejecutado desde utils/ (simulador)
+    from despachador import Despachador
+
+# scipy (solo integrador 'lsoda'), pygame (solo interfaz gráfica) y el cliente OPC (solo el
+# simulador) se importan al usarse: el modelo se puede importar sin dependencias pesadas
+pygame = None
+
+# Integradores de paso fijo. Reciben un modelo que expone _xd_vec(x) y _jac_diag(x)
+# (derivadas y diagonal del jacobiano, ya vectorizadas) y avanzan el estado x en Ts
+# segundos dividiéndolo en sub-pasos de a lo más modelo.paso_max.
+def _subpasos(modelo, Ts):
+    n = max(1, int(np.ceil(Ts / modelo.paso_max)))
+    return n, Ts / n
+
+def integrar_rk4(modelo, x, Ts):
+    n, h = _subpasos(modelo, Ts)
+    f = modelo._xd_vec
+    for _ in range(n):
+        k1 = f(x)
+        k2 = f(x + 0.5*h*k1)
+        k3 = f(x + 0.5*h*k2)
+        k4 = f(x + h*k3)
+        x = x + h/6*(k1 + 2*k2 + 2*k3 + k4)
+    return x
+
+def integrar_semi_implicito(modelo, x, Ts):
+    # Euler linealmente implícito: el término de descarga sqrt(h) se trata con su
+    # jacobiano diagonal, lo que lo hace estable con estanques casi vacíos
+    n, h = _subpasos(modelo, Ts)
+    for _ in range(n):
+        x = x + h*modelo._xd_vec(x) / (1 - h*modelo._jac_diag(x))
+    return x
+
+# 'lsoda' no está en el diccionario: se resuelve con odeint dentro de QuadrupleTank.sim
+INTEGRADORES = {'rk4': integrar_rk4, 'semi_implicito': integrar_semi_implicito}
+
 
 class QuadrupleTank():
-    def __init__(self, x0, Hmax, voltmax):
+    def __init__(self, x0, Hmax, voltmax, integrador='lsoda', paso_max=0.01):
         self.x0 = x0
         self.t = 0
 
@@ -32,19 +65,46 @@ class QuadrupleTank():
         self.Hmax = Hmax
         self.Hmin = 0.0
 
+        # Integrador: 'lsoda' (odeint, referencia de precisión), 'rk4' o 'semi_implicito'
+        self.integrador = integrador
+        self.paso_max = paso_max # s, sub-paso máximo de los integradores de paso fijo
+        self._coef_key = None
+
+    # Se pliegan una sola vez los coeficientes a/A*sqrt(2g) y kin*voltmax/A (incluyendo
+    # time_scaling). Se recalculan solo si alguno de los parámetros cambió.
+    def _coeficientes(self):
+        key = (self.time_scaling, self.voltmax, self.kin, self.g, tuple(self.A), tuple(self.a))
+        if key != self._coef_key:
+            A = np.asarray(self.A, dtype=float)
+            a = np.asarray(self.a, dtype=float)
+            s2g = np.sqrt(2*self.g)
+            # xd = M @ sqrt(x) + B * [g1*v1, g2*v2, (1-g2)*v2, (1-g1)*v1]
+            M = np.diag(-a/A*s2g)
+            M[0, 2] = a[2]/A[0]*s2g
+            M[1, 3] = a[3]/A[1]*s2g
+            self._M = self.time_scaling*M
+            self._MT = self._M.T.copy()
+            self._Mdiag = np.diag(self._M).copy()
+            self._B = self.time_scaling*self.kin*self.voltmax/A
+            self._coef_key = key
+
+    def _entrada(self):
+        g1, g2 = self.gamma
+        v1, v2 = self.volt
+        return self._B*np.array([g1*v1, g2*v2, (1 - g2)*v2, (1 - g1)*v1])
+
+    # Derivadas vectorizadas (equivalentes a xd_func, ya escaladas por time_scaling)
+    def _xd_vec(self, x):
+        return np.sqrt(np.maximum(x, 0)) @ self._MT + self._u
+
+    # Diagonal del jacobiano de _xd_vec respecto de x
+    def _jac_diag(self, x):
+        return self._Mdiag / (2*np.sqrt(np.maximum(x, 1e-6)))
+
     # Restricciones físicas de los tanques
     def Limites(self):
-        for i in range(len(self.x)):
-            if self.x[i] > self.Hmax:
-                self.x[i] = self.Hmax
-            elif self.x[i] <1e-2:
-                self.x[i] = 1e-2
-
-        for i in range(2):
-            if self.volt[i] > 1:
-                self.volt[i] = 1
-            elif self.volt[i] < -1:
-                self.volt[i] = -1
+        self.x = np.clip(self.x, 1e-2, self.Hmax)
+        self.volt = np.clip(self.volt, -1, 1)
 
     # Ecuaciones diferenciales de los tanques
     def xd_func(self, x, t):
@@ -59,21 +119,194 @@ class QuadrupleTank():
                 res[i] = 0
         return np.multiply(self.time_scaling, res)
 
+    # Punto de operación: niveles h3, h4 y voltajes que mantienen h1, h2 en régimen con las γ actuales
+    def equilibrio(self, h1, h2):
+        g1, g2 = self.gamma
+        k = self.kin*self.voltmax
+        s2g = np.sqrt(2*self.g)
+        if abs(g1 + g2 - 1) < 1e-9:
+            raise ValueError('Con γ1 + γ2 = 1 el equilibrio de h1 y h2 no es único')
+        caudales = np.array([self.a[0]*s2g*np.sqrt(h1), self.a[1]*s2g*np.sqrt(h2)])
+        volt = np.linalg.solve(k*np.array([[g1, 1 - g2], [1 - g1, g2]]), caudales)
+        h3 = ((1 - g2)*k*volt[1]/(self.a[2]*s2g))**2
+        h4 = ((1 - g1)*k*volt[0]/(self.a[3]*s2g))**2
+        return np.array([h1, h2, h3, h4], dtype=float), volt
+
+    # Jacobianos de xd_func en el punto x0 (las entradas entran en forma lineal):
+    # xd ≈ Ac (x - x0) + Bc (volt - volt0), escalados por time_scaling.
+    # Con Ts retorna el modelo discreto (A, B) con retención de orden cero
+    def linealizar(self, x0, Ts=None):
+        g1, g2 = self.gamma
+        A = np.asarray(self.A, dtype=float)
+        a = np.asarray(self.a, dtype=float)
+        d = a/A*np.sqrt(self.g/(2*np.maximum(np.asarray(x0, dtype=float), 1e-6)))  # d/dh de a/A*sqrt(2gh)
+        Ac = np.diag(-d)
+        Ac[0, 2] = d[2]*A[2]/A[0]
+        Ac[1, 3] = d[3]*A[3]/A[1]
+        k = self.kin*self.voltmax
+        Bc = np.array([[g1*k/A[0], 0], [0, g2*k/A[1]], [0, (1 - g2)*k/A[2]], [(1 - g1)*k/A[3], 0]])
+        Ac, Bc = self.time_scaling*Ac, self.time_scaling*Bc
+        if Ts is None:
+            return Ac, Bc
+        from scipy.linalg import expm
+        M = np.zeros((6, 6))
+        M[:4, :4], M[:4, 4:] = Ac, Bc
+        Md = expm(M*Ts)
+        return Md[:4, :4], Md[:4, 4:]
+
+    # Avanza el estado Ts segundos con el integrador seleccionado
+    def paso(self, Ts):
+        self.Ts = Ts
+        self.x0 = np.array(self.x, dtype=float) # Estado actual se vuelve condición inicial para el nuevo estado
+        if self.integrador == 'lsoda':
+            from scipy.integrate import odeint
+            t = np.linspace(0, self.Ts, 2)
+            x = odeint(self.xd_func, self.x0, t)  # Perform integration using Fortran's LSODA (Adams & BDF methods)
+            self.x = x[-1]
+        else:
+            self._coeficientes()
+            self._u = self._entrada() # Entradas constantes durante el paso (ZOH)
+            self.x = INTEGRADORES[self.integrador](self, self.x0, self.Ts)
+        self.Limites()
+        return self.x
+
     # Integración en "tiempo real"
     def sim(self):
-        self.x0 = np.array(self.x) # Estado actual se vuelve condición inicial para el nuevo estado
-        self.Ts = time.time() - self.ti
-        #self.Ts = 0.01
-        t = np.linspace(0, self.Ts, 2)
-        x = odeint(self.xd_func, self.x0, t)  # Perform integration using Fortran's LSODA (Adams & BDF methods)
-        self.x = [x[-1, 0], x[-1,1], x[-1, 2], x[-1, 3]]
-        self.Limites()
+        self.paso(time.time() - self.ti)
         #print(self.x)
         self.ti = time.time()
         return self.x
 
 
 
+class QuadrupleTankEnsemble():
+    '''
+    N plantas de cuatro tanques simuladas a la vez sobre una matriz de estado (N, 4).
+    A, a (N, 4), kin, voltmax (N,) y gamma, volt (N, 2) pueden variar por planta; los que
+    no se entregan toman los valores nominales de QuadrupleTank. Usa los mismos
+    integradores de paso fijo (INTEGRADORES).
+    '''
+    def __init__(self, x0, Hmax, voltmax, N, A=None, a=None, kin=None, gamma=None,
+                 integrador='rk4', paso_max=0.01):
+        if integrador not in INTEGRADORES:
+            raise ValueError('Integrador no soportado para el ensamble: {}'.format(integrador))
+        nominal = QuadrupleTank(x0=x0, Hmax=Hmax, voltmax=voltmax)
+        self.N = N
+        self.g = nominal.g
+        self.A = np.broadcast_to(np.asarray(nominal.A if A is None else A, dtype=float), (N, 4)).copy()
+        self.a = np.broadcast_to(np.asarray(nominal.a if a is None else a, dtype=float), (N, 4)).copy()
+        self.kin = np.broadcast_to(np.asarray(nominal.kin if kin is None else kin, dtype=float), (N,)).copy()
+        self.voltmax = np.broadcast_to(np.asarray(voltmax, dtype=float), (N,)).copy()
+        self.gamma = np.broadcast_to(np.asarray(nominal.gamma if gamma is None else gamma, dtype=float), (N, 2)).copy()
+        self.volt = np.zeros((N, 2))
+
+        self.time_scaling = 1
+        self.x = np.broadcast_to(np.asarray(x0, dtype=float), (N, 4)).copy()
+        self.Ts = 0
+        self.Hmax = Hmax
+        self.integrador = integrador
+        self.paso_max = paso_max
+        self.actualizar_coeficientes()
+
+    # Perturbación multiplicativa uniforme (±dispersion) de los parámetros nominales
+    @classmethod
+    def desde_nominal(cls, x0, Hmax, voltmax, N, dispersion=0.05, semilla=None, **kwargs):
+        rng = np.random.default_rng(semilla)
+        nominal = QuadrupleTank(x0=x0, Hmax=Hmax, voltmax=voltmax)
+        def perturbar(valor, forma):
+            return np.asarray(valor, dtype=float)*rng.uniform(1 - dispersion, 1 + dispersion, forma)
+        return cls(x0, Hmax, perturbar(voltmax, (N,)), N,
+                   A=perturbar(nominal.A, (N, 4)), a=perturbar(nominal.a, (N, 4)),
+                   kin=perturbar(nominal.kin, (N,)),
+                   gamma=np.clip(perturbar(nominal.gamma, (N, 2)), 0, 1), **kwargs)
+
+    # Debe llamarse si se modifican A, a, kin, voltmax o time_scaling después de crear el ensamble
+    def actualizar_coeficientes(self):
+        s2g = np.sqrt(2*self.g)
+        self._K = self.time_scaling*self.a/self.A*s2g             # descarga propia (N, 4)
+        self._K20 = self.time_scaling*self.a[:, 2]/self.A[:, 0]*s2g # tanque 3 -> tanque 1
+        self._K31 = self.time_scaling*self.a[:, 3]/self.A[:, 1]*s2g # tanque 4 -> tanque 2
+        self._B = self.time_scaling*(self.kin*self.voltmax)[:, None]/self.A
+
+    def _entrada(self):
+        g1, g2 = self.gamma[:, 0], self.gamma[:, 1]
+        v1, v2 = self.volt[:, 0], self.volt[:, 1]
+        return self._B*np.stack([g1*v1, g2*v2, (1 - g2)*v2, (1 - g1)*v1], axis=1)
+
+    def _xd_vec(self, x):
+        s = np.sqrt(np.maximum(x, 0))
+        xd = self._u - self._K*s
+        xd[:, 0] += self._K20*s[:, 2]
+        xd[:, 1] += self._K31*s[:, 3]
+        return xd
+
+    def _jac_diag(self, x):
+        return -self._K / (2*np.sqrt(np.maximum(x, 1e-6)))
+
+    def Limites(self):
+        np.clip(self.x, 1e-2, self.Hmax, out=self.x)
+        np.clip(self.volt, -1, 1, out=self.volt)
+
+    # Avanza todas las plantas Ts segundos; volt y gamma pueden ser escalares, (2,) o (N, 2)
+    def paso(self, Ts, volt=None, gamma=None):
+        if volt is not None:
+            self.volt[:] = volt
+        if gamma is not None:
+            self.gamma[:] = gamma
+        self.Ts = Ts
+        self._u = self._entrada()
+        self.x = INTEGRADORES[self.integrador](self, self.x, Ts)
+        self.Limites()
+        return self.x
+
+
+
+class RelojReal():
+    '''Reloj de pared: el paso de integración es el tiempo transcurrido desde el tick anterior.'''
+    def __init__(self):
+        self._t_prev = None
+
+    def ahora(self):
+        return time.time()
+
+    def siguiente_paso(self):
+        t = time.time()
+        Ts = 0.0 if self._t_prev is None else t - self._t_prev
+        self._t_prev = t
+        return Ts
+
+
+class RelojVirtual():
+    '''
+    Reloj virtual de paso fijo Ts, independiente del tiempo de pared. Con aceleracion=k el
+    tiempo simulado avanza k veces más rápido que el real; con aceleracion=None se simula
+    tan rápido como sea posible. Con la misma entrada los resultados son idénticos entre corridas.
+    '''
+    def __init__(self, Ts, aceleracion=1.0, t_inicio=0.0):
+        if Ts <= 0:
+            raise ValueError('Ts debe ser positivo')
+        self.Ts = Ts
+        self.aceleracion = aceleracion
+        self.t = t_inicio
+        self._t0 = t_inicio
+        self._t0_real = None
+
+    def ahora(self):
+        return self.t
+
+    def siguiente_paso(self):
+        if self.aceleracion:
+            if self._t0_real is None:
+                self._t0_real = time.time()
+            espera = self._t0_real + (self.t + self.Ts - self._t0)/self.aceleracion - time.time()
+            if espera > 0:
+                time.sleep(espera)
+        self.t += self.Ts
+        return self.Ts
+
+
+
+# import matplotlib.pyplot as plt
 # series = []
 # sistema = QuadrupleTank(x0=[50,50,50,50], Hmax=50, voltmax=50)
 # sistema.time_scaling = 100 # Para el tiempo
@@ -95,6 +328,8 @@ class QuadrupleTank():
 class Interfaz_grafica():
 
     def __init__(self, Hmax):
+        global pygame
+        import pygame
         self.width = 640
         self.height = 480
         pygame.init()
@@ -395,162 +630,181 @@ class Interfaz_grafica():
 variables_manipuladas = {'Valvula1': 0, 'Valvula2':0 , 'Razon1':0, 'Razon2':0}
 
 # Función que se suscribe
-def funcion_handler(node, val):
-    key = node.get_parent().get_display_name().Text
+def funcion_handler(key, val):
+    key = key.capitalize() # 'valvula1' -> 'Valvula1', según el nombre registrado en el despachador
     variables_manipuladas[key] = val # Se cambia globalmente el valor de las variables manipuladas cada vez que estas cambian
     print('key: {} | val: {}'.format(key, val))
 
 
-class SubHandler(object): # Clase debe estar en el script porque el thread que comienza debe mover variables globales
+class SubHandler(object): # Clase debe estar en el script porque el despachador debe mover variables globales
+    despachador = Despachador(funcion_handler, n_workers=1, nombre='simulador') # Un worker: orden estricto
+
     def datachange_notification(self, node, val, data):
-        thread_handler = threading.Thread(target=funcion_handler, args=(node, val))  # Se realiza la descarga por un thread
-        thread_handler.start()
+        self.despachador.enviar(node, val)
 
     def event_notification(self, event):
         #print("Python: New event", event)
         pass
 
-cliente = Cliente("opc.tcp://localhost:4840/freeopcua/server/", suscribir_eventos=True, SubHandler=SubHandler)
-cliente.conectar()
-#cliente.subscribir_mv() # Se subscribe a las variables manipuladas
-
 ######################### Main loop #################################
 
-# Setup
-x0=[40, 40, 40, 40] #Condición inicial de los tanques
-#x0=[33.915, 35.224, 4.485, 3.914] #Condición inicial de los tanques (eq para u_eq = (0.5,0.5)) y gamma = (0.7,0.6)
-#x0=[28.029, 43.489, 10.091, 15.656] #Condic
-
-#
-# drh dfh dión inicial de los tanques (eq para u_eq = (0.5,0.5)) y gamma = (0.4,0.4)
-Hmax = 50
-voltmax = 10
-fps = 20
-sensibilidad = 0.01 # Cambio de las varibles manipuladas cada vez que se aprieta una tecla
-clock = pygame.time.Clock() # Limita la cantidad de FPS
-first_it = True
-
-sistema = QuadrupleTank(x0=x0, Hmax=Hmax, voltmax=voltmax)
-sistema.time_scaling = 1 # Para el tiempo
-# interfaz = Interfaz_grafica(Hmax=Hmax)
-# interfaz.paint()
-running = True
-manual = False # Control Manual o automático de las variables
-t = 0
-alturasMatrix = []
-
-tiempos = list()
-altura1 = list()
-altura2 = list()
-altura3 = list()
-altura4 = list()
-
-try:
-    while running:
-        # Actualización del sistema de forma manual
-        if manual:
-            running, u = interfaz.eventos(running, sensibilidad, sistema.volt[0], sistema.volt[1], sistema.gamma[0], sistema.gamma[1])
-            sistema.volt[0] = u['valvula1']
-            sistema.volt[1] = u['valvula2']
-            sistema.gamma[0] = u['razon1']
-            sistema.gamma[1] = u['razon2']
-
-            # Envío de los valores por OPC cuando se está en forma manual
-            # Obtención de los pumps
-            cliente.valvulas['valvula1'].set_value(u['valvula1'])
-            cliente.valvulas['valvula2'].set_value(u['valvula2'])
-
-            # Obtención de los switches
-            cliente.razones['razon1'].set_value(u['razon1'])
-            cliente.razones['razon2'].set_value(u['razon2'])
-        else:
-            volt1 = cliente.valvulas['valvula1'].get_value()
-            volt2 = cliente.valvulas['valvula2'].get_value()
-
-            gamma1 = cliente.razones['razon1'].get_value()
-            gamma2 = cliente.razones['razon2'].get_value()
-
-            if volt1 > 1 or volt1 < -1 or volt2 > 1 or volt2 < -1 \
-                or gamma1 > 1 or gamma1 < 0 or gamma2 > 1 or gamma2 < 0:
-                raise ValueError('Valores fuera del rango específicado')
-
-            # interfaz.Automatico(volt1, volt2, gamma1, gamma2)
-
-            sistema.volt[0] = volt1
-            sistema.volt[1] = volt2
-            sistema.gamma[0] = gamma1
-            sistema.gamma[1] = gamma2
-
-
-
-
-        # interfaz.screen.blit(interfaz.background, (0, 0))
-        # interfaz.screen.blit(interfaz.textSurf, (0,0))
-
-
-        ####### Simulación del sistema ######
-        if first_it:
-            sistema.ti = time.time()
-            first_it = False
-
-        alturas = sistema.sim()
-
-        #print(f"Alturas son: {alturas}")
-        print(
-            "Alturas:  "
-            f"H1: {alturas[0]:>7.5f} | "
-            f"H2: {alturas[1]:>7.5f} | "
-            f"H3: {alturas[2]:>7.5f} | "
-            f"H4: {alturas[3]:>7.5f}"
-        )
-
-        tiempo_actual = time.time()
-        tiempos.append(tiempo_actual)
-        altura1.append(alturas[0])
-        altura2.append(alturas[1])
-        altura3.append(alturas[2])
-        altura4.append(alturas[3])
-
-        ####### Updates interfaz #################
-
-    ##    # Tanque 1
-    ##    interfaz.Tank_update(altura=alturas[0], posicion=interfaz.posTank1)
-    ##
-    ##    # Tanque 2
-    ##    interfaz.Tank_update(altura=alturas[1], posicion=interfaz.posTank2)
-    ##
-    ##    # Tanque 3
-    ##    interfaz.Tank_update(altura=alturas[2], posicion=interfaz.posTank3)
-    ##
-    ##    # Tanque 4
-    ##    interfaz.Tank_update(altura=alturas[3], posicion=interfaz.posTank4)
-
-
-        ############ UPDATE CLIENTE OPC ##################################
-        cliente.alturas['H1'].set_value(alturas[0])
-        cliente.alturas['H2'].set_value(alturas[1])
-        cliente.alturas['H3'].set_value(alturas[2])
-        cliente.alturas['H4'].set_value(alturas[3])
-
-        cliente.temperaturas['T1'].set_value(22 + random.randrange(-7,7,1))
-        cliente.temperaturas['T2'].set_value(22 + random.randrange(-7,7,1))
-        cliente.temperaturas['T3'].set_value(22 + random.randrange(-7,7,1))
-        cliente.temperaturas['T4'].set_value(22 + random.randrange(-7,7,1))
-
-
-        # pygame.display.flip()
-        # clock.tick(fps)
-except KeyboardInterrupt: 
-    print("\n🔴 Interrupción por teclado. Cerrando el programa con seguridad...")    
-finally:
-    import csv  
-    import os   
-    ruta_csv = r"C:\Users\ernes\Desktop\LAB_CONTROL_AUTOMATICO\PROCESOS\data\alturas.csv"
-
-    with open(ruta_csv, mode='w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(['tiempo', 'h1', 'h2', 'h3', 'h4'])  # encabezado
-        for t, h1, h2, h3, h4 in zip(tiempos, altura1, altura2, altura3, altura4):
-            writer.writerow([t, h1, h2, h3, h4])
+def main(reloj, ruta_csv, duracion=None, semilla=None, integrador='lsoda', deadband=None):
+    # Con reloj virtual y semilla fija las temperaturas simuladas también son reproducibles
+    if semilla is not None:
+        random.seed(semilla)
+
+    from opc_client import Cliente # cliente OPCUA
+    cliente = Cliente("opc.tcp://localhost:4840/freeopcua/server/", suscribir_eventos=True, SubHandler=SubHandler)
+    cliente.conectar()
+    #cliente.subscribir_mv() # Se subscribe a las variables manipuladas
+
+    # Setup
+    x0=[40, 40, 40, 40] #Condición inicial de los tanques
+    #x0=[33.915, 35.224, 4.485, 3.914] #Condición inicial de los tanques (eq para u_eq = (0.5,0.5)) y gamma = (0.7,0.6)
+    #x0=[28.029, 43.489, 10.091, 15.656] #Condic
+
+    #
+    # drh dfh dión inicial de los tanques (eq para u_eq = (0.5,0.5)) y gamma = (0.4,0.4)
+    Hmax = 50
+    voltmax = 10
+    sensibilidad = 0.01 # Cambio de las varibles manipuladas cada vez que se aprieta una tecla
+    # clock = pygame.time.Clock() # Limita la cantidad de FPS (solo con la interfaz gráfica)
+
+    sistema = QuadrupleTank(x0=x0, Hmax=Hmax, voltmax=voltmax, integrador=integrador)
+    sistema.time_scaling = 1 # Para el tiempo
+    # interfaz = Interfaz_grafica(Hmax=Hmax)
+    # interfaz.paint()
+    running = True
+    manual = False # Control Manual o automático de las variables
+    t_inicio = reloj.ahora()
+
+    tiempos = list()
+    altura1 = list()
+    altura2 = list()
+    altura3 = list()
+    altura4 = list()
+
+    try:
+        while running:
+            # Actualización del sistema de forma manual
+            if manual:
+                running, u = interfaz.eventos(running, sensibilidad, sistema.volt[0], sistema.volt[1], sistema.gamma[0], sistema.gamma[1])
+                sistema.volt[0] = u['valvula1']
+                sistema.volt[1] = u['valvula2']
+                sistema.gamma[0] = u['razon1']
+                sistema.gamma[1] = u['razon2']
+
+                # Envío de los valores por OPC cuando se está en forma manual (pumps y switches)
+                cliente.escribir_varios(u)
+            else:
+                volt1 = cliente.valvulas['valvula1'].get_value()
+                volt2 = cliente.valvulas['valvula2'].get_value()
+
+                gamma1 = cliente.razones['razon1'].get_value()
+                gamma2 = cliente.razones['razon2'].get_value()
+
+                if volt1 > 1 or volt1 < -1 or volt2 > 1 or volt2 < -1 \
+                    or gamma1 > 1 or gamma1 < 0 or gamma2 > 1 or gamma2 < 0:
+                    raise ValueError('Valores fuera del rango específicado')
+
+                # interfaz.Automatico(volt1, volt2, gamma1, gamma2)
+
+                sistema.volt[0] = volt1
+                sistema.volt[1] = volt2
+                sistema.gamma[0] = gamma1
+                sistema.gamma[1] = gamma2
+
+
+
+
+            # interfaz.screen.blit(interfaz.background, (0, 0))
+            # interfaz.screen.blit(interfaz.textSurf, (0,0))
+
+
+            ####### Simulación del sistema ######
+            # El reloj define el paso: tiempo de pared transcurrido (real) o Ts fijo (virtual)
+            alturas = sistema.paso(reloj.siguiente_paso())
+
+            #print(f"Alturas son: {alturas}")
+            print(
+                "Alturas:  "
+                f"H1: {alturas[0]:>7.5f} | "
+                f"H2: {alturas[1]:>7.5f} | "
+                f"H3: {alturas[2]:>7.5f} | "
+                f"H4: {alturas[3]:>7.5f}"
+            )
+
+            tiempo_actual = reloj.ahora()
+            tiempos.append(tiempo_actual)
+            altura1.append(alturas[0])
+            altura2.append(alturas[1])
+            altura3.append(alturas[2])
+            altura4.append(alturas[3])
+
+            if duracion is not None and tiempo_actual - t_inicio >= duracion:
+                running = False
 
-    print("CSV guardado en:", os.path.abspath("alturas.csv"))
\ No newline at end of file
+            ####### Updates interfaz #################
+
+        ##    # Tanque 1
+        ##    interfaz.Tank_update(altura=alturas[0], posicion=interfaz.posTank1)
+        ##
+        ##    # Tanque 2
+        ##    interfaz.Tank_update(altura=alturas[1], posicion=interfaz.posTank2)
+        ##
+        ##    # Tanque 3
+        ##    interfaz.Tank_update(altura=alturas[2], posicion=interfaz.posTank3)
+        ##
+        ##    # Tanque 4
+        ##    interfaz.Tank_update(altura=alturas[3], posicion=interfaz.posTank4)
+
+
+            ############ UPDATE CLIENTE OPC ##################################
+            # Un solo servicio Write: arreglo Estado (muestra completa con contador) más niveles y temperaturas
+            cliente.publicar_estado([float(h) for h in alturas[:4]],
+                                    [22 + random.randrange(-7,7,1) for _ in range(4)],
+                                    [sistema.volt[0], sistema.volt[1], sistema.gamma[0], sistema.gamma[1]],
+                                    deadband=deadband)
+
+
+            # pygame.display.flip()
+            # clock.tick(fps)
+    except KeyboardInterrupt: 
+        print("\n🔴 Interrupción por teclado. Cerrando el programa con seguridad...")    
+    finally:
+        import csv  
+        with open(ruta_csv, mode='w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['tiempo', 'h1', 'h2', 'h3', 'h4'])  # encabezado
+            for t, h1, h2, h3, h4 in zip(tiempos, altura1, altura2, altura3, altura4):
+                writer.writerow([t, h1, h2, h3, h4])
+
+        print("CSV guardado en:", os.path.abspath(ruta_csv))
+        try:
+            cliente.client.disconnect()  # los threads del cliente OPC no dejarían terminar el proceso
+        except Exception:
+            pass
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Simulador de los cuatro tanques (cliente OPC UA)')
+    parser.add_argument('--reloj', choices=['real', 'virtual'], default='real',
+                        help='real: paso según tiempo de pared; virtual: paso fijo Ts determinista')
+    parser.add_argument('--Ts', type=float, default=0.05, help='Paso del reloj virtual [s]')
+    parser.add_argument('--aceleracion', type=float, default=1.0,
+                        help='Factor de aceleración del reloj virtual (0 = lo más rápido posible)')
+    parser.add_argument('--duracion', type=float, default=None, help='Tiempo simulado máximo [s]')
+    parser.add_argument('--semilla', type=int, default=None, help='Semilla para las temperaturas simuladas')
+    parser.add_argument('--integrador', choices=['lsoda'] + list(INTEGRADORES), default='lsoda')
+    parser.add_argument('--deadband', type=float, default=None,
+                        help='No reenviar por OPC valores que cambien menos que esta banda')
+    parser.add_argument('--csv', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'alturas.csv'))
+    args = parser.parse_args()
+
+    if args.reloj == 'virtual':
+        reloj = RelojVirtual(args.Ts, aceleracion=args.aceleracion or None)
+    else:
+        reloj = RelojReal()
+    main(reloj, args.csv, duracion=args.duracion, semilla=args.semilla, integrador=args.integrador,
+         deadband=args.deadband)
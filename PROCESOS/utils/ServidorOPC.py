@@ -4,7 +4,10 @@ import threading
 from opcua.server.history_sql import HistorySQLite
 import os
 import random
-from TanquesNamespace import TanquesNamespace
+from TanquesNamespace import TanquesNamespace, crear_historial
+from simulacion_local import SimulacionLocal
+from planificador import Planificador
+import monitoreo
 #from Espesador.EspesadorNamesPace import EspesadorNamespace
 
 '''
@@ -13,12 +16,14 @@ En este script se maneja el Servidor OPC, el cual va a contener los distintos Na
 
 
 class Servidor_OPCUA:
-    def __init__(self):
+    def __init__(self, endpoint="opc.tcp://localhost:4840/freeopcua/server/"):
         self.server = Server()
-        self.server.set_endpoint("opc.tcp://localhost:4840/freeopcua/server/")
+        self.server.set_endpoint(endpoint)
         self.server.set_server_name("Stack IIoT")
         self.namespaces = {}
         self.objects = self.server.get_objects_node()
+        self.simulacion = None
+        self.planificador = Planificador()
 
     # Para agregar un nuevo namespace
     def new_namespace(self, uri, namespace, nombre):
@@ -27,25 +32,71 @@ class Servidor_OPCUA:
         Namespace = namespace(self.objects, idx, self.server) # Se declaran todas las variables del nuevo namespace
         self.namespaces[nombre] = Namespace
 
+    # Varias plantas de tanques en el mismo namespace, una carpeta Proceso_Tanques_<id> por estación
+    def new_estaciones(self, uri, n_estaciones, n_tanques=4, **kwargs):
+        idx = self.server.register_namespace(uri)
+        historial = crear_historial(self.server)  # compartido por todas las estaciones
+        t = time.time()
+        for estacion in range(1, n_estaciones + 1):
+            self.namespaces['Estacion{}'.format(estacion)] = TanquesNamespace(
+                self.objects, idx, self.server, estacion=estacion, n_tanques=n_tanques, historial=historial, **kwargs)
+        print('{} estaciones en namespace {} ({:.2f} s)'.format(n_estaciones, idx, time.time() - t))
+
+
+    # Las plantas de todas las estaciones de tanques se simulan en este proceso (sin el simulador externo)
+    def simular_localmente(self, Ts=0.01, **kwargs):
+        estaciones = [namespace for namespace in self.namespaces.values() if isinstance(namespace, TanquesNamespace)]
+        self.simulacion = SimulacionLocal(self.server, estaciones, Ts=Ts, **kwargs)
 
-    def start(self):
-        global alarma, valor_alarma, mensaje_alarma
+    def start(self, corregir_deadband=False):
+        # Opcional: cambia el filtro de banda muerta de python-opcua en todo el proceso (ver monitoreo.py)
+        if corregir_deadband and not monitoreo.corregir_deadband_servidor():
+            print('Corrección de banda muerta no aplicada: requiere python-opcua {}'.format(
+                monitoreo.VERSION_OPCUA_DEADBAND))
         self.server.start()
         for nombre, namespace in self.namespaces.items():
             namespace.subscripciones()
-        # Se incia el loop del servidor
+        # Cada namespace registra sus tareas; los que no lo implementan revisan sus alarmas cada 100 ms
+        for nombre, namespace in self.namespaces.items():
+            if hasattr(namespace, 'registrar_tareas'):
+                namespace.registrar_tareas(self.planificador)
+            else:
+                self.planificador.periodica('{}.alarmas'.format(nombre), namespace.monitorea_alarma, 0.1)
+        self.planificador.exponer(self.server, self.server.register_namespace('Servidor'))
+        self.planificador.iniciar()
+        if self.simulacion is not None:
+            self.simulacion.iniciar()
+        # El trabajo lo hacen el planificador y la simulación; el thread principal solo espera
         try:
             while True:
-                time.sleep(0.1)
-                for nombre, namespace in self.namespaces.items():
-                    namespace.monitorea_alarma()
+                time.sleep(1.0)
         finally:
+            if self.simulacion is not None:
+                self.simulacion.detener()
+            self.planificador.detener()
             self.server.stop()
 
 
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Servidor OPC UA de los cuatro tanques')
+    parser.add_argument('--estaciones', type=int, default=None,
+                        help='Cantidad de estaciones (Proceso_Tanques_1..N); sin indicar, una sola en Proceso_Tanques')
+    parser.add_argument('--tanques', type=int, default=4, help='Tanques por estación')
+    parser.add_argument('--endpoint', default="opc.tcp://localhost:4840/freeopcua/server/")
+    parser.add_argument('--simulacion-local', action='store_true',
+                        help='Simula las plantas dentro del servidor (no se usa QuadrupleTank.py como cliente)')
+    parser.add_argument('--Ts', type=float, default=0.01, help='Paso de la simulación local [s]')
+    parser.add_argument('--corregir-deadband', action='store_true',
+                        help='Banda muerta respecto al último valor notificado (parche de python-opcua 0.98.13)')
+    args = parser.parse_args()
 
-server = Servidor_OPCUA()
-server.new_namespace(uri='Tanques', namespace=TanquesNamespace, nombre='Tanques')
-#server.new_namespace(uri='Espesador', namespace=EspesadorNamespace, nombre='Espesador')
-server.start()
-
+    server = Servidor_OPCUA(endpoint=args.endpoint)
+    if args.estaciones is None:
+        server.new_namespace(uri='Tanques', namespace=TanquesNamespace, nombre='Tanques')
+    else:
+        server.new_estaciones(uri='Tanques', n_estaciones=args.estaciones, n_tanques=args.tanques)
+    #server.new_namespace(uri='Espesador', namespace=EspesadorNamespace, nombre='Espesador')
+    if args.simulacion_local:
+        server.simular_localmente(Ts=args.Ts)
+    server.start(corregir_deadband=args.corregir_deadband)
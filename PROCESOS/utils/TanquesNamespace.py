@@ -1,9 +1,12 @@
 from opcua import ua, Server
 import time
 import threading
-from opcua.server.history_sql import HistorySQLite
+from datetime import timedelta
+from historial_sql import HistorialSQLite
 import os
 import random
+from despachador import Despachador
+import monitoreo
 
 '''
 *********************************************** Servidor OPC-UA ***********************************************************
@@ -17,107 +20,313 @@ El servidor presenta las siguientes funcionalidades:
     - Buffer circular -> En un buffer circular se guarda el historial inmediato de las variables, útil para el preprocesamiento
                         edge y por batch, el cliente después solo debe leer estas variables.
 '''
+# Configuración de alarmas por tipo de variable ('h', 'T') o por variable ('Tanque1.h').
+# umbral y dir ('menor'/'mayor') definen la condición; histeresis es la banda que debe
+# recuperar la variable para normalizarse; debounce [s] el tiempo que la condición debe
+# mantenerse antes de cambiar de estado; reanuncio [s] el periodo con que se repite el
+# evento mientras la alarma sigue activa (None: solo en transiciones).
+CONFIG_ALARMAS = {
+    'h': {'umbral': 10, 'dir': 'menor', 'histeresis': 1.0, 'debounce': 0.5, 'reanuncio': 10.0},
+    'T': {'umbral': 40, 'dir': 'mayor', 'histeresis': 1.0, 'debounce': 0.5, 'reanuncio': 10.0},
+}
+
+# Retención del historial: un día de laboratorio a 10 Hz en 12 variables son ~10 millones de filas
+RETENCION_HISTORIAL = timedelta(days=7)
+MAX_FILAS_HISTORIAL = 5000000 # por variable
+
+
+class EstadoAlarma():
+    def __init__(self, nombre, umbral, dir='menor', histeresis=0.0, debounce=0.0, reanuncio=None):
+        self.nombre = nombre
+        self.umbral = umbral
+        self.dir = dir
+        self.histeresis = histeresis
+        self.debounce = debounce
+        self.reanuncio = reanuncio
+
+        self.activa = False
+        self.valor = None
+        self._candidato = None       # estado al que se quiere pasar y desde cuándo
+        self._desde = None
+        self._ultimo_anuncio = None
+        self._transicion = False
+
+    def _condicion(self, val):
+        # Con la alarma activa el umbral se corre en la histéresis para evitar oscilaciones
+        if self.dir == 'menor':
+            return val < self.umbral + self.histeresis if self.activa else val <= self.umbral
+        return val > self.umbral - self.histeresis if self.activa else val >= self.umbral
+
+    def actualizar(self, val, t):
+        self.valor = val
+        objetivo = self._condicion(val)
+        if objetivo == self.activa:
+            self._candidato = None
+        elif self._candidato != objetivo:
+            self._candidato = objetivo
+            self._desde = t
+        self.evaluar(t)
+
+    # Confirma el cambio de estado si la condición se mantuvo al menos `debounce` segundos
+    def evaluar(self, t):
+        if self._candidato is not None and t - self._desde >= self.debounce:
+            self.activa = self._candidato
+            self._candidato = None
+            self._transicion = True
+
+    # Retorna 'activa', 'normalizada', 'reanuncio' o None según corresponda anunciar
+    def anuncio(self, t):
+        if self._transicion:
+            self._transicion = False
+            self._ultimo_anuncio = t
+            return 'activa' if self.activa else 'normalizada'
+        if self.activa and self.reanuncio is not None and t - self._ultimo_anuncio >= self.reanuncio:
+            self._ultimo_anuncio = t
+            return 'reanuncio'
+        return None
+
+
+class MotorAlarmas():
+    '''Estados de alarma por variable, actualizados desde las suscripciones y consultados en el loop del servidor.'''
+    def __init__(self, config=None):
+        self.config = dict(CONFIG_ALARMAS)
+        if config:
+            self.config.update(config)
+        self.estados = {}
+        self._lock = threading.Lock()
+        self.al_cambiar = None  # se llama tras cada notificación (p. ej. para disparar la tarea de alarmas)
+
+    def agregar(self, nombre, tipo):
+        params = dict(self.config[tipo])
+        params.update(self.config.get(nombre, {}))
+        self.estados[nombre] = EstadoAlarma(nombre, **params)
+
+    def configurar(self, nombre, **params):
+        with self._lock:
+            for clave, valor in params.items():
+                setattr(self.estados[nombre], clave, valor)
+
+    def notificar(self, nombre, val):
+        with self._lock:
+            self.estados[nombre].actualizar(float(val), time.time())
+        if self.al_cambiar is not None:
+            self.al_cambiar()
+
+    # Próximo instante (epoch) en que hay algo que anunciar: transición pendiente, fin de un
+    # debounce o reanuncio. None si no hay nada programado
+    def proximo_vencimiento(self):
+        with self._lock:
+            instantes = []
+            for estado in self.estados.values():
+                if estado._transicion:
+                    instantes.append(time.time())
+                if estado._candidato is not None:
+                    instantes.append(estado._desde + estado.debounce)
+                if estado.activa and estado.reanuncio is not None and estado._ultimo_anuncio is not None:
+                    instantes.append(estado._ultimo_anuncio + estado.reanuncio)
+            return min(instantes) if instantes else None
+
+    def anuncios(self, t):
+        with self._lock:
+            pendientes = []
+            for estado in self.estados.values():
+                estado.evaluar(t)
+                tipo = estado.anuncio(t)
+                if tipo is not None:
+                    pendientes.append((estado.nombre, tipo, estado.valor))
+            return pendientes
+
+    def activas(self):
+        with self._lock:
+            return [nombre for nombre, estado in self.estados.items() if estado.activa]
+
+
 # Subscription Handler
 class SubHandler(object):
 
     """
     Subscription Handler. To receive events from server for a subscription
     """
-    def __init__(self, th, dir):
-        self.th = th
-        self.dir = dir
+    def __init__(self, motor):
+        self.motor = motor
+        # Pool fijo con mapa NodeId -> 'Tanque1.h' llenado en subscripciones(); un worker mantiene el orden
+        self.despachador = Despachador(self.motor.notificar, n_workers=1, nombre='alarmas')
+        # Banda muerta absoluta por NodeId, respecto al último valor notificado (None: sin banda)
+        self.bandas = {}
+        self._notificados = {}
 
     def datachange_notification(self, node, val, data):
-        thread_handler = threading.Thread(target=funcion_handler, args=(node, val, self.th, self.dir))
-        thread_handler.start()
+        banda = self.bandas.get(node.nodeid)
+        if banda is not None:
+            anterior = self._notificados.get(node.nodeid)
+            if anterior is not None and abs(val - anterior) <= banda:
+                return
+            self._notificados[node.nodeid] = val
+        self.despachador.enviar(node, val)
         #print("Python: New data change event", node, val)
 
     def event_notification(self, event):
         print("Python: New event", event)
 
 
-mensaje_alarma = ''
-alarma1 = False
-alarma2 = False
-alarma3 = False
-alarma4 = False
-valor_alarma = 0
-def funcion_handler(node, val, th, dir):
-    global mensaje_alarma, alarma1,alarma2, alarma3, alarma4, valor_alarma
-    padre = node.get_parent().get_display_name().Text
-    if (dir == 'menor' and val <= th) or (dir == 'mayor' and val >= th):
-        if padre == 'Tanque1':
-            alarma1 = True
-        elif padre == 'Tanque2':
-            alarma2 = True
-        elif padre == 'Tanque3':
-            alarma3 = True
-        elif padre == 'Tanque4':
-            alarma4 = True
-        variable = node.get_display_name().Text
-        mensaje_alarma = 'Alarma en: {}-{} valor: {}'.format(padre, variable, val)
-        valor_alarma = int(val)
-    else:
-        if padre == 'Tanque1':
-            alarma1 = False
-        elif padre == 'Tanque2':
-            alarma2 = False
-        elif padre == 'Tanque3':
-            alarma3 = False
-        elif padre == 'Tanque4':
-            alarma4 = False
+def carpeta_estacion(estacion=None):
+    # Carpeta raíz de una estación; sin id se mantiene el address space original (Proceso_Tanques)
+    return 'Proceso_Tanques' if estacion is None else 'Proceso_Tanques_{}'.format(estacion)
+
+
+# Orden de las componentes del arreglo Estado, con los nombres que usan los clientes
+def componentes_estado(n_tanques=4):
+    n_bombas = max(1, n_tanques // 2)
+    return (['muestra'] + ['H{}'.format(i) for i in range(1, n_tanques + 1)]
+            + ['T{}'.format(i) for i in range(1, n_tanques + 1)]
+            + ['valvula{}'.format(i) for i in range(1, n_bombas + 1)]
+            + ['razon{}'.format(i) for i in range(1, n_bombas + 1)])
+
+
+def crear_historial(server, directorio='historial'):
+    # Historial durable: inserciones por lotes en SQLite WAL con retención por tiempo y tamaño.
+    # Un solo historiador por servidor, compartido por todas las estaciones
+    if not os.path.exists(directorio):
+        os.makedirs(directorio)
+    db = HistorialSQLite("{}/Tanques_historial.sql".format(directorio), retencion=RETENCION_HISTORIAL,
+                         max_filas_por_nodo=MAX_FILAS_HISTORIAL)
+    server.iserver.history_manager.set_storage(db) # Se dice que en esta base de datos se guardará el historial
+    return db
+
+
+class _CreadorNodos():
+    '''
+    Acumula los AddNodesItem de una estación y los crea con un único servicio AddNodes.
+    Los NodeIds son de texto y siguen la ruta ('Proceso_Tanques_3.Tanques.Tanque1.h'), por lo que
+    no dependen del orden de creación ni de las demás estaciones.
+    '''
+    def __init__(self, server, idx):
+        self.server = server
+        self.idx = idx
+        self.items = []
+        self._carpetas = {ua.NodeId(ua.ObjectIds.ObjectsFolder)}
+
+    def _nodeid(self, padre, nombre):
+        if padre.NamespaceIndex == self.idx:
+            return ua.NodeId('{}.{}'.format(padre.Identifier, nombre), self.idx)
+        return ua.NodeId(nombre, self.idx)
+
+    def _item(self, padre, nombre, clase, tipo, attrs):
+        item = ua.AddNodesItem()
+        item.RequestedNewNodeId = self._nodeid(padre, nombre)
+        item.BrowseName = ua.QualifiedName(nombre, self.idx)
+        item.ParentNodeId = padre
+        item.ReferenceTypeId = ua.NodeId(ua.ObjectIds.Organizes if padre in self._carpetas else ua.ObjectIds.HasComponent)
+        item.NodeClass = clase
+        item.TypeDefinition = ua.NodeId(tipo)
+        attrs.DisplayName = ua.LocalizedText(nombre)
+        attrs.Description = ua.LocalizedText(nombre)
+        item.NodeAttributes = attrs
+        self.items.append(item)
+        return item.RequestedNewNodeId
+
+    def carpeta(self, padre, nombre):
+        nodeid = self._item(padre, nombre, ua.NodeClass.Object, ua.ObjectIds.FolderType, ua.ObjectAttributes())
+        self._carpetas.add(nodeid)
+        return nodeid
+
+    def objeto(self, padre, nombre):
+        return self._item(padre, nombre, ua.NodeClass.Object, ua.ObjectIds.BaseObjectType, ua.ObjectAttributes())
+
+    def _atributos_variable(self, valor, tipo=None):
+        attrs = ua.VariableAttributes()
+        attrs.Value = ua.Variant(valor, tipo)
+        attrs.DataType = ua.NodeId(attrs.Value.VariantType.value)
+        if isinstance(valor, list):
+            attrs.ValueRank = ua.ValueRank.OneDimension
+            attrs.ArrayDimensions = [len(valor)]
+        else:
+            attrs.ValueRank = ua.ValueRank.Scalar
+        attrs.AccessLevel = ua.AccessLevel.CurrentRead.mask
+        attrs.UserAccessLevel = attrs.AccessLevel
+        return attrs
+
+    def variable(self, padre, nombre, valor, tipo=None):
+        # Escribible desde la creación (equivale a set_writable(), sin un Write extra por variable);
+        # una lista crea un arreglo de una dimensión con su largo fijo
+        attrs = self._atributos_variable(valor, tipo)
+        attrs.AccessLevel |= ua.AccessLevel.CurrentWrite.mask
+        attrs.UserAccessLevel = attrs.AccessLevel
+        return self._item(padre, nombre, ua.NodeClass.Variable, ua.ObjectIds.BaseDataVariableType, attrs)
+
+    def propiedad(self, padre, nombre, valor, tipo=None):
+        # Solo lectura, colgada con HasProperty
+        nodeid = self._item(padre, nombre, ua.NodeClass.Variable, ua.ObjectIds.PropertyType,
+                            self._atributos_variable(valor, tipo))
+        self.items[-1].ReferenceTypeId = ua.NodeId(ua.ObjectIds.HasProperty)
+        return nodeid
+
+    def crear(self):
+        for resultado in self.server.iserver.isession.add_nodes(self.items):
+            resultado.StatusCode.check()
+        self.items = []
 
 
 class TanquesNamespace:
-    def __init__(self, objects, idx, server):
+    def __init__(self, objects, idx, server, config_alarmas=None, config_monitoreo=None,
+                 estacion=None, n_tanques=4, historial=None):
         self.server = server
         self.objects = objects
         self.idx = idx
+        self.estacion = estacion
+        self.n_tanques = n_tanques
+        self.carpeta = carpeta_estacion(estacion)
+        self.config_monitoreo = config_monitoreo  # sobre monitoreo.CONFIG_MONITOREO, por tipo o por 'Tanque1.h'
         ################################### Llenado del address space ##########################################################
         T_init = 22
         H_init = 50
+        n_bombas = max(1, n_tanques // 2)  # una válvula y una razón por cada par de tanques
+
+        # Todo el address space de la estación se crea con un solo AddNodes
+        creador = _CreadorNodos(self.server, self.idx)
 
         # Carpeta principal
-        proceso_tanques = self.objects.add_folder(self.idx, 'Proceso_Tanques')
+        proceso_tanques = creador.carpeta(self.objects.nodeid, self.carpeta)
 
         # Tanques
-        Tanques = proceso_tanques.add_folder(self.idx, 'Tanques')
-        Tanque1 = Tanques.add_object(self.idx, 'Tanque1')
-        Tanque2 = Tanques.add_object(self.idx, 'Tanque2')
-        Tanque3 = Tanques.add_object(self.idx, 'Tanque3')
-        Tanque4 = Tanques.add_object(self.idx, 'Tanque4')
-        self.Tanques_list = [Tanque1, Tanque2, Tanque3, Tanque4]
-        self.niveles = []
-        self.temperaturas = []
-        for Tanque in self.Tanques_list:
-            var = Tanque.add_variable(self.idx, 'h', H_init)
-            var2 = Tanque.add_variable(self.idx, 'T', T_init)
-            var.set_writable()
-            var2.set_writable()
-            self.niveles.append(var)
-            self.temperaturas.append(var2)
+        Tanques = creador.carpeta(proceso_tanques, 'Tanques')
+        niveles, temperaturas = [], []
+        for i in range(1, n_tanques + 1):
+            Tanque = creador.objeto(Tanques, 'Tanque{}'.format(i))
+            niveles.append(creador.variable(Tanque, 'h', H_init))
+            temperaturas.append(creador.variable(Tanque, 'T', T_init))
 
         # Pumps
-        Valvulas = proceso_tanques.add_folder(self.idx, 'Valvulas')
-        Valvula1 = Valvulas.add_object(self.idx, 'Valvula1')
-        Valvula2 = Valvulas.add_object(self.idx, 'Valvula2')
-        self.Valvulas_list = [Valvula1, Valvula2]
-        self.u_Valvulas = []
-        for Valvula in self.Valvulas_list:
-            var = Valvula.add_variable(self.idx, 'u', 0.4)
-            var.set_writable()
-            self.u_Valvulas.append(var)
+        Valvulas = creador.carpeta(proceso_tanques, 'Valvulas')
+        u_Valvulas = [creador.variable(creador.objeto(Valvulas, 'Valvula{}'.format(i)), 'u', 0.4)
+                      for i in range(1, n_bombas + 1)]
 
         # Razones
-        Razones = proceso_tanques.add_folder(self.idx, 'Razones')
-        Razon1 = Razones.add_object(self.idx, 'Razon1')
-        Razon2 = Razones.add_object(self.idx, 'Razon2')
-        self.Razones_list = [Razon1, Razon2]
-        self.u_Razones = []
-        for Razon in self.Razones_list:
-            var = Razon.add_variable(self.idx, 'gamma', 0.35)
-            var.set_writable()
-            self.u_Razones.append(var)
+        Razones = creador.carpeta(proceso_tanques, 'Razones')
+        u_Razones = [creador.variable(creador.objeto(Razones, 'Razon{}'.format(i)), 'gamma', 0.35)
+                     for i in range(1, n_bombas + 1)]
+
+        # Estado: la muestra completa del simulador en un arreglo que se escribe de una vez,
+        # [muestra, H1..Hn, T1..Tn, valvula1..m, razon1..m] (válvulas y razones aplicadas en ese paso).
+        # Un cliente suscrito a este nodo recibe niveles y temperaturas del mismo instante en una sola
+        # notificación; los nodos escalares se mantienen por compatibilidad
+        self.componentes_estado = componentes_estado(n_tanques)
+        estado = creador.variable(proceso_tanques, 'Estado', [0.0] * len(self.componentes_estado),
+                                  ua.VariantType.Double)
+        creador.propiedad(estado, 'Componentes', list(self.componentes_estado), ua.VariantType.String)
+
+        alarmas = creador.carpeta(proceso_tanques, 'Alarmas')
+        obj = creador.objeto(alarmas, 'Alarma_nivel')
+        creador.crear()
+
+        self.niveles = [self.server.get_node(nodeid) for nodeid in niveles]
+        self.temperaturas = [self.server.get_node(nodeid) for nodeid in temperaturas]
+        self.u_Valvulas = [self.server.get_node(nodeid) for nodeid in u_Valvulas]
+        self.u_Razones = [self.server.get_node(nodeid) for nodeid in u_Razones]
+        self.estado = self.server.get_node(estado)
+        self.Tanques_list = [nodo.get_parent() for nodo in self.niveles]
+        self.Valvulas_list = [nodo.get_parent() for nodo in self.u_Valvulas]
+        self.Razones_list = [nodo.get_parent() for nodo in self.u_Razones]
 
 
         ############################################ Eventos y alarmas ########################################################
@@ -125,54 +334,87 @@ class TanquesNamespace:
         Servidor se suscribe a cambios en el nivel de los tanques y temperaturas, 
          de manera que si el nivel es inferior a un threshold dispara una alarma
         '''
-        # Creación de la alarma
-        alarmas = proceso_tanques.add_folder(self.idx, 'Alarmas')
-        obj = alarmas.add_object(self.idx, 'Alarma_nivel')
-        alarm_type = self.server.create_custom_event_type(self.idx, 'Alarma_nivel', ua.ObjectIds.BaseEventType,
-                                                [('Nivel', ua.VariantType.Float),
-                                                 ('Mensaje', ua.VariantType.String)])
+        # Creación de la alarma (el tipo de evento es uno solo para todas las estaciones)
+        try:
+            alarm_type = self.server.get_root_node().get_child(
+                ['0:Types', '0:EventTypes', '0:BaseEventType', '{}:Alarma_nivel'.format(self.idx)])
+        except ua.UaError:
+            alarm_type = self.server.create_custom_event_type(self.idx, 'Alarma_nivel', ua.ObjectIds.BaseEventType,
+                                                    [('Nivel', ua.VariantType.Float),
+                                                     ('Mensaje', ua.VariantType.String)])
 
 
-        self.alarma_nivel = self.server.get_event_generator(alarm_type, obj)
+        self.alarma_nivel = self.server.get_event_generator(alarm_type, self.server.get_node(obj))
+        self.alarmas = MotorAlarmas(config_alarmas)
+        for i in range(len(self.niveles)):
+            self.alarmas.agregar('Tanque{}.h'.format(i + 1), 'h')
+            self.alarmas.agregar('Tanque{}.T'.format(i + 1), 'T')
 
 
         # Se inicial el buffer para guardar datos recientes de cada una de las variables y poder hacer preprocesamiento por batch
-        directorio = 'historial'
-        if not os.path.exists(directorio):
-            os.makedirs(directorio)
-
-        db = HistorySQLite("{}/Tanques_historial.sql".format(directorio))
-        self.server.iserver.history_manager.set_storage(db) # Se dice que en esta base de datos se guardará el historial
+        self.historial = historial if historial is not None else crear_historial(self.server)
 
 
 
     def subscripciones(self):
-        # Suscripción a los cambios de valor de los niveles y temperaturas simuladas
-        th1 = 10
-        th2 = 40
-        handler_niveles = SubHandler(th1, 'menor') # Qué es lo que activa la alarma
-        handler_temperaturas = SubHandler(th2, 'mayor')
+        # Suscripción a los cambios de valor de los niveles y temperaturas simuladas; los umbrales,
+        # histéresis y debounce de cada variable están en el motor de alarmas (CONFIG_ALARMAS)
+        handler = SubHandler(self.alarmas)
 
-        sub_niveles = self.server.create_subscription(100, handler_niveles) # Revisa cada 1000 milisegundos la variables
-        sub_temperaturas = self.server.create_subscription(100, handler_temperaturas)
+        nodos = {}
+        for i in range(len(self.niveles)):
+            nodos['Tanque{}.h'.format(i + 1)] = self.niveles[i]
+            nodos['Tanque{}.T'.format(i + 1)] = self.temperaturas[i]
+        # La banda muerta de cada variable (monitoreo.py) la aplica el handler respecto al último valor
+        # notificado: el servidor de python-opcua compara cada escritura con la anterior y, con la
+        # simulación escribiendo cada 10 ms, ningún paso de nivel la supera. Al servidor se le piden sin banda
+        config = dict(self.config_monitoreo or {})
+        for nombre, var in nodos.items(): # Nombres registrados una sola vez, sin navegar en cada notificación
+            handler.despachador.registrar(var.nodeid, nombre)
+            handler.bandas[var.nodeid] = monitoreo.deadband_absoluto(monitoreo.parametros(nombre, self.config_monitoreo))
+            config[nombre] = dict(config.get(nombre, {}), deadband=None)
 
+        # Una suscripción por intervalo de muestreo: en régimen permanente las variaciones mínimas
+        # de nivel no llegan al motor de alarmas
+        self.subs_alarmas = []
+        for muestreo, grupo in monitoreo.agrupar(nodos, config).items():
+            sub = self.server.create_subscription(muestreo, handler)
+            for resultado in sub.create_monitored_items(monitoreo.pedidos(ua, nodos, grupo)):
+                if isinstance(resultado, ua.StatusCode):
+                    resultado.check()
+            self.subs_alarmas.append(sub)
 
-        for i in range(len(self.niveles)): # FInalmente se realizan las subscripciones
-            sub_niveles.subscribe_data_change(self.niveles[i])
-            sub_temperaturas.subscribe_data_change(self.temperaturas[i])
+        # Subscripción de variables cuyo historial será monitorieado (la retención la aplica el historiador)
+        for var in self.niveles + self.temperaturas + self.u_Valvulas + self.u_Razones:
+            self.server.historize_node_data_change(var, period=None, count=0)
 
-        # Subscripción de variables cuyo historial será monitorieado
-        cantidad_guardada = 100
-        for i in range(len(self.niveles)):
-            self.server.historize_node_data_change(self.niveles[i], period=None, count=cantidad_guardada)
-            self.server.historize_node_data_change(self.temperaturas[i], period=None, count=cantidad_guardada)
+    # Las alarmas se revisan cuando llega un cambio y vence un debounce o reanuncio, en ese instante
+    # y no en el siguiente múltiplo de 100 ms; la ejecución periódica queda como respaldo
+    def registrar_tareas(self, planificador, periodo=1.0, plazo=0.05):
+        nombre = '{}.alarmas'.format(self.carpeta)
+
+        def programar():
+            vencimiento = self.alarmas.proximo_vencimiento()
+            if vencimiento is not None:
+                planificador.disparar(nombre, vencimiento)
+
+        def tarea():
+            self.monitorea_alarma()
+            programar()
+
+        planificador.periodica(nombre, tarea, periodo, plazo)
+        self.alarmas.al_cambiar = programar
 
+    # Solo se generan eventos en las transiciones de estado y, con la alarma activa, cada `reanuncio` s
     def monitorea_alarma(self):
-        global alarma, valor_alarma, mensaje_alarma
-        if alarma1 or alarma2 or alarma3 or alarma4:
-            self.alarma_nivel.event.Message = ua.LocalizedText("Alarma")
-            self.alarma_nivel.event.Severity = valor_alarma
-            self.alarma_nivel.event.Nivel = float(valor_alarma)
-            self.alarma_nivel.event.Mensaje = mensaje_alarma
-            self.alarma_nivel.trigger(message=mensaje_alarma)
-            #print(self.alarma_nivel)
+        for nombre, tipo, valor in self.alarmas.anuncios(time.time()):
+            padre, variable = nombre.split('.')
+            if tipo == 'normalizada':
+                mensaje = 'Normalizada: {}-{} valor: {}'.format(padre, variable, valor)
+            else:
+                mensaje = 'Alarma en: {}-{} valor: {}'.format(padre, variable, valor)
+            self.alarma_nivel.event.Message = ua.LocalizedText(mensaje)
+            self.alarma_nivel.event.Severity = int(valor)
+            self.alarma_nivel.event.Nivel = float(valor)
+            self.alarma_nivel.event.Mensaje = mensaje
+            self.alarma_nivel.trigger(message=mensaje)
@@ -0,0 +1,163 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from opc_client_async import ClienteAsync
+
+'''
+Benchmark de carga del servidor multi-estación.
+
+Para cada cantidad de estaciones se levanta ServidorOPC.py --estaciones N en otro proceso (con
+su historial en un directorio temporal) y desde este proceso se simulan N plantas escribiendo
+niveles y temperaturas a 10 Hz, un ClienteAsync por estación con todas las escrituras del
+periodo en vuelo a la vez. Cada estación se suscribe a su H1, que lleva el instante de escritura,
+para medir la latencia escritura -> notificación.
+
+Por N se reporta: escrituras/s logradas, periodos atrasados del generador, latencia p50/p95/máx
+y notificaciones perdidas; al final, la mayor cantidad de estaciones sin degradación.
+Si los periodos atrasados crecen antes que la latencia, el límite es el generador y no el servidor.
+
+    python benchmark_estaciones.py --estaciones 1 5 10 20 40 --duracion 10
+'''
+
+ENDPOINT = "opc.tcp://localhost:4841/freeopcua/server/"
+
+# H1 se notifica completo (sin banda muerta ni coalescencia) para poder contar pérdidas
+CONFIG_MONITOREO_H1 = {'H1': {'muestreo': 20, 'cola': 0, 'deadband': None}}
+
+
+class _Latencias():
+    def __init__(self, t_base):
+        self.t_base = t_base
+        self.muestras = []
+
+    def datachange_notification(self, node, val, data):
+        self.muestras.append(time.time() - self.t_base - val)
+
+    def event_notification(self, event):
+        pass
+
+
+def _percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(p / 100.0 * len(valores)))]
+
+
+def _iniciar_servidor(n, n_tanques, directorio):
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ServidorOPC.py')
+    return subprocess.Popen([sys.executable, script, '--estaciones', str(n), '--tanques', str(n_tanques),
+                             '--endpoint', ENDPOINT], cwd=directorio,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def _conectar(n, n_tanques, espera_max=60.0):
+    # Se reintenta mientras el servidor termina de crear las estaciones
+    limite = time.time() + espera_max
+    while True:
+        clientes = [ClienteAsync(ENDPOINT, suscribir_eventos=False, estacion=i, n_tanques=n_tanques)
+                    for i in range(1, n + 1)]
+        with contextlib.redirect_stdout(io.StringIO()):  # sin el mensaje de conexión de cada cliente
+            await asyncio.gather(*(cliente.conectar() for cliente in clientes))
+        if all(cliente._connected for cliente in clientes):
+            return clientes
+        await asyncio.gather(*(cliente.desconectar() for cliente in clientes if cliente._connected))
+        if time.time() > limite:
+            raise ConnectionError('El servidor con {} estaciones no respondió'.format(n))
+        await asyncio.sleep(1.0)
+
+
+async def _carga(clientes, frecuencia, duracion):
+    t_base = time.time()
+    medidor = _Latencias(t_base)
+    for cliente in clientes:
+        cliente.config_monitoreo = CONFIG_MONITOREO_H1
+        await cliente._suscribir(medidor, ['H1'])
+    await asyncio.sleep(0.5)
+    medidor.muestras.clear()  # valores iniciales de la suscripción
+
+    periodo = 1.0 / frecuencia
+    periodos = atrasos = 0
+    t_inicio = siguiente = time.time()
+    while time.time() - t_inicio < duracion:
+        valores = {key: 20.0 + random.uniform(-0.01, 0.01) for key in clientes[0].alturas}
+        valores.update({key: 22 + random.randrange(-7, 7) for key in clientes[0].temperaturas})
+        valores['H1'] = time.time() - t_base
+        await asyncio.gather(*(cliente.escribir_varios(valores) for cliente in clientes))
+        periodos += 1
+        siguiente += periodo
+        espera = siguiente - time.time()
+        if espera > 0:
+            await asyncio.sleep(espera)
+        else:
+            atrasos += 1
+    t_total = time.time() - t_inicio
+    await asyncio.sleep(1.0)  # notificaciones en vuelo
+
+    esperadas = periodos * len(clientes)
+    latencias = medidor.muestras or [float('nan')]
+    return {'estaciones': len(clientes),
+            'escrituras_s': esperadas / t_total,
+            'objetivo_s': frecuencia * len(clientes),
+            'atrasos': atrasos / max(periodos, 1),
+            'lat_p50': _percentil(latencias, 50),
+            'lat_p95': _percentil(latencias, 95),
+            'lat_max': max(latencias),
+            'perdidas': 1.0 - len(medidor.muestras) / max(esperadas, 1)}
+
+
+async def _medir(n, n_tanques, frecuencia, duracion):
+    clientes = await _conectar(n, n_tanques)
+    try:
+        return await _carga(clientes, frecuencia, duracion)
+    finally:
+        await asyncio.gather(*(cliente.desconectar() for cliente in clientes), return_exceptions=True)
+
+
+def degradado(resultado, lat_max_p95):
+    return (resultado['lat_p95'] > lat_max_p95 or resultado['perdidas'] > 0.01
+            or resultado['escrituras_s'] < 0.95 * resultado['objetivo_s'])
+
+
+def benchmark(estaciones, n_tanques=4, frecuencia=10.0, duracion=10.0, lat_max_p95=0.2):
+    resultados = []
+    print('{:>4} {:>14} {:>9} {:>9} {:>9} {:>9} {:>9}'.format(
+        'N', 'escrituras/s', 'atrasos', 'p50 [ms]', 'p95 [ms]', 'máx [ms]', 'perdidas'))
+    for n in estaciones:
+        with tempfile.TemporaryDirectory() as directorio:
+            servidor = _iniciar_servidor(n, n_tanques, directorio)
+            try:
+                resultado = asyncio.run(_medir(n, n_tanques, frecuencia, duracion))
+            finally:
+                servidor.terminate()
+                servidor.wait()
+        resultados.append(resultado)
+        print('{:>4} {:>8.0f}/{:<5.0f} {:>8.1%} {:>9.1f} {:>9.1f} {:>9.1f} {:>8.1%}{}'.format(
+            n, resultado['escrituras_s'], resultado['objetivo_s'], resultado['atrasos'],
+            1e3*resultado['lat_p50'], 1e3*resultado['lat_p95'], 1e3*resultado['lat_max'],
+            resultado['perdidas'], '  <- degradado' if degradado(resultado, lat_max_p95) else ''))
+        if degradado(resultado, lat_max_p95):
+            break
+
+    sostenibles = [r['estaciones'] for r in resultados if not degradado(r, lat_max_p95)]
+    print('Máximo sostenible a {:g} Hz: {} estaciones (p95 < {:.0f} ms, pérdidas < 1%, escrituras >= 95%)'.format(
+        frecuencia, max(sostenibles) if sostenibles else 0, 1e3*lat_max_p95))
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Carga del servidor OPC UA con N estaciones a frecuencia fija')
+    parser.add_argument('--estaciones', type=int, nargs='+', default=[1, 5, 10, 20, 40, 80])
+    parser.add_argument('--tanques', type=int, default=4)
+    parser.add_argument('--frecuencia', type=float, default=10.0, help='Escrituras por estación por segundo')
+    parser.add_argument('--duracion', type=float, default=10.0, help='Segundos de carga por N')
+    parser.add_argument('--lat-p95', type=float, default=0.2, help='Latencia p95 máxima aceptada [s]')
+    args = parser.parse_args()
+    logging.getLogger('asyncua').setLevel(logging.ERROR)
+    benchmark(args.estaciones, args.tanques, args.frecuencia, args.duracion, args.lat_p95)
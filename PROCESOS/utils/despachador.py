@@ -0,0 +1,64 @@
+import queue
+import threading
+
+'''
+Despacho de notificaciones de suscripción OPC UA.
+
+Los SubHandler no deben crear un thread por notificación ni navegar el address space para
+saber qué variable cambió. El Despachador mantiene un pool fijo de workers, cada uno con
+su cola acotada, y un mapa NodeId -> nombre que se llena una sola vez al suscribir.
+Cada NodeId se asigna siempre al mismo worker, por lo que las notificaciones de una misma
+variable se procesan en orden. Un Despachador puede recibir notificaciones de varios threads
+(p. ej. una suscripción por intervalo de muestreo), pero su mapa de nombres es de un solo
+servidor: cada cliente usa el suyo.
+'''
+
+
+class Despachador():
+    def __init__(self, funcion, n_workers=2, capacidad=1000, nombre='despachador'):
+        self.funcion = funcion  # funcion(nombre, val), nombre según el mapa registrado
+        self.n_workers = n_workers
+        self.capacidad = capacidad
+        self.nombre = nombre
+        self.nombres = {}       # NodeId -> nombre
+        self.descartadas = 0    # notificaciones perdidas por cola llena
+        self._colas = []
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def registrar(self, nodeid, nombre):
+        self.nombres[nodeid] = nombre
+
+    # Los workers se crean con la primera notificación; las listas se publican completas
+    def _iniciar(self):
+        with self._lock:
+            if not self._colas:
+                colas = [queue.Queue(maxsize=self.capacidad) for _ in range(self.n_workers)]
+                workers = [threading.Thread(target=self._trabajar, args=(cola,),
+                                            name='{}-{}'.format(self.nombre, i), daemon=True)
+                           for i, cola in enumerate(colas)]
+                for worker in workers:
+                    worker.start()
+                self._workers = workers
+                self._colas = colas
+            return self._colas
+
+    def enviar(self, node, val):
+        # No bloquea al thread de la suscripción: si la cola está llena se descarta y se cuenta
+        colas = self._colas or self._iniciar()
+        nodeid = node.nodeid
+        try:
+            colas[hash(nodeid) % len(colas)].put_nowait((self.nombres.get(nodeid, nodeid.to_string()), val))
+        except queue.Full:
+            with self._lock:
+                self.descartadas += 1
+
+    def _trabajar(self, cola):
+        while True:
+            nombre, val = cola.get()
+            try:
+                self.funcion(nombre, val)
+            except Exception as e:
+                print('Error en {} procesando {}: {}'.format(self.nombre, nombre, e))
+            finally:
+                cola.task_done()
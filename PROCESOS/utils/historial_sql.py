@@ -0,0 +1,178 @@
+import logging
+import sqlite3
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from opcua import ua
+from opcua.ua.ua_binary import variant_from_binary, variant_to_binary
+from opcua.common.utils import Buffer
+from opcua.server.history import HistoryStorageInterface
+
+'''
+Historiador del servidor OPC UA sobre SQLite en modo WAL.
+
+A diferencia de HistorySQLite (una tabla por nodo, un INSERT + COMMIT + DELETE por cada
+cambio), los valores se acumulan en memoria y un thread los inserta por lotes en una sola
+transacción. Todos los nodos comparten una tabla con índice (nodo, ts), por lo que las
+consultas HistoryRead por rango siguen siendo rápidas con millones de filas. La retención
+(por tiempo y por cantidad de filas por nodo) se aplica periódicamente, no en cada inserción,
+y siempre por rangos del índice: la cantidad de filas por nodo se cuenta una sola vez y luego
+se lleva en memoria, así el tope solo borra cuando se excede.
+Solo historiza valores (no eventos).
+'''
+
+_EPOCH = datetime(1970, 1, 1)
+
+def _a_us(fecha):
+    return (fecha - _EPOCH) // timedelta(microseconds=1)
+
+def _de_us(us):
+    return _EPOCH + timedelta(microseconds=us)
+
+
+class HistorialSQLite(HistoryStorageInterface):
+    def __init__(self, path, retencion=timedelta(days=7), max_filas_por_nodo=None,
+                 periodo_escritura=1.0, tam_lote=5000, periodo_limpieza=60.0):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.retencion = retencion                  # timedelta o None
+        self.max_filas_por_nodo = max_filas_por_nodo  # int o None
+        self.periodo_escritura = periodo_escritura  # s entre escrituras de lotes
+        self.tam_lote = tam_lote                    # escribe antes si se acumulan más filas
+        self.periodo_limpieza = periodo_limpieza    # s entre aplicaciones de la retención
+
+        self._retencion_nodo = {}  # node_id -> (period, count) pedidos en historize_node_data_change
+        self._filas = {}           # node_id -> filas en la base (solo nodos con tope, tras contarlas)
+        self._pendientes = []
+        self._lock_pendientes = threading.Lock()
+        self._lock_db = threading.Lock()
+        self._hay_lote = threading.Event()
+        self._detener = threading.Event()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS historial (nodo TEXT NOT NULL, ts INTEGER NOT NULL,'
+                           ' server_ts INTEGER, status INTEGER, valor BLOB)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS historial_nodo_ts ON historial (nodo, ts)')
+        self._conn.commit()
+
+        self._escritor = threading.Thread(target=self._escribir, name='historial_sql', daemon=True)
+        self._escritor.start()
+
+    def new_historized_node(self, node_id, period, count=0):
+        self._retencion_nodo[node_id.to_string()] = (period, count)
+
+    def save_node_value(self, node_id, datavalue):
+        ts = datavalue.SourceTimestamp or datavalue.ServerTimestamp or datetime.utcnow()
+        fila = (node_id.to_string(), _a_us(ts),
+                _a_us(datavalue.ServerTimestamp) if datavalue.ServerTimestamp else None,
+                datavalue.StatusCode.value, sqlite3.Binary(variant_to_binary(datavalue.Value)))
+        with self._lock_pendientes:
+            self._pendientes.append(fila)
+            if len(self._pendientes) >= self.tam_lote:
+                self._hay_lote.set()
+
+    # Inserta todas las filas pendientes en una sola transacción
+    def _vaciar(self):
+        with self._lock_pendientes:
+            lote, self._pendientes = self._pendientes, []
+        if not lote:
+            return 0
+        with self._lock_db:
+            try:
+                with self._conn:
+                    self._conn.executemany('INSERT INTO historial VALUES (?, ?, ?, ?, ?)', lote)
+            except sqlite3.Error as e:
+                self.logger.error('Error al escribir lote de historial (%d filas): %s', len(lote), e)
+                return 0
+            for nodo, n in Counter(fila[0] for fila in lote).items():
+                if nodo in self._filas:
+                    self._filas[nodo] += n
+        return len(lote)
+
+    def _limpiar(self):
+        ahora = datetime.utcnow()
+        with self._lock_db:
+            try:
+                with self._conn:
+                    # Todo nodo que se historiza pasa por new_historized_node: se limpia nodo por nodo
+                    for nodo, (period, count) in self._retencion_nodo.items():
+                        cortes = [ahora - p for p in (self.retencion, period) if p]
+                        borradas = 0
+                        if cortes:
+                            borradas = self._conn.execute('DELETE FROM historial WHERE nodo = ? AND ts < ?',
+                                                          (nodo, _a_us(max(cortes)))).rowcount
+                        limite = count or self.max_filas_por_nodo
+                        if limite:
+                            self._aplicar_tope(nodo, limite, borradas)
+            except sqlite3.Error as e:
+                self._filas = {}  # se vuelven a contar en la próxima limpieza
+                self.logger.error('Error al aplicar retención del historial: %s', e)
+
+    # Con _lock_db tomado: borra las filas más antiguas del nodo que exceden el tope
+    def _aplicar_tope(self, nodo, limite, borradas):
+        if nodo in self._filas:
+            self._filas[nodo] -= borradas
+        else:
+            self._filas[nodo] = self._conn.execute('SELECT COUNT(*) FROM historial WHERE nodo = ?',
+                                                   (nodo,)).fetchone()[0]
+        exceso = self._filas[nodo] - limite
+        if exceso > 0:
+            self._filas[nodo] -= self._conn.execute('DELETE FROM historial WHERE rowid IN (SELECT rowid FROM historial'
+                                                    ' WHERE nodo = ? ORDER BY ts LIMIT ?)', (nodo, exceso)).rowcount
+
+    def _escribir(self):
+        ultima_limpieza = datetime.utcnow()
+        while not self._detener.is_set():
+            self._hay_lote.wait(self.periodo_escritura)
+            self._hay_lote.clear()
+            self._vaciar()
+            if (datetime.utcnow() - ultima_limpieza).total_seconds() >= self.periodo_limpieza:
+                self._limpiar()
+                ultima_limpieza = datetime.utcnow()
+
+    def read_node_history(self, node_id, start, end, nb_values):
+        self._vaciar()  # lo pendiente también debe ser visible para el HistoryRead
+        orden = 'ASC'
+        if start is None or start == ua.get_win_epoch():
+            orden = 'DESC'
+            start = ua.get_win_epoch()
+        if end is None or end == ua.get_win_epoch():
+            end = datetime.utcnow() + timedelta(days=1)
+        if start < end:
+            desde, hasta = _a_us(start), _a_us(end)
+        else:
+            orden = 'DESC'
+            desde, hasta = _a_us(end), _a_us(start)
+        limite = nb_values + 1 if nb_values else -1  # una fila extra para el punto de continuación
+
+        resultados = []
+        with self._lock_db:
+            try:
+                filas = self._conn.execute('SELECT ts, server_ts, status, valor FROM historial WHERE nodo = ? AND'
+                                           ' ts BETWEEN ? AND ? ORDER BY ts {} LIMIT ?'.format(orden),
+                                           (node_id.to_string(), desde, hasta, limite)).fetchall()
+            except sqlite3.Error as e:
+                self.logger.error('Error al leer historial de %s: %s', node_id, e)
+                filas = []
+        for ts, server_ts, status, valor in filas:
+            dv = ua.DataValue(variant_from_binary(Buffer(valor)))
+            dv.SourceTimestamp = _de_us(ts)
+            dv.ServerTimestamp = _de_us(server_ts) if server_ts is not None else None
+            dv.StatusCode = ua.StatusCode(status)
+            resultados.append(dv)
+
+        cont = None
+        if nb_values and len(resultados) > nb_values:
+            cont = resultados[nb_values].SourceTimestamp
+            resultados = resultados[:nb_values]
+        return resultados, cont
+
+    def stop(self):
+        self._detener.set()
+        self._hay_lote.set()
+        self._escritor.join(timeout=5)
+        self._vaciar()
+        with self._lock_db:
+            self._conn.close()
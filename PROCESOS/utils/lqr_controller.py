@@ -0,0 +1,158 @@
+import os
+import pickle
+import time
+import numpy as np
+try:
+    from utils.QuadrupleTank import QuadrupleTank
+except ImportError:  # ejecutado desde utils/
+    from QuadrupleTank import QuadrupleTank
+
+'''
+Control óptimo LQR con acción integral para h1 y h2, con ganancias programadas (gain scheduling).
+
+En cada punto de una grilla (h1, h2, γ1, γ2) se linealiza QuadrupleTank en su equilibrio, se
+discretiza con el periodo de control y se agrega un integrador del error de h1 y de h2:
+    [dx; z]⁺ = [[A, 0], [Ts C, I]] [dx; z] + [B; 0] du,    du = -K [dx; z]
+La ecuación de Riccati discreta se resuelve fuera de línea para toda la grilla y la tabla
+(K, x0, u0 por punto) se guarda opcionalmente en disco. En línea, TablaLQR.interpolar hace una
+interpolación multilineal entre los 16 vecinos de (referencia, γ medidas): unos microsegundos
+en vez de volver a resolver Riccati. Los puntos sin solución (γ1 + γ2 = 1, donde h1 y h2 no se
+pueden fijar por separado) quedan fuera y se reparte el peso entre los vecinos válidos.
+
+LQRController tiene la interfaz que usa EjecutorControl (compute(mediciones, dt), setpoint,
+reset), con mediciones en el orden de MEDIDAS, igual que MPCController.
+'''
+
+
+class TablaLQR:
+    def __init__(self, alturas=np.arange(5.0, 46.0, 5.0), gammas=np.arange(0.1, 0.91, 0.1), Ts=1.0,
+                 Q=(1.0, 1.0, 0.0, 0.0), Qi=(0.05, 0.05), R=(5.0, 5.0), Hmax=50, voltmax=10, ruta_cache=None):
+        # alturas y gammas: ejes equiespaciados de la grilla (los mismos para h1/h2 y para γ1/γ2)
+        # Q: peso de las desviaciones de h1..h4, Qi: de las integrales del error, R: de du1, du2
+        self.ejes = [np.asarray(alturas, dtype=float)]*2 + [np.asarray(gammas, dtype=float)]*2
+        self.Ts = Ts
+        self.Q = tuple(float(q) for q in Q)
+        self.Qi = tuple(float(q) for q in Qi)
+        self.R = tuple(float(r) for r in R)
+        self.modelo = QuadrupleTank(x0=[0, 0, 0, 0], Hmax=Hmax, voltmax=voltmax)  # solo parámetros
+        self.stats = {'puntos': 0, 'sin_solucion': 0, 'tiempo_calculo': None, 'desde_cache': False}
+
+        # Datos por punto: K (2x6) aplanada, x0 (4), u0 (2) y 1 si el punto es válido (los puntos sin
+        # solución quedan en cero, así la última columna suma el peso válido al interpolar)
+        clave = self._clave()
+        if ruta_cache is not None and os.path.exists(ruta_cache):
+            with open(ruta_cache, 'rb') as f:
+                guardado = pickle.load(f)
+            if guardado.get('clave') == clave:
+                self.datos = guardado['datos']
+                self.stats.update(guardado['stats'], desde_cache=True)
+        if not self.stats['desde_cache']:
+            self.datos = self._calcular()
+            if ruta_cache is not None:
+                with open(ruta_cache, 'wb') as f:
+                    pickle.dump({'clave': clave, 'datos': self.datos, 'stats': self.stats}, f)
+
+        # Para interpolar: tabla aplanada y, por eje, (origen, paso, última celda, paso en la tabla
+        # aplanada) como floats/ints de Python; con 4 escalares es más rápido que operar arreglos
+        forma = self.datos.shape[:-1]
+        self._planos = self.datos.reshape(-1, self.datos.shape[-1])
+        pasos_indice = [int(np.prod(forma[j + 1:], dtype=int)) for j in range(4)]
+        self._ejes_interpolacion = [(float(eje[0]), float(eje[1] - eje[0]), len(eje) - 2, paso_indice)
+                                    for eje, paso_indice in zip(self.ejes, pasos_indice)]
+        self._vertices = np.array([v @ np.array(pasos_indice) for v in np.ndindex(2, 2, 2, 2)])
+
+    def _clave(self):
+        # Identifica la tabla: grilla, pesos y parámetros del modelo
+        m = self.modelo
+        return (tuple(tuple(np.round(eje, 6)) for eje in self.ejes), self.Ts, self.Q, self.Qi, self.R,
+                tuple(m.A), tuple(m.a), m.kin, m.voltmax, m.g, m.time_scaling)
+
+    def _calcular(self):
+        from scipy.linalg import solve_discrete_are
+        t0 = time.perf_counter()
+        Q = np.diag(self.Q + self.Qi)
+        R = np.diag(self.R)
+        C = np.eye(4)[:2]
+        datos = np.zeros(tuple(len(eje) for eje in self.ejes) + (19,))
+        for indice in np.ndindex(datos.shape[:-1]):
+            h1, h2, g1, g2 = (eje[i] for eje, i in zip(self.ejes, indice))
+            try:
+                self.modelo.gamma = [g1, g2]
+                x0, u0 = self.modelo.equilibrio(h1, h2)
+                A, B = self.modelo.linealizar(x0, self.Ts)
+                Aa = np.block([[A, np.zeros((4, 2))], [self.Ts*C, np.eye(2)]])
+                Ba = np.vstack([B, np.zeros((2, 2))])
+                P = solve_discrete_are(Aa, Ba, Q, R)
+                K = np.linalg.solve(R + Ba.T @ P @ Ba, Ba.T @ P @ Aa)
+            except (ValueError, np.linalg.LinAlgError):
+                self.stats['sin_solucion'] += 1
+                continue
+            datos[indice] = np.r_[K.ravel(), x0, u0, 1.0]
+        self.stats['puntos'] = int(np.prod(datos.shape[:-1]))
+        self.stats['tiempo_calculo'] = time.perf_counter() - t0
+        return datos
+
+    def interpolar(self, h1, h2, g1, g2):
+        """Ganancia K (2x6) y punto de operación (x0, u0) en (h1, h2, γ1, γ2), o None si no hay vecinos válidos."""
+        # Celda y posición dentro de ella por eje (fuera de la grilla se usa el borde)
+        base = 0
+        lados = []
+        for valor, (origen, paso, ultima, paso_indice) in zip((h1, h2, g1, g2), self._ejes_interpolacion):
+            posicion = min(max((valor - origen) / paso, 0.0), ultima + 1.0)
+            i = min(int(posicion), ultima)
+            base += i * paso_indice
+            lados.append((1.0 - (posicion - i), posicion - i))
+        # Peso de cada uno de los 16 vértices (mismo orden que np.ndindex(2, 2, 2, 2))
+        (a0, a1), (b0, b1), (c0, c1), (d0, d1) = lados
+        w = np.array([x * y for x in (a0 * b0, a0 * b1, a1 * b0, a1 * b1) for y in (c0 * d0, c0 * d1, c1 * d0, c1 * d1)])
+        v = w @ self._planos[base + self._vertices]
+        if v[-1] < 1e-9:
+            return None
+        v = v[:-1] / v[-1]
+        return v[:12].reshape(2, 6), v[12:16], v[16:18]
+
+
+class LQRController:
+    MEDIDAS = ('H1', 'H2', 'H3', 'H4', 'razon1', 'razon2')
+
+    def __init__(self, tabla=None, output_limits=(0, 0.999), setpoint=(0, 0)):
+        self.tabla = tabla if tabla is not None else TablaLQR()
+        self.Ts = self.tabla.Ts
+        self.setpoint = np.array(np.broadcast_to(np.asarray(setpoint, dtype=float), (2,)))
+        self.u_min = np.array(np.broadcast_to(np.asarray(output_limits[0], dtype=float), (2,)))
+        self.u_max = np.array(np.broadcast_to(np.asarray(output_limits[1], dtype=float), (2,)))
+        self.stats = {'pasos': 0, 'sin_ganancia': 0, 'saturado': 0, 'interpolacion_ultima': None,
+                      'interpolacion_max': 0.0}
+        self.reset()
+
+    def reset(self, canales=None):
+        # Ambas entradas salen de una misma ganancia: se reinicia todo aunque se pida un canal
+        self.z = np.zeros(2)  # integrales del error de h1 y h2
+        self.last_output = np.zeros(2)
+
+    def compute(self, mediciones, dt=None):
+        # dt se ignora: la tabla está calculada con Ts
+        mediciones = np.asarray(mediciones, dtype=float)
+        x = mediciones[:4]
+        gamma = mediciones[4:6] if len(mediciones) >= 6 else self.tabla.modelo.gamma
+
+        t0 = time.perf_counter()
+        ganancia = self.tabla.interpolar(self.setpoint[0], self.setpoint[1], gamma[0], gamma[1])
+        tiempo = time.perf_counter() - t0
+        self.stats['interpolacion_ultima'] = tiempo
+        self.stats['interpolacion_max'] = max(self.stats['interpolacion_max'], tiempo)
+        self.stats['pasos'] += 1
+        if ganancia is None:
+            self.stats['sin_ganancia'] += 1
+            return self.last_output
+        K, x0, u0 = ganancia
+
+        u_libre = u0 - K @ np.r_[x - x0, self.z]
+        u = np.clip(u_libre, self.u_min, self.u_max)
+        # Anti-windup: con la entrada saturada no se integra
+        if np.any(u != u_libre):
+            self.stats['saturado'] += 1
+        else:
+            self.z += self.Ts*(x[:2] - self.setpoint)
+        self.last_output = u
+        return u
@@ -0,0 +1,145 @@
+'''
+Parámetros de monitoreo de las suscripciones OPC UA por variable.
+
+Cada variable se monitorea con un intervalo de muestreo (ms), un tamaño de cola y un
+DataChangeFilter con banda muerta absoluta o en porcentaje del rango de ingeniería.
+Los valores por defecto dependen del tipo de variable ('h', 'T', 'u', 'gamma', 'Estado') y pueden
+sobrescribirse por tipo o por variable ('H1', 'valvula2', 'Tanque3.h', ...).
+
+Las variables con distinto intervalo de muestreo van en suscripciones distintas (una por
+intervalo, con ese periodo de publicación): el servidor muestrea al escribirse el nodo,
+por lo que con cola 1 el intervalo limita a una notificación por variable y periodo.
+La banda muerta en porcentaje se convierte a absoluta con el rango de la variable, ya que
+python-opcua solo implementa la absoluta.
+'''
+import itertools
+
+# Por tipo de variable. deadband None: se notifica toda escritura (también las repetidas)
+CONFIG_MONITOREO = {
+    'h':     {'muestreo': 100,  'cola': 1, 'deadband': 0.1, 'tipo_deadband': 'porcentaje'},  # 0.05 cm
+    'T':     {'muestreo': 1000, 'cola': 1, 'deadband': 0.5, 'tipo_deadband': 'absoluto'},
+    'u':     {'muestreo': 100,  'cola': 1, 'deadband': 0.0, 'tipo_deadband': 'absoluto'},    # solo cambios
+    'gamma': {'muestreo': 100,  'cola': 1, 'deadband': 0.0, 'tipo_deadband': 'absoluto'},
+    # Arreglo Estado: cada escritura es una muestra nueva (cambia el contador), sin banda muerta
+    'Estado': {'muestreo': 100, 'cola': 1, 'deadband': None, 'tipo_deadband': 'absoluto'},
+}
+
+# Rango de ingeniería de cada tipo (para la banda muerta en porcentaje)
+RANGOS = {'h': (0.0, 50.0), 'T': (0.0, 100.0), 'u': (-1.0, 1.0), 'gamma': (0.0, 1.0)}
+
+_TIPOS_CLIENTE = {'H': 'h', 'T': 'T', 'valvula': 'u', 'razon': 'gamma', 'Estado': 'Estado'}
+
+
+# 'H1' -> 'h', 'valvula2' -> 'u', 'Tanque3.h' -> 'h', 'Razon1.gamma' -> 'gamma'
+def tipo_de(nombre):
+    if '.' in nombre:
+        return nombre.split('.')[-1]
+    return _TIPOS_CLIENTE[nombre.rstrip('0123456789')]
+
+
+def parametros(nombre, config=None):
+    """Parámetros de monitoreo de una variable: defecto del tipo < config[tipo] < config[nombre]."""
+    config = config or {}
+    tipo = tipo_de(nombre)
+    params = dict(CONFIG_MONITOREO[tipo])
+    params['rango'] = RANGOS.get(tipo)
+    params.update(config.get(tipo, {}))
+    params.update(config.get(nombre, {}))
+    return params
+
+
+def deadband_absoluto(params):
+    if params['deadband'] is None:
+        return None
+    if params['tipo_deadband'] == 'porcentaje':
+        minimo, maximo = params['rango']
+        return params['deadband'] / 100.0 * (maximo - minimo)
+    return float(params['deadband'])
+
+
+def filtro(ua, params):
+    """DataChangeFilter para los parámetros dados (ua de opcua o de asyncua), None sin banda muerta."""
+    valor = deadband_absoluto(params)
+    if valor is None:
+        return None
+    mfilter = ua.DataChangeFilter()
+    mfilter.Trigger = ua.DataChangeTrigger.StatusValue
+    mfilter.DeadbandType = ua.DeadbandType.Absolute
+    mfilter.DeadbandValue = valor
+    return mfilter
+
+
+def agrupar(nombres, config=None):
+    """{muestreo: [(nombre, params), ...]}: una suscripción por intervalo de muestreo."""
+    grupos = {}
+    for nombre in nombres:
+        params = parametros(nombre, config)
+        grupos.setdefault(params['muestreo'], []).append((nombre, params))
+    return grupos
+
+
+# ClientHandle de los ítems: únicos en el proceso y lejos de los que numera la propia
+# Subscription (desde 200), por si se mezclan con subscribe_data_change
+_handles = itertools.count(1 << 24)
+
+
+def pedidos(ua, nodos, grupo):
+    """MonitoredItemCreateRequest de un grupo de agrupar() (ua de opcua o de asyncua)."""
+    mirs = []
+    for nombre, params in grupo:
+        rv = ua.ReadValueId()
+        rv.NodeId = nodos[nombre].nodeid
+        rv.AttributeId = ua.AttributeIds.Value
+        mparams = ua.MonitoringParameters()
+        mparams.ClientHandle = next(_handles)
+        mparams.SamplingInterval = params['muestreo']
+        mparams.QueueSize = params['cola']
+        mparams.DiscardOldest = True
+        mfilter = filtro(ua, params)
+        if mfilter is not None:
+            mparams.Filter = mfilter
+        mir = ua.MonitoredItemCreateRequest()
+        mir.ItemToMonitor = rv
+        mir.MonitoringMode = ua.MonitoringMode.Reporting
+        mir.RequestedParameters = mparams
+        mirs.append(mir)
+    return mirs
+
+
+# Versión de python-opcua para la que está escrita corregir_deadband_servidor
+VERSION_OPCUA_DEADBAND = '0.98.13'
+
+
+def corregir_deadband_servidor():
+    """
+    El servidor de python-opcua compara cada muestra con la anterior y no con la última
+    notificada, por lo que una rampa lenta (pasos menores que la banda) nunca se notifica.
+    Se reemplaza MonitoredItemService.deadband_callback para que la referencia sea el último
+    valor notificado. Afecta a todos los servidores del proceso, por eso es opcional y se
+    llama al arrancar ServidorOPC (--corregir-deadband), no al crear los namespaces. Solo
+    hace falta para las suscripciones de los clientes: el motor de alarmas del servidor pide
+    sus ítems sin banda y la aplica en su handler (TanquesNamespace.SubHandler).
+    Depende de internos de python-opcua 0.98.13: con otra versión no se aplica y retorna False.
+    """
+    from importlib.metadata import version
+    if version('opcua') != VERSION_OPCUA_DEADBAND:
+        return False
+    from opcua import ua
+    from opcua.server.internal_subscription import MonitoredItemService
+
+    def deadband_callback(self, values, flt):
+        anterior = values.get_old_value()
+        if flt.DeadbandType == ua.DeadbandType.None_ or anterior is None:
+            return True
+        if flt.DeadbandType == ua.DeadbandType.Absolute:
+            try:
+                if abs(values.get_current_value() - anterior) > flt.DeadbandValue:
+                    return True
+            except TypeError:  # valores no escalares
+                return True
+            values.set_current_value(anterior)  # descartada: la referencia sigue siendo la última notificada
+            return False
+        return True  # porcentaje: sin rango en el servidor, se notifica
+
+    MonitoredItemService.deadband_callback = deadband_callback
+    return True
@@ -0,0 +1,154 @@
+import time
+import numpy as np
+from scipy.linalg import cho_factor, cho_solve
+try:
+    from utils.QuadrupleTank import QuadrupleTank
+except ImportError:  # ejecutado desde utils/
+    from QuadrupleTank import QuadrupleTank
+
+'''
+Control predictivo (MPC) de h1 y h2 con u1 y u2 sobre el modelo linealizado de los cuatro tanques.
+
+El punto de operación es el equilibrio de la planta en la referencia (h1, h2) con las γ actuales;
+ahí se linealiza QuadrupleTank y se discretiza con el periodo de control. Con horizonte de
+predicción Np y de control Nc (la entrada se mantiene después de Nc) el costo es
+    Σ ||y_k - r||²_Q + Σ ||Δu_k||²_R
+con u restringida a output_limits. Las matrices de predicción y del QP (hessiano, su constante
+de Lipschitz y los términos lineales) se calculan una sola vez por punto de operación y horizonte
+y quedan en caché, junto con la factorización de Cholesky del hessiano. En cada paso, si la
+solución sin restricciones respeta los límites es la óptima; si no, se resuelve con gradiente
+proyectado acelerado sobre la caja de u, partiendo de la solución anterior desplazada (warm
+start) y cortando al agotar el presupuesto de tiempo. La diferencia entre el estado medido y el
+predicho se estima como perturbación constante.
+
+Tiene la interfaz que usa EjecutorControl (compute(mediciones, dt), setpoint, reset), con
+mediciones en el orden de MEDIDAS.
+'''
+
+
+class MPCController:
+    MEDIDAS = ('H1', 'H2', 'H3', 'H4', 'razon1', 'razon2')
+
+    def __init__(self, Ts=1.0, Np=40, Nc=10, Q=(1.0, 1.0), R=(5.0, 5.0), output_limits=(0, 0.999), setpoint=(0, 0),
+                 Hmax=50, voltmax=10, presupuesto=None, max_iter=500, tol=1e-7, filtro_perturbacion=0.3):
+        self.Ts = Ts
+        self.Np = Np
+        self.Nc = Nc
+        self.Q = np.asarray(Q, dtype=float)
+        self.R = np.asarray(R, dtype=float)
+        self.setpoint = np.array(np.broadcast_to(np.asarray(setpoint, dtype=float), (2,)))
+        self.u_min = np.array(np.broadcast_to(np.asarray(output_limits[0], dtype=float), (2,)))
+        self.u_max = np.array(np.broadcast_to(np.asarray(output_limits[1], dtype=float), (2,)))
+        self.presupuesto = presupuesto if presupuesto is not None else 0.2*Ts  # s por resolución
+        self.max_iter = max_iter
+        self.tol = tol
+        self.filtro_perturbacion = filtro_perturbacion
+        self.modelo = QuadrupleTank(x0=[0, 0, 0, 0], Hmax=Hmax, voltmax=voltmax)  # solo parámetros
+        self._qps = {}  # (h1, h2, γ1, γ2) -> matrices del QP
+        self.stats = {'resoluciones': 0, 'iteraciones': 0, 'tiempo_ultimo': None, 'tiempo_max': 0.0,
+                      'sobre_presupuesto': 0, 'puntos_operacion': 0}
+        self.reset()
+
+    def reset(self, canales=None):
+        # Ambas entradas salen de un mismo problema: se reinicia todo aunque se pida un canal
+        self._U = None            # solución anterior (u absolutas, Nc x 2) para el warm start
+        self._u_prev = None
+        self._prediccion = None   # estado predicho para el paso actual
+        self._d = np.zeros(4)     # perturbación estimada (aditiva en el estado)
+        self.last_output = np.zeros(2)
+
+    def _punto_operacion(self, gamma):
+        clave = (round(float(self.setpoint[0]), 4), round(float(self.setpoint[1]), 4),
+                 round(float(gamma[0]), 4), round(float(gamma[1]), 4))
+        qp = self._qps.get(clave)
+        if qp is None:
+            qp = self._qps[clave] = self._precalcular(clave)
+            self.stats['puntos_operacion'] += 1
+        return qp
+
+    def _precalcular(self, clave):
+        h1, h2, g1, g2 = clave
+        self.modelo.gamma = [g1, g2]
+        x0, u0 = self.modelo.equilibrio(max(h1, 1e-2), max(h2, 1e-2))
+        A, B = self.modelo.linealizar(x0, self.Ts)
+        C = np.eye(4)[:2]
+
+        # Y = Phi dx0 + Gamma U + Psi d, con Y = [y_1 .. y_Np] y U = [du_0 .. du_Nc-1]
+        Np, Nc = self.Np, self.Nc
+        Phi = np.zeros((2*Np, 4))
+        Psi = np.zeros((2*Np, 4))
+        Gamma = np.zeros((2*Np, 2*Nc))
+        potencias = [np.eye(4)]
+        for _ in range(Np):
+            potencias.append(A @ potencias[-1])
+        suma = np.zeros((4, 4))
+        for i in range(Np):
+            Phi[2*i:2*i + 2] = C @ potencias[i + 1]
+            suma = suma + potencias[i]
+            Psi[2*i:2*i + 2] = C @ suma
+            for j in range(i + 1):
+                Gamma[2*i:2*i + 2, 2*min(j, Nc - 1):2*min(j, Nc - 1) + 2] += C @ potencias[i - j] @ B
+
+        Qbar = np.kron(np.eye(Np), np.diag(self.Q))
+        Rbar = np.kron(np.eye(Nc), np.diag(self.R))
+        D = np.eye(2*Nc) - np.eye(2*Nc, k=-2)  # ΔU = D U - [du_prev, 0, ...]
+        H = Gamma.T @ Qbar @ Gamma + D.T @ Rbar @ D
+        return {'x0': x0, 'u0': u0, 'A': A, 'B': B, 'H': H, 'cholesky': cho_factor(H),
+                'L': float(np.linalg.eigvalsh(H).max()),
+                'GtQPhi': Gamma.T @ Qbar @ Phi, 'GtQPsi': Gamma.T @ Qbar @ Psi,
+                'DtR': (D.T @ Rbar)[:, :2],
+                'inferior': np.tile(self.u_min - u0, Nc), 'superior': np.tile(self.u_max - u0, Nc)}
+
+    def compute(self, mediciones, dt=None):
+        # dt se ignora: el modelo está discretizado con Ts
+        mediciones = np.asarray(mediciones, dtype=float)
+        x = mediciones[:4]
+        gamma = mediciones[4:6] if len(mediciones) >= 6 else self.modelo.gamma
+        qp = self._punto_operacion(gamma)
+        t0 = time.perf_counter()
+
+        # La predicción ya incluye d: el error de predicción es lo que falta corregir de d
+        if self._prediccion is not None:
+            self._d += self.filtro_perturbacion*(x - self._prediccion)
+        dx = x - qp['x0']
+        du_prev = np.zeros(2) if self._u_prev is None else self._u_prev - qp['u0']
+        f = qp['GtQPhi'] @ dx + qp['GtQPsi'] @ self._d - qp['DtR'] @ du_prev
+
+        U = -cho_solve(qp['cholesky'], f)
+        iteracion = 0
+        if np.any(U < qp['inferior']) or np.any(U > qp['superior']):
+            # Warm start: solución anterior desplazada un paso, en las coordenadas del punto de operación actual
+            if self._U is not None:
+                U = (np.vstack([self._U[1:], self._U[-1:]]) - qp['u0']).ravel()
+            U = np.clip(U, qp['inferior'], qp['superior'])
+            U, iteracion = self._fista(qp, f, U, t0)
+
+        self._U = U.reshape(self.Nc, 2) + qp['u0']
+        u = np.clip(self._U[0], self.u_min, self.u_max)
+        self._prediccion = qp['x0'] + qp['A'] @ dx + qp['B'] @ (u - qp['u0']) + self._d
+        self._u_prev = u
+        self.last_output = u
+
+        tiempo = time.perf_counter() - t0
+        self.stats['resoluciones'] += 1
+        self.stats['iteraciones'] = iteracion
+        self.stats['tiempo_ultimo'] = tiempo
+        self.stats['tiempo_max'] = max(self.stats['tiempo_max'], tiempo)
+        return u
+
+    def _fista(self, qp, f, U, t0):
+        # Gradiente proyectado acelerado sobre la caja de u
+        H, paso = qp['H'], 1.0/qp['L']
+        y, t = U.copy(), 1.0
+        for iteracion in range(1, self.max_iter + 1):
+            U_nuevo = np.clip(y - paso*(H @ y + f), qp['inferior'], qp['superior'])
+            cambio = np.max(np.abs(U_nuevo - U))
+            t_nuevo = 0.5*(1 + np.sqrt(1 + 4*t*t))
+            y = U_nuevo + ((t - 1)/t_nuevo)*(U_nuevo - U)
+            U, t = U_nuevo, t_nuevo
+            if cambio < self.tol:
+                break
+            if time.perf_counter() - t0 > self.presupuesto:
+                self.stats['sobre_presupuesto'] += 1
+                break
+        return U, iteracion
@@ -1,217 +1,659 @@
 from opcua import ua, Client
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
 import threading
 import time
+try:
+    from utils.despachador import Despachador
+    from utils import monitoreo
+except ImportError:  # ejecutado desde utils/ (simulador)
+    from despachador import Despachador
+    import monitoreo
 
-def funcion_handler(node, val):
-    key = node.get_parent().get_display_name().Text
+# HistoryRead trabaja con fechas UTC sin zona; el resto del cliente con epoch en s
+def _fecha_ua(t):
+    return datetime.fromtimestamp(t, timezone.utc).replace(tzinfo=None)
+
+def _epoch_ua(fecha):
+    return fecha.replace(tzinfo=timezone.utc).timestamp()
+
+def funcion_handler(key, val):
     print('key: {} | val: {}'.format(key, val))
 
 class SubHandler(object):
     def __init__(self, owner=None):
         self.owner = owner  # puede ser None (para eventos), o Cliente en datachange
+        # Despacho con pool fijo de workers, sin thread por notificación. Los handlers de un Cliente
+        # comparten el suyo: el mapa NodeId -> clave es de su servidor (otros pueden repetir NodeIds)
+        self.despachador = owner.despachador if owner is not None else Despachador(funcion_handler, nombre='opc_client')
 
     def datachange_notification(self, node, val, data):
         # logging no bloqueante (opcional)
-        try:
-            thread_handler = threading.Thread(target=funcion_handler, args=(node, val))
-            thread_handler.daemon = True
-            thread_handler.start()
-        except Exception:
-            pass
+        self.despachador.enviar(node, val)
 
-        # actualizar estados de alarma si tenemos owner
+        # actualizar caché y estados de alarma si tenemos owner
         if self.owner is None:
             return
         try:
-            with self.owner._lock:
-                # mapear nodeid -> 'H1'...'H4'
-                key = self.owner.node_to_tank.get(node.nodeid, None)
-                if key is None:
-                    return
-                self.owner.last_levels[key] = float(val)
-                thr = self.owner.thresholds.get(key, None)
-                if thr is not None:
-                    self.owner.alarm_states[key] = (float(val) < float(thr))
+            self.owner._notificacion(node, val, data)
         except Exception:
             pass
 
     def event_notification(self, event):
         print("Python: New event", event)
 
-class Cliente():
-    def __init__(self, direccion, suscribir_eventos, SubHandler):
+class ClienteBase():
+    '''
+    Estado en memoria de un cliente de la planta, común a Cliente (opcua) y ClienteAsync (asyncua):
+    nodos resueltos, caché del muestreo, alarmas de nivel, salud de la conexión y el armado e
+    interpretación de los pedidos OPC UA. No hace I/O: cada subclase envía los pedidos con su Client.
+    '''
+    # Tipos OPC UA con que se arman los pedidos (ClienteAsync usa los de asyncua)
+    ua = ua
+
+    def __init__(self, direccion, suscribir_eventos, SubHandler, estacion=None, n_tanques=4):
         self.direccion = direccion
-        self.client = Client(direccion)
         self._lock = threading.Lock()  # <--- NUEVO
+        self.despachador = Despachador(funcion_handler, nombre='opc_client')  # de los SubHandler con owner
 
-        self.alturas = {'H1': 0, 'H2': 0, 'H3':0, 'H4':0}
-        self.temperaturas = {'T1': 0, 'T2': 0, 'T3':0, 'T4':0}
-        self.valvulas = {'valvula1':0, 'valvula2':0}
-        self.razones = {'razon1':0, 'razon2': 0}
+        # Estación del servidor: None es Proceso_Tanques, un id es Proceso_Tanques_<id> (misma convención
+        # que carpeta_estacion en TanquesNamespace)
+        self.estacion = estacion
+        self.carpeta = 'Proceso_Tanques' if estacion is None else 'Proceso_Tanques_{}'.format(estacion)
+        n_bombas = max(1, n_tanques // 2)
+
+        self.alturas = {'H{}'.format(i): 0 for i in range(1, n_tanques + 1)}
+        self.temperaturas = {'T{}'.format(i): 0 for i in range(1, n_tanques + 1)}
+        self.valvulas = {'valvula{}'.format(i): 0 for i in range(1, n_bombas + 1)}
+        self.razones = {'razon{}'.format(i): 0 for i in range(1, n_bombas + 1)}
 
         # --- NUEVO: estados de alarmas / umbrales / últimos niveles
-        self.thresholds  = {'H1': None, 'H2': None, 'H3': None, 'H4': None}
-        self.last_levels = {'H1': None, 'H2': None, 'H3': None, 'H4': None}
-        self.alarm_states = {'H1': False, 'H2': False, 'H3': False, 'H4': False}
+        self.thresholds  = {key: None for key in self.alturas}
+        self.last_levels = {key: None for key in self.alturas}
+        self.alarm_states = {key: False for key in self.alturas}
         self.node_to_tank = {}   # NodeId -> 'H1'...'H4'
 
+        # Nodos resueltos en Instanciacion por clave ('H1', 'T1', 'valvula1', 'razon1', ...)
+        self._nodos = {}
+        # Escritura: último valor enviado por clave y banda muerta por defecto (None = siempre escribir)
+        self._ultimos_escritos = {}
+        self.deadband_escritura = None
+
+        # Lectura: último snapshot leído y edad máxima (s) con la que read_* lo reutilizan
+        self._read_params = None
+        self._snapshot = None
+        self.snapshot_max_edad = 0.2
+
+        # Muestreo en segundo plano: caché del último valor por clave y anillo de historial
+        self._nodo_a_clave = {}  # NodeId -> 'H1', 'T1', 'valvula1', ..., 'Estado'
+        self._nodos_monitoreo = {}  # _nodos más 'Estado' si el servidor publica el arreglo
+        self._cache = {}         # clave -> (valor, SourceTimestamp, time.time() de recepción)
+        self._cache_historial = {}
+        self._sub_muestreo = []
+        self._muestreo_activo = False
+
         self.subscribir_eventos = suscribir_eventos
-        self.periodo = 100 # ms
+        self.periodo = 100 # ms (eventos)
+        # Muestreo, cola y banda muerta por variable: {'h': {...}, 'H1': {...}} sobre monitoreo.CONFIG_MONITOREO
+        self.config_monitoreo = None
         self.SubHandlerClass = SubHandler
 
         # --- NUEVO: datos de suscripción a niveles
-        self._sub_levels = None
-        self._sub_levels_handles = []
+        self._sub_levels = []
         self._subscribed_levels = False
 
+        # Arreglo Estado [muestra, H1..Hn, T1..Tn, valvula1..m, razon1..m] (TanquesNamespace.componentes_estado)
+        self.componentes_estado = (['muestra'] + list(self.alturas) + list(self.temperaturas)
+                                   + list(self.valvulas) + list(self.razones))
+        self._nodo_estado = None  # None con servidores que no lo publican
+        self.muestra = None       # contador de la última muestra recibida
+        self._muestra = 0         # contador de las muestras publicadas (publicar_estado)
+
         self._connected = False  # <--- NUEVO
+        self.generacion_conexion = 0      # aumenta con cada conexión exitosa
+        self._salud = {'reconexiones': 0, 'intentos_fallidos': 0, 'ultima_latencia_reconexion': None,
+                       'desconectado_desde': None, 'ultimo_error': None}
 
     def is_connected(self):
         return bool(self._connected)
 
+    # Con alturas, temperaturas, valvulas y razones ya resueltas en Instanciacion
+    def _registrar_nodos(self, nodo_estado):
+        # --- NUEVO: mapeo nodeid -> 'H#'
+        self.node_to_tank = {node.nodeid: key for key, node in self.alturas.items()}
+
+        # Caché de handles para lecturas/escrituras sin volver a navegar el address space
+        self._nodos = {}
+        for grupo in (self.alturas, self.temperaturas, self.valvulas, self.razones):
+            self._nodos.update(grupo)
+        self._nodo_estado = nodo_estado
+        self._nodos_monitoreo = dict(self._nodos)
+        if self._nodo_estado is not None:
+            self._nodos_monitoreo['Estado'] = self._nodo_estado
+        self._nodo_a_clave = {node.nodeid: key for key, node in self._nodos_monitoreo.items()}
+        self._ultimos_escritos = {}
+
+        # Un único ReadRequest con todas las variables de proceso (se arma una sola vez)
+        self._read_params = self.ua.ReadParameters()
+        self._read_params.TimestampsToReturn = self.ua.TimestampsToReturn.Both
+        for node in self._nodos_monitoreo.values():  # Estado al final, si existe
+            rv = self.ua.ReadValueId()
+            rv.NodeId = node.nodeid
+            rv.AttributeId = self.ua.AttributeIds.Value
+            self._read_params.NodesToRead.append(rv)
+        self._snapshot = None
+
+    # Registra NodeId -> clave en el despachador del handler (si tiene) al momento de suscribir
+    def _registrar_nombres(self, handler, claves):
+        despachador = getattr(handler, 'despachador', None)
+        if despachador is None:
+            return
+        for key in claves:
+            despachador.registrar(self._nodos_monitoreo[key].nodeid, key)
+
+    def set_alarm_thresholds(self, h1=None, h2=None, h3=None, h4=None):
+        with self._lock:
+            if h1 is not None: self.thresholds['H1'] = float(h1)
+            if h2 is not None: self.thresholds['H2'] = float(h2)
+            if h3 is not None: self.thresholds['H3'] = float(h3)
+            if h4 is not None: self.thresholds['H4'] = float(h4)
+
+    def is_level_subscribed(self):
+        return bool(self._subscribed_levels)
+
+    # Se llama desde SubHandler (con owner) por cada notificación de cambio de dato
+    def _notificacion(self, node, val, data):
+        key = self._nodo_a_clave.get(node.nodeid)
+        if key is None:
+            return
+        try:
+            ts = data.monitored_item.Value.SourceTimestamp
+        except AttributeError:
+            ts = None
+        recibido = time.time()
+        with self._lock:
+            if key != 'Estado':
+                self._guardar(key, float(val), ts, recibido)
+                return
+            # Una notificación trae la muestra completa; varias suscripciones pueden repetirla.
+            # El contador 0 es el valor inicial del servidor (aún no se ha publicado ninguna muestra)
+            if val[0] == self.muestra or val[0] == 0:
+                return
+            self.muestra = val[0]
+            for key, valor in zip(self.componentes_estado[1:], val[1:]):
+                # Válvulas y razones llegan por sus propios nodos (las escribe el dashboard, no el simulador)
+                if key in self.alturas or key in self.temperaturas:
+                    self._guardar(key, float(valor), ts, recibido)
+
+    # Con self._lock tomado: caché, anillo de historial y alarmas de nivel
+    def _guardar(self, key, valor, ts, recibido):
+        anterior = self._cache.get(key)
+        self._cache[key] = (valor, ts, recibido)
+        # Varias suscripciones pueden notificar la misma muestra: se guarda una sola vez
+        if key in self._cache_historial and (anterior is None or ts is None or ts != anterior[1]):
+            t = ts.replace(tzinfo=timezone.utc).timestamp() if ts is not None else time.time()
+            self._cache_historial[key].append((t, valor))
+        # Las alarmas de nivel solo se evalúan con la suscripción de alarmas habilitada
+        if self._subscribed_levels and key in self.thresholds:
+            self.last_levels[key] = valor
+            thr = self.thresholds.get(key, None)
+            if thr is not None:
+                self.alarm_states[key] = (valor < float(thr))
+
+    def _preparar_historial(self, largo_historial):
+        with self._lock:
+            # Al restaurar tras una reconexión se conserva el historial ya acumulado
+            for key in self._nodos:
+                if key not in self._cache_historial or self._cache_historial[key].maxlen != largo_historial:
+                    self._cache_historial[key] = deque(maxlen=largo_historial)
+
+    # Con arreglo Estado en el servidor, niveles y temperaturas se reciben en un único nodo
+    def _claves_muestreo(self):
+        if 'Estado' not in self._nodos_monitoreo:
+            return list(self._nodos)
+        return ['Estado'] + list(self.valvulas) + list(self.razones)
+
+    def historial_muestreo(self, key, desde=None):
+        """Muestras (t_epoch, valor) guardadas por el muestreo, opcionalmente desde t_epoch=desde."""
+        with self._lock:
+            muestras = list(self._cache_historial.get(key, ()))
+        if desde is not None:
+            muestras = [m for m in muestras if m[0] >= desde]
+        return muestras
+
+    # --- NUEVO: snapshot para la UI
+    def get_alarm_snapshot(self):
+        with self._lock:
+            return (self.last_levels.copy(), self.thresholds.copy(), self.alarm_states.copy())
+
+    # Las variables manipuladas se escriben como Float; el resto conserva el tipo del valor
+    def _variant(self, key, valor):
+        if key in self.valvulas or key in self.razones:
+            return self.ua.Variant(float(valor), self.ua.VariantType.Float)
+        return self.ua.Variant(valor)
+
+    # WriteParameters de publicar_estado: escalares con banda muerta y, al final, el arreglo Estado
+    def _armar_publicacion(self, alturas, temperaturas, entradas, deadband):
+        valores = dict(zip(self.alturas, alturas))
+        valores.update(zip(self.temperaturas, temperaturas))
+        params, claves = self._armar_escritura(valores, deadband)
+        muestra = None
+        if self._nodo_estado is not None:
+            self._muestra += 1
+            muestra = self._muestra
+            n_entradas = len(self.valvulas) + len(self.razones)
+            entradas = (list(entradas) + [float('nan')] * n_entradas)[:n_entradas]
+            estado = [float(v) for v in [muestra] + list(alturas) + list(temperaturas) + entradas]
+            attr = self.ua.WriteValue()
+            attr.NodeId = self._nodo_estado.nodeid
+            attr.AttributeId = self.ua.AttributeIds.Value
+            attr.Value = self.ua.DataValue(self.ua.Variant(estado, self.ua.VariantType.Double))
+            params.NodesToWrite.append(attr)
+        return params, valores, claves, muestra
+
+    def _confirmar_publicacion(self, valores, claves, muestra, resultados):
+        self._confirmar_escritura(valores, claves, resultados)
+        if muestra is not None:
+            resultados[-1].check()
+
+    # WriteParameters con los valores que superan la banda muerta y sus claves
+    def _armar_escritura(self, valores, deadband=None):
+        if deadband is None:
+            deadband = self.deadband_escritura
+        params = self.ua.WriteParameters()
+        claves = []
+        with self._lock:
+            for key, valor in valores.items():
+                anterior = self._ultimos_escritos.get(key)
+                if deadband is not None and anterior is not None and abs(valor - anterior) <= deadband:
+                    continue
+                attr = self.ua.WriteValue()
+                attr.NodeId = self._nodos[key].nodeid
+                attr.AttributeId = self.ua.AttributeIds.Value
+                attr.Value = self.ua.DataValue(self._variant(key, valor))
+                params.NodesToWrite.append(attr)
+                claves.append(key)
+        return params, claves
+
+    def _confirmar_escritura(self, valores, claves, resultados):
+        with self._lock:
+            for key, resultado in zip(claves, resultados):
+                resultado.check()
+                self._ultimos_escritos[key] = valores[key]
+
+    def _snapshot_cache(self):
+        with self._lock:
+            valores = {key: self._cache[key][0] if key in self._cache else None for key in self._nodos}
+            timestamps = {key: self._cache[key][1] if key in self._cache else None for key in self._nodos}
+            muestra = self.muestra
+        fechas = [ts for ts in timestamps.values() if ts is not None]
+        return {'t': max(fechas) if fechas else None, 'recibido': time.time(), 'muestra': muestra,
+                'valores': valores, 'timestamps': timestamps}
+
+    def _armar_snapshot(self, resultados):
+        valores, timestamps = {}, {}
+        for key, dv in zip(self._nodos, resultados):
+            if dv.StatusCode.is_good():
+                valores[key] = float(dv.Value.Value)
+                timestamps[key] = dv.SourceTimestamp or dv.ServerTimestamp
+            else:
+                valores[key] = None
+                timestamps[key] = None
+        # Con arreglo Estado, niveles y temperaturas se toman de él: todos de la misma muestra
+        muestra = None
+        estado = resultados[len(self._nodos)] if len(resultados) > len(self._nodos) else None
+        if estado is not None and estado.StatusCode.is_good() and estado.Value.Value[0] > 0:  # 0: nunca escrito
+            ts = estado.SourceTimestamp or estado.ServerTimestamp
+            muestra = estado.Value.Value[0]
+            for key, valor in zip(self.componentes_estado[1:], estado.Value.Value[1:]):
+                if key in self.alturas or key in self.temperaturas:
+                    valores[key] = float(valor)
+                    timestamps[key] = ts
+        fechas = [ts for ts in timestamps.values() if ts is not None]
+        snapshot = {'t': max(fechas) if fechas else None, 'recibido': time.time(), 'muestra': muestra,
+                    'valores': valores, 'timestamps': timestamps}
+        with self._lock:
+            self._snapshot = snapshot
+        return snapshot
+
+    # Snapshot que se responde sin ir al servidor (muestreo activo), o None si hay que leer
+    def _snapshot_en_memoria(self, forzar=False):
+        if self._muestreo_activo and not forzar:
+            return self._snapshot_cache()
+        if self._read_params is None:
+            raise ConnectionError("Cliente OPC UA no conectado")
+        return None
+
+    # Los read_* son vistas sobre el último snapshot; si tiene más de snapshot_max_edad se relee
+    def _snapshot_reciente(self):
+        if self._muestreo_activo:
+            return self._snapshot_cache()
+        with self._lock:
+            snapshot = self._snapshot
+        if snapshot is None or time.time() - snapshot['recibido'] > self.snapshot_max_edad:
+            return None
+        return snapshot
+
+    @staticmethod
+    def _valor(snapshot, key):
+        valor = snapshot['valores'][key]
+        if valor is None:
+            raise ValueError(f"Lectura de {key} con estado no válido")
+        return valor
+
+    # Lectura del valor previo: inicio posterior al fin, el servidor responde en orden inverso.
+    # Se piden dos valores porque el primero puede estar justo en `inicio` (lo trae la lectura hacia adelante)
+    @staticmethod
+    def _rango_previo(desde, claves):
+        return desde, datetime(1971, 1, 1), 2, [(key, None) for key in claves]
+
+    def _pedido_historial(self, desde, hasta, n, pendientes):
+        details = self.ua.ReadRawModifiedDetails()
+        details.IsReadModified = False
+        details.StartTime = desde
+        details.EndTime = hasta
+        details.NumValuesPerNode = n
+        details.ReturnBounds = False
+        params = self.ua.HistoryReadParameters()
+        params.HistoryReadDetails = details
+        params.TimestampsToReturn = self.ua.TimestampsToReturn.Source
+        params.ReleaseContinuationPoints = False
+        for key, cont in pendientes:
+            valueid = self.ua.HistoryReadValueId()
+            valueid.NodeId = self._nodos[key].nodeid
+            valueid.IndexRange = ''
+            valueid.ContinuationPoint = cont
+            params.NodesToRead.append(valueid)
+        return params
+
+    @staticmethod
+    def _agregar_previos(series, claves, desde, resultados):
+        limite = _epoch_ua(desde)
+        for key, resultado in zip(claves, resultados):
+            previos = [(_epoch_ua(dv.SourceTimestamp), float(dv.Value.Value))
+                       for dv in resultado.HistoryData.DataValues] if resultado.StatusCode.is_good() else []
+            previos = [muestra for muestra in previos if muestra[0] < limite]
+            if previos:
+                series[key].append(previos[0])
+
+    # Agrega una página de HistoryRead y retorna las claves que siguen con su punto de continuación.
+    # Una página vacía o un punto de continuación repetido terminan la clave (el servidor no avanza)
+    @staticmethod
+    def _agregar_pagina(series, pendientes, resultados):
+        siguientes = []
+        for (key, anterior), resultado in zip(pendientes, resultados):
+            resultado.StatusCode.check()
+            valores = resultado.HistoryData.DataValues if resultado.HistoryData is not None else []
+            for dv in valores:
+                series[key].append((_epoch_ua(dv.SourceTimestamp), float(dv.Value.Value)))
+            cont = resultado.ContinuationPoint
+            if cont and valores and cont != anterior:
+                siguientes.append((key, cont))
+        return siguientes
+
+    def estado_conexion(self):
+        """Salud de la conexión: conectado, reconexiones, latencia de la última reconexión [s], etc."""
+        estado = dict(self._salud)
+        estado['conectado'] = self.is_connected()
+        if estado['desconectado_desde'] is not None:
+            estado['tiempo_desconectado'] = time.time() - estado['desconectado_desde']
+        return estado
+
+
+class Cliente(ClienteBase):
+    def __init__(self, direccion, suscribir_eventos, SubHandler, estacion=None, n_tanques=4):
+        super().__init__(direccion, suscribir_eventos, SubHandler, estacion=estacion, n_tanques=n_tanques)
+        self.client = self._nuevo_cliente()
+
+        # Conexión compartida: los servicios la usan en paralelo (_usar_conexion) y _reconectar la
+        # reconstruye en exclusiva; mientras tanto los demás threads reciben ConnectionError
+        self._cond_conexion = threading.Condition()
+        self._en_uso = 0
+        self._reconstruye = None  # ident del thread que está reconstruyendo la conexión
+
+        # Supervisor de conexión: reconexión con backoff exponencial y restauración de suscripciones
+        self._supervisor = None
+        self._detener_supervisor = threading.Event()
+        self._restaurar_niveles = False   # suscripción de alarmas pedida por el usuario
+        self._restaurar_muestreo = None   # largo_historial del muestreo pedido, None si no
+
+    # Client OPC UA de la conexión (uno nuevo en cada reconexión)
+    def _nuevo_cliente(self):
+        return Client(self.direccion)
+
+    @contextmanager
+    def _usar_conexion(self):
+        with self._cond_conexion:
+            if self._reconstruye not in (None, threading.get_ident()):
+                raise ConnectionError("Cliente OPC UA reconectando")
+            self._en_uso += 1
+        try:
+            yield self.client
+        finally:
+            with self._cond_conexion:
+                self._en_uso -= 1
+                self._cond_conexion.notify_all()
+
     def Instanciacion(self):
 
         #aqui tengo que agregar la carpeta de Alarmas
         #self.Alarmas = self.objets.get_child(['2:Proceso_Tanques','2:Alarmas']) #esto me permite acceder a las alarmas de los 4 niveles (por implementar)
         self.root = self.client.get_root_node()
         self.objects = self.client.get_objects_node()
-        self.Tanques = self.objects.get_child(['2:Proceso_Tanques','2:Tanques'])
-        self.Valvulas = self.objects.get_child(['2:Proceso_Tanques', '2:Valvulas'])
-        self.Razones = self.objects.get_child(['2:Proceso_Tanques', '2:Razones'])
 
-        # Alturas (nodos)
-        self.alturas['H1'] = self.Tanques.get_child(['2:Tanque1', '2:h'])
-        self.alturas['H2'] = self.Tanques.get_child(['2:Tanque2', '2:h'])
-        self.alturas['H3'] = self.Tanques.get_child(['2:Tanque3', '2:h'])
-        self.alturas['H4'] = self.Tanques.get_child(['2:Tanque4', '2:h'])
-
-        # --- NUEVO: mapeo nodeid -> 'H#'
-        self.node_to_tank[self.alturas['H1'].nodeid] = 'H1'
-        self.node_to_tank[self.alturas['H2'].nodeid] = 'H2'
-        self.node_to_tank[self.alturas['H3'].nodeid] = 'H3'
-        self.node_to_tank[self.alturas['H4'].nodeid] = 'H4'
-
-        # Temperaturas (nodos)
-        self.temperaturas['T1'] = self.Tanques.get_child(['2:Tanque1', '2:T'])
-        self.temperaturas['T2'] = self.Tanques.get_child(['2:Tanque2', '2:T'])
-        self.temperaturas['T3'] = self.Tanques.get_child(['2:Tanque3', '2:T'])
-        self.temperaturas['T4'] = self.Tanques.get_child(['2:Tanque4', '2:T'])
-
-        # Válvulas (nodos)
-        self.valvulas['valvula1'] = self.Valvulas.get_child(['2:Valvula1', '2:u'])
-        self.valvulas['valvula2'] = self.Valvulas.get_child(['2:Valvula2', '2:u'])
-
-        # Razones (nodos)
-        self.razones['razon1'] = self.Razones.get_child(['2:Razon1', '2:gamma'])
-        self.razones['razon2'] = self.Razones.get_child(['2:Razon2', '2:gamma'])
+        # Rutas de todos los nodos de la estación, resueltas en un solo TranslateBrowsePathsToNodeIds
+        carpeta = '2:' + self.carpeta
+        rutas = {'Tanques': [carpeta, '2:Tanques'], 'Valvulas': [carpeta, '2:Valvulas'],
+                 'Razones': [carpeta, '2:Razones']}
+        for i in range(1, len(self.alturas) + 1):
+            rutas['H{}'.format(i)] = [carpeta, '2:Tanques', '2:Tanque{}'.format(i), '2:h']
+            rutas['T{}'.format(i)] = [carpeta, '2:Tanques', '2:Tanque{}'.format(i), '2:T']
+        for i in range(1, len(self.valvulas) + 1):
+            rutas['valvula{}'.format(i)] = [carpeta, '2:Valvulas', '2:Valvula{}'.format(i), '2:u']
+            rutas['razon{}'.format(i)] = [carpeta, '2:Razones', '2:Razon{}'.format(i), '2:gamma']
+        rutas['Estado'] = [carpeta, '2:Estado']
+        nodos = self._resolver(self.objects, rutas, opcionales=('Estado',))
+
+        self.Tanques = nodos['Tanques']
+        self.Valvulas = nodos['Valvulas']
+        self.Razones = nodos['Razones']
+        for grupo in (self.alturas, self.temperaturas, self.valvulas, self.razones):
+            for key in grupo:
+                grupo[key] = nodos[key]
+
+        self._registrar_nodos(nodos['Estado'])
 
         # Eventos (si decides mantenerlos)
         if self.subscribir_eventos:
             self.myevent = self.root.get_child(["0:Types", "0:EventTypes", "0:BaseEventType", "2:Alarma_nivel"])
-            self.obj_event = self.objects.get_child(['2:Proceso_Tanques', '2:Alarmas', '2:Alarma_nivel'])
+            self.obj_event = self.objects.get_child(['2:' + self.carpeta, '2:Alarmas', '2:Alarma_nivel'])
             self.handler_event = self.SubHandlerClass()  # sin owner
             self.sub_event = self.client.create_subscription(self.periodo, self.handler_event)
             self.handle_event = self.sub_event.subscribe_events(self.obj_event, self.myevent)
 
-    def set_alarm_thresholds(self, h1=None, h2=None, h3=None, h4=None):
-        with self._lock:
-            if h1 is not None: self.thresholds['H1'] = float(h1)
-            if h2 is not None: self.thresholds['H2'] = float(h2)
-            if h3 is not None: self.thresholds['H3'] = float(h3)
-            if h4 is not None: self.thresholds['H4'] = float(h4)
+    def _resolver(self, origen, rutas, opcionales=()):
+        """
+        {clave: ruta} -> {clave: Node}, con un único servicio TranslateBrowsePathsToNodeIds.
+        Las claves opcionales que el servidor no tiene quedan en None.
+        """
+        claves = list(rutas)
+        bpaths = []
+        for key in claves:
+            bpath = ua.BrowsePath()
+            bpath.StartingNode = origen.nodeid
+            bpath.RelativePath = origen._make_relative_path(rutas[key])
+            bpaths.append(bpath)
+        nodos = {}
+        for key, resultado in zip(claves, self.client.uaclient.translate_browsepaths_to_nodeids(bpaths)):
+            if key in opcionales and not resultado.StatusCode.is_good():
+                nodos[key] = None
+                continue
+            resultado.StatusCode.check()
+            nodos[key] = self.client.get_node(resultado.Targets[0].TargetId)
+        return nodos
+
+    def _suscribir(self, handler, claves):
+        """
+        Suscribe las claves con sus parámetros de monitoreo (intervalo, cola, banda muerta):
+        una suscripción por intervalo de muestreo. Retorna la lista de suscripciones.
+        """
+        self._registrar_nombres(handler, claves)
+        subs = []
+        with self._usar_conexion() as client:
+            for muestreo, grupo in monitoreo.agrupar(claves, self.config_monitoreo).items():
+                sub = client.create_subscription(muestreo, handler)
+                for resultado in sub.create_monitored_items(monitoreo.pedidos(ua, self._nodos_monitoreo, grupo)):
+                    if isinstance(resultado, ua.StatusCode):
+                        resultado.check()
+                subs.append(sub)
+        return subs
+
+    def _borrar_suscripciones(self, subs):
+        for sub in subs:
+            try:
+                sub.delete()
+            except Exception:
+                pass
 
     def enable_level_subscription(self):
+        self._restaurar_niveles = True
         if self._subscribed_levels:
             return True
         handler = self.SubHandlerClass(owner=self)  # ahora con owner
-        self._sub_levels = self.client.create_subscription(self.periodo, handler)
-        self._sub_levels_handles = []
-        # suscribir h1..h4
-        for key in ('H1','H2','H3','H4'):
-            handle = self._sub_levels.subscribe_data_change(self.alturas[key])
-            self._sub_levels_handles.append(handle)
+        self._sub_levels = self._suscribir(handler, list(self.alturas))
         self._subscribed_levels = True
         return True
 
     def disable_level_subscription(self):
-        try:
-            if self._sub_levels:
-                for h in self._sub_levels_handles:
-                    self._sub_levels.unsubscribe(h)
-                self._sub_levels.delete()
-        except Exception:
-            pass
-        self._sub_levels = None
-        self._sub_levels_handles = []
+        self._restaurar_niveles = False
+        self._borrar_suscripciones(self._sub_levels)
+        self._sub_levels = []
         self._subscribed_levels = False
         return True
 
-    def is_level_subscribed(self):
-        return bool(self._subscribed_levels)
+    def iniciar_muestreo(self, largo_historial=600):
+        """
+        Suscribe una sola vez todas las variables de proceso (niveles y temperaturas a través del
+        arreglo Estado, si el servidor lo publica). Desde entonces read_snapshot()
+        y read_* se responden desde memoria, sin tráfico OPC, sin importar cuántos
+        callbacks o pestañas lean. Guarda además las últimas largo_historial muestras por variable.
+        """
+        self._restaurar_muestreo = largo_historial
+        if self._muestreo_activo:
+            return True
+        if not self._connected:
+            return False  # el supervisor lo inicia al conectar
+        self._preparar_historial(largo_historial)
+        self._sub_muestreo = self._suscribir(self.SubHandlerClass(owner=self), self._claves_muestreo())
+        self._muestreo_activo = True
+        return True
 
-    # --- NUEVO: snapshot para la UI
-    def get_alarm_snapshot(self):
-        with self._lock:
-            return (self.last_levels.copy(), self.thresholds.copy(), self.alarm_states.copy())
+    def detener_muestreo(self):
+        self._restaurar_muestreo = None
+        self._borrar_suscripciones(self._sub_muestreo)
+        self._sub_muestreo = []
+        self._muestreo_activo = False
+        return True
 
     def escribir(self, mv, valor):
-        # setear pumps
-        # 1. Accede al nodo
-        if mv == "valvula1":
-            valvula1_node = self.Valvulas.get_child(['2:Valvula1', '2:u'])
-            # 2. Escribe el valor
-            valvula1_node.set_value(ua.Variant(valor, ua.VariantType.Float))
-        elif mv == "valvula2": 
-            valvula2_node = self.Valvulas.get_child(['2:Valvula2', '2:u'])
-            # 2. Escribe el valor
-            valvula2_node.set_value(ua.Variant(valor, ua.VariantType.Float))
-        elif mv == "razon1":
-            razones1_node = self.Razones.get_child(['2:Razon1', '2:gamma'])
-            razones1_node.set_value(ua.Variant(valor, ua.VariantType.Float))
-        elif mv == "razon2":
-            razones2_node = self.Razones.get_child(['2:Razon2', '2:gamma'])
-            razones2_node.set_value(ua.Variant(valor, ua.VariantType.Float))  
-        
-    def read_tank_level(self, tank_id):
+        # setear pumps con el nodo ya resuelto en Instanciacion
+        if mv not in self.valvulas and mv not in self.razones:
+            return
+        with self._usar_conexion():
+            self._nodos[mv].set_value(self._variant(mv, valor))
+        with self._lock:
+            self._ultimos_escritos[mv] = valor
+
+    def escribir_varios(self, valores, deadband=None):
+        """
+        Escribe varias variables en un solo servicio Write. valores: {'H1': 10.2, 'valvula1': 0.5, ...}.
+        Si hay banda muerta (argumento o self.deadband_escritura) se omiten los valores que no
+        cambiaron más que ella respecto al último escrito. Retorna las claves efectivamente escritas.
+        """
+        params, claves = self._armar_escritura(valores, deadband)
+        if not claves:
+            return []
+        with self._usar_conexion() as client:
+            resultados = client.uaclient.write(params)
+        self._confirmar_escritura(valores, claves, resultados)
+        return claves
+
+    def publicar_estado(self, alturas, temperaturas, entradas=(), deadband=None):
+        """
+        Publica una muestra del simulador en un solo Write: el arreglo Estado, con el contador de
+        muestra, niveles, temperaturas y las entradas aplicadas (válvulas y razones, NaN si no se
+        entregan), y los nodos escalares de niveles y temperaturas (con banda muerta, por compatibilidad).
+        Retorna el contador de la muestra publicada (None si el servidor no tiene Estado).
+        """
+        params, valores, claves, muestra = self._armar_publicacion(alturas, temperaturas, entradas, deadband)
+        if params.NodesToWrite:
+            with self._usar_conexion() as client:
+                resultados = client.uaclient.write(params)
+            self._confirmar_publicacion(valores, claves, muestra, resultados)
+        return muestra
+
+    def read_snapshot(self, forzar=False):
+        """
+        Lee niveles, temperaturas, válvulas y razones en un solo servicio Read; con el
+        muestreo activo (iniciar_muestreo) se responde desde la caché salvo que forzar=True.
+        Retorna {'t': SourceTimestamp más reciente, 'recibido': time.time(), 'muestra': contador del arreglo Estado,
+                 'valores': {'H1': ..., 'valvula1': ...}, 'timestamps': {'H1': SourceTimestamp, ...}}.
+        Las variables con StatusCode malo quedan en None.
+        """
+        snapshot = self._snapshot_en_memoria(forzar)
+        if snapshot is None:
+            with self._usar_conexion() as client:
+                snapshot = self._armar_snapshot(client.uaclient.read(self._read_params))
+        return snapshot
+
+    def _leer(self, key):
+        return self._valor(self._snapshot_reciente() or self.read_snapshot(), key)
+
+    def _leer_o_avisar(self, key, descripcion):
         try:
-            key = f"H{tank_id}"
-            node = self.alturas[key]
-            return float(node.get_value())
+            return self._leer(key)
         except Exception as e:
-            print(f"❌ Error al leer nivel del Tanque {tank_id}: {e}")
+            print(f"❌ Error al leer {descripcion}: {e}")
             return None
 
+    def read_tank_level(self, tank_id):
+        return self._leer_o_avisar(f"H{tank_id}", f"nivel del Tanque {tank_id}")
+
     def read_valve_voltage(self, valvula_id):
-        try:
-            key = f"valvula{valvula_id}"
-            return float(self.valvulas[key].get_value())
-        except Exception as e:
-            print(f"❌ Error al leer voltaje de válvula {valvula_id}: {e}")
-            return None
+        return self._leer_o_avisar(f"valvula{valvula_id}", f"voltaje de válvula {valvula_id}")
 
     def read_flow_ratio(self, razon_id):
-        try:
-            key = f"razon{razon_id}"
-            return float(self.razones[key].get_value())
-        except Exception as e:
-            print(f"❌ Error al leer razón de flujo {razon_id}: {e}")
-            return None
+        return self._leer_o_avisar(f"razon{razon_id}", f"razón de flujo {razon_id}")
+
+    def leer_historial(self, claves, inicio, fin=None, lote=1000, incluir_previo=True):
+        """
+        HistoryRead por rango [inicio, fin] (epoch en s; fin=None es ahora) de varias variables
+        a la vez, paginando por puntos de continuación de a `lote` valores por variable.
+        Con incluir_previo se agrega al inicio el último valor anterior a `inicio` (lectura
+        en orden inverso), útil para retener el valor vigente al comienzo de la ventana.
+        Retorna {clave: [(t_epoch, valor), ...]} en orden cronológico.
+        """
+        series = {key: [] for key in claves}
+        desde = _fecha_ua(inicio)
+        hasta = _fecha_ua(time.time() if fin is None else fin)
+        with self._usar_conexion() as client:
+            if incluir_previo:
+                pedido = self._pedido_historial(*self._rango_previo(desde, claves))
+                self._agregar_previos(series, claves, desde, client.uaclient.history_read(pedido))
+            pendientes = [(key, None) for key in claves]
+            while pendientes:
+                resultados = client.uaclient.history_read(self._pedido_historial(desde, hasta, lote, pendientes))
+                pendientes = self._agregar_pagina(series, pendientes, resultados)
+        return series
 
     def subscribir_cv(self): # Subscripción a las variables controladas
         self.handler_cv = self.SubHandlerClass()
-        self.sub_cv = self.client.create_subscription(self.periodo, self.handler_cv)
-        for key, var in self.alturas.items():
-            self.sub_cv.subscribe_data_change(var)
-        for key, var in self.temperaturas.items():
-            self.sub_cv.subscribe_data_change(var)
+        self.sub_cv = self._suscribir(self.handler_cv, list(self.alturas) + list(self.temperaturas))
 
     def subscribir_mv(self): # Subscripación a las variables manipuladas
         self.handler_mv = self.SubHandlerClass()
-        self.sub_mv = self.client.create_subscription(self.periodo, self.handler_mv)
-        for key, var in self.valvulas.items():
-            self.sub_mv.subscribe_data_change(var)
-        for key, var in self.razones.items():
-            self.sub_mv.subscribe_data_change(var)
+        self.sub_mv = self._suscribir(self.handler_mv, list(self.valvulas) + list(self.razones))
 
     def conectar(self):
         try:
@@ -220,13 +662,105 @@ class Cliente():
             print('Cliente OPCUA se ha conectado')
             self._connected = True 
             self.Instanciacion()
-        except:
-            self.client.disconnect()
+            self.generacion_conexion += 1
+        except Exception as e:
+            try:
+                self.client.disconnect()
+            except Exception:
+                pass
             self._connected = False 
+            self._salud['ultimo_error'] = str(e)
             print('Cliente no se ha podido conectar')
 
+    # --- Supervisor de conexión
+    def iniciar_supervisor(self, periodo=1.0, backoff_min=0.5, backoff_max=30.0):
+        """
+        Thread que verifica la conexión cada `periodo` s. Si se pierde (o nunca se estableció)
+        reconecta con backoff exponencial, vuelve a resolver los nodos (Instanciacion) y
+        restaura la suscripción de eventos, la de alarmas de nivel y el muestreo.
+        """
+        if self._supervisor is not None and self._supervisor.is_alive():
+            return
+        self._detener_supervisor.clear()
+        self._supervisor = threading.Thread(target=self._supervisar, args=(periodo, backoff_min, backoff_max),
+                                            name='supervisor_opc', daemon=True)
+        self._supervisor.start()
+
+    def detener_supervisor(self):
+        self._detener_supervisor.set()
+
+    def _conexion_viva(self):
+        try:
+            self.client.get_node(ua.ObjectIds.Server_ServerStatus_State).get_value()
+            return True
+        except Exception as e:
+            self._salud['ultimo_error'] = str(e)
+            return False
+
+    def _supervisar(self, periodo, backoff_min, backoff_max):
+        espera = backoff_min
+        while not self._detener_supervisor.is_set():
+            if self._connected and self._conexion_viva():
+                espera = backoff_min
+                self._detener_supervisor.wait(periodo)
+                continue
+            if self._salud['desconectado_desde'] is None:
+                self._salud['desconectado_desde'] = time.time()
+                if self.generacion_conexion:
+                    print('Conexión OPC UA perdida, reintentando...')
+            if self._reconectar():
+                latencia = time.time() - self._salud['desconectado_desde']
+                self._salud['desconectado_desde'] = None
+                if self.generacion_conexion > 1: # la primera conexión no es una reconexión
+                    self._salud['ultima_latencia_reconexion'] = latencia
+                    self._salud['reconexiones'] += 1
+                    print('Cliente OPCUA reconectado en {:.2f} s'.format(latencia))
+                espera = backoff_min
+            else:
+                self._salud['intentos_fallidos'] += 1
+                self._detener_supervisor.wait(espera)
+                espera = min(2*espera, backoff_max)
+
+    def _reconectar(self):
+        # Espera a que terminen los servicios en curso (cada uno acotado por el timeout del Client);
+        # los que lleguen después fallan hasta terminar la reconstrucción
+        with self._cond_conexion:
+            self._reconstruye = threading.get_ident()
+            self._cond_conexion.wait_for(lambda: self._en_uso == 0)
+        try:
+            return self._reconstruir()
+        finally:
+            with self._cond_conexion:
+                self._reconstruye = None
+
+    def _reconstruir(self):
+        self._connected = False
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+        # Un Client nuevo: las suscripciones y el canal seguro del anterior ya no son válidos
+        self.client = self._nuevo_cliente()
+        self._sub_levels = []
+        self._subscribed_levels = False
+        self._sub_muestreo = []
+        self._muestreo_activo = False
+        self.conectar()
+        if not self._connected:
+            return False
+        try:
+            if self._restaurar_niveles:
+                self.enable_level_subscription()
+            if self._restaurar_muestreo is not None:
+                self.iniciar_muestreo(self._restaurar_muestreo)
+        except Exception as e:
+            self._salud['ultimo_error'] = str(e)
+            self._connected = False
+            return False
+        return True
+
+# Instancia compartida por la app; no se conecta al importar (ver iniciar_supervisor)
 opc_client_instance = Cliente("opc.tcp://localhost:4840/freeopcua/server/", suscribir_eventos=True, SubHandler=SubHandler)
-opc_client_instance.conectar()
 if __name__ == "__main__":
     #cliente = Cliente("opc.tcp://192.168.1.115:4840/freeopcua/server/", suscribir_eventos=True, SubHandler=SubHandler)
     cliente = Cliente("opc.tcp://localhost:4840/freeopcua/server/", suscribir_eventos=True, SubHandler=SubHandler)
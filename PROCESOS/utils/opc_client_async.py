@@ -0,0 +1,260 @@
+import asyncio
+import threading
+import time
+from asyncua import ua, Client
+try:
+    from utils.opc_client import ClienteBase, SubHandler, _fecha_ua
+    from utils import monitoreo
+except ImportError:  # ejecutado desde utils/
+    from opc_client import ClienteBase, SubHandler, _fecha_ua
+    import monitoreo
+
+'''
+Variante asyncio de Cliente (sobre asyncua) para mantener muchas lecturas/escrituras en vuelo,
+contra una o varias estaciones, sin un thread por petición.
+
+    - ClienteAsync: misma API que Cliente (conectar, read_snapshot, read_tank_level, escribir,
+      escribir_varios, publicar_estado, leer_historial, suscripciones, ...) pero con corrutinas.
+      El estado en memoria (caché del muestreo, alarmas, umbrales) y el armado de los pedidos
+      vienen de ClienteBase, igual que en Cliente; aquí solo se esperan los servicios. No tiene
+      supervisor de conexión: tras una caída se vuelve a llamar a conectar().
+    - ClienteSync: fachada bloqueante para scripts que vigilan varias estaciones. Todas las
+      fachadas comparten un único event loop en un thread de fondo. Dash y el simulador siguen
+      con Cliente, que reconecta solo y restaura las suscripciones.
+    - snapshot_estaciones: lee en paralelo el snapshot de varias estaciones.
+'''
+
+
+class ClienteAsync(ClienteBase):
+    ua = ua
+
+    def __init__(self, direccion, suscribir_eventos, SubHandler=SubHandler, timeout=4, estacion=None, n_tanques=4):
+        super().__init__(direccion, suscribir_eventos, SubHandler, estacion=estacion, n_tanques=n_tanques)
+        self.timeout = timeout
+        self.client = Client(direccion, timeout=timeout)
+
+    async def Instanciacion(self):
+        self.root = self.client.nodes.root
+        self.objects = self.client.nodes.objects
+        carpeta = '2:' + self.carpeta
+        self.Tanques = await self.objects.get_child([carpeta, '2:Tanques'])
+        self.Valvulas = await self.objects.get_child([carpeta, '2:Valvulas'])
+        self.Razones = await self.objects.get_child([carpeta, '2:Razones'])
+
+        # Se resuelven todos los nodos en paralelo
+        rutas = {}
+        for i in range(1, len(self.alturas) + 1):
+            rutas['H{}'.format(i)] = (self.Tanques, ['2:Tanque{}'.format(i), '2:h'], self.alturas)
+            rutas['T{}'.format(i)] = (self.Tanques, ['2:Tanque{}'.format(i), '2:T'], self.temperaturas)
+        for i in range(1, len(self.valvulas) + 1):
+            rutas['valvula{}'.format(i)] = (self.Valvulas, ['2:Valvula{}'.format(i), '2:u'], self.valvulas)
+            rutas['razon{}'.format(i)] = (self.Razones, ['2:Razon{}'.format(i), '2:gamma'], self.razones)
+        nodos = await asyncio.gather(*(padre.get_child(ruta) for padre, ruta, _ in rutas.values()))
+        for (key, (_, _, grupo)), node in zip(rutas.items(), nodos):
+            grupo[key] = node
+
+        # Arreglo Estado (opcional: servidores anteriores no lo publican)
+        try:
+            nodo_estado = await self.objects.get_child([carpeta, '2:Estado'])
+        except ua.UaStatusCodeError:
+            nodo_estado = None
+        self._registrar_nodos(nodo_estado)
+
+        if self.subscribir_eventos:
+            self.myevent = await self.root.get_child(["0:Types", "0:EventTypes", "0:BaseEventType", "2:Alarma_nivel"])
+            self.obj_event = await self.objects.get_child([carpeta, '2:Alarmas', '2:Alarma_nivel'])
+            self.handler_event = self.SubHandlerClass()
+            self.sub_event = await self.client.create_subscription(self.periodo, self.handler_event)
+            self.handle_event = await self.sub_event.subscribe_events(self.obj_event, self.myevent)
+
+    async def conectar(self):
+        try:
+            await self.client.connect()
+            print('Cliente OPCUA (async) se ha conectado a {}'.format(self.direccion))
+            self._connected = True
+            await self.Instanciacion()
+            self.generacion_conexion += 1
+        except Exception as e:
+            try:
+                await self.client.disconnect()
+            except Exception:
+                pass
+            self._connected = False
+            self._salud['ultimo_error'] = str(e)
+            print('Cliente (async) no se ha podido conectar a {}'.format(self.direccion))
+
+    async def desconectar(self):
+        self._connected = False
+        await self.client.disconnect()
+
+    async def escribir(self, mv, valor):
+        if mv not in self.valvulas and mv not in self.razones:
+            return
+        await self._nodos[mv].write_value(ua.DataValue(self._variant(mv, valor)))
+        with self._lock:
+            self._ultimos_escritos[mv] = valor
+
+    async def escribir_varios(self, valores, deadband=None):
+        params, claves = self._armar_escritura(valores, deadband)
+        if not claves:
+            return []
+        self._confirmar_escritura(valores, claves, await self.client.uaclient.write(params))
+        return claves
+
+    async def publicar_estado(self, alturas, temperaturas, entradas=(), deadband=None):
+        params, valores, claves, muestra = self._armar_publicacion(alturas, temperaturas, entradas, deadband)
+        if params.NodesToWrite:
+            self._confirmar_publicacion(valores, claves, muestra, await self.client.uaclient.write(params))
+        return muestra
+
+    async def read_snapshot(self, forzar=False):
+        snapshot = self._snapshot_en_memoria(forzar)
+        if snapshot is None:
+            snapshot = self._armar_snapshot(await self.client.uaclient.read(self._read_params))
+        return snapshot
+
+    async def _leer(self, key):
+        return self._valor(self._snapshot_reciente() or await self.read_snapshot(), key)
+
+    async def _leer_o_avisar(self, key, descripcion):
+        try:
+            return await self._leer(key)
+        except Exception as e:
+            print(f"❌ Error al leer {descripcion}: {e}")
+            return None
+
+    async def read_tank_level(self, tank_id):
+        return await self._leer_o_avisar(f"H{tank_id}", f"nivel del Tanque {tank_id}")
+
+    async def read_valve_voltage(self, valvula_id):
+        return await self._leer_o_avisar(f"valvula{valvula_id}", f"voltaje de válvula {valvula_id}")
+
+    async def read_flow_ratio(self, razon_id):
+        return await self._leer_o_avisar(f"razon{razon_id}", f"razón de flujo {razon_id}")
+
+    async def leer_historial(self, claves, inicio, fin=None, lote=1000, incluir_previo=True):
+        series = {key: [] for key in claves}
+        desde = _fecha_ua(inicio)
+        hasta = _fecha_ua(time.time() if fin is None else fin)
+        if incluir_previo:
+            pedido = self._pedido_historial(*self._rango_previo(desde, claves))
+            self._agregar_previos(series, claves, desde, await self.client.uaclient.history_read(pedido))
+        pendientes = [(key, None) for key in claves]
+        while pendientes:
+            resultados = await self.client.uaclient.history_read(self._pedido_historial(desde, hasta, lote, pendientes))
+            pendientes = self._agregar_pagina(series, pendientes, resultados)
+        return series
+
+    async def _suscribir(self, handler, claves):
+        self._registrar_nombres(handler, claves)
+        subs = []
+        for muestreo, grupo in monitoreo.agrupar(claves, self.config_monitoreo).items():
+            sub = await self.client.create_subscription(muestreo, handler)
+            for resultado in await sub.create_monitored_items(monitoreo.pedidos(ua, self._nodos_monitoreo, grupo)):
+                if isinstance(resultado, ua.StatusCode):
+                    resultado.check()
+            subs.append(sub)
+        return subs
+
+    async def _borrar_suscripciones(self, subs):
+        for sub in subs:
+            try:
+                await sub.delete()
+            except Exception:
+                pass
+
+    async def enable_level_subscription(self):
+        if self._subscribed_levels:
+            return True
+        self._sub_levels = await self._suscribir(self.SubHandlerClass(owner=self), list(self.alturas))
+        self._subscribed_levels = True
+        return True
+
+    async def disable_level_subscription(self):
+        await self._borrar_suscripciones(self._sub_levels)
+        self._sub_levels = []
+        self._subscribed_levels = False
+        return True
+
+    async def iniciar_muestreo(self, largo_historial=600):
+        if self._muestreo_activo:
+            return True
+        if not self._connected:
+            return False
+        self._preparar_historial(largo_historial)
+        self._sub_muestreo = await self._suscribir(self.SubHandlerClass(owner=self), self._claves_muestreo())
+        self._muestreo_activo = True
+        return True
+
+    async def detener_muestreo(self):
+        await self._borrar_suscripciones(self._sub_muestreo)
+        self._sub_muestreo = []
+        self._muestreo_activo = False
+        return True
+
+    async def subscribir_cv(self): # Subscripción a las variables controladas
+        self.handler_cv = self.SubHandlerClass()
+        self.sub_cv = await self._suscribir(self.handler_cv, list(self.alturas) + list(self.temperaturas))
+
+    async def subscribir_mv(self): # Subscripación a las variables manipuladas
+        self.handler_mv = self.SubHandlerClass()
+        self.sub_mv = await self._suscribir(self.handler_mv, list(self.valvulas) + list(self.razones))
+
+
+async def snapshot_estaciones(clientes):
+    """Snapshot de varias estaciones a la vez; las lecturas quedan todas en vuelo en paralelo."""
+    return await asyncio.gather(*(cliente.read_snapshot() for cliente in clientes), return_exceptions=True)
+
+
+# Event loop compartido por todas las fachadas sincrónicas
+_loop = None
+_loop_lock = threading.Lock()
+
+def _loop_compartido():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='opc_async_loop', daemon=True).start()
+    return _loop
+
+
+class ClienteSync():
+    '''
+    Fachada bloqueante sobre ClienteAsync: cliente.read_tank_level(1) ejecuta la corrutina en
+    el loop compartido y espera su resultado. Los atributos que no son corrutinas (umbrales,
+    get_alarm_snapshot, historial_muestreo, ...) se delegan tal cual.
+    '''
+    def __init__(self, direccion, suscribir_eventos=True, SubHandler=SubHandler, timeout=4, estacion=None, n_tanques=4):
+        self.loop = _loop_compartido()
+        self.timeout = timeout
+        self.asincrono = ClienteAsync(direccion, suscribir_eventos, SubHandler, timeout=timeout,
+                                      estacion=estacion, n_tanques=n_tanques)
+
+    def ejecutar(self, corrutina):
+        return asyncio.run_coroutine_threadsafe(corrutina, self.loop).result(timeout=10*self.timeout)
+
+    def __getattr__(self, nombre):
+        atributo = getattr(self.asincrono, nombre)
+        if asyncio.iscoroutinefunction(atributo):
+            def bloqueante(*args, **kwargs):
+                return self.ejecutar(atributo(*args, **kwargs))
+            return bloqueante
+        return atributo
+
+
+def snapshot_estaciones_sync(clientes_sync):
+    """Versión bloqueante de snapshot_estaciones para una lista de ClienteSync."""
+    loop = _loop_compartido()
+    corrutina = snapshot_estaciones([cliente.asincrono for cliente in clientes_sync])
+    return asyncio.run_coroutine_threadsafe(corrutina, loop).result()
+
+
+if __name__ == "__main__":
+    async def _demo():
+        cliente = ClienteAsync("opc.tcp://localhost:4840/freeopcua/server/", suscribir_eventos=False)
+        await cliente.conectar()
+        await cliente.escribir_varios({"valvula1": 0.5, "razon1": 0.3})
+        print(await cliente.read_snapshot())
+        await cliente.desconectar()
+    asyncio.run(_demo())
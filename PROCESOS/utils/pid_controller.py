@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class PIDController:
     def __init__(self, Kp, Ki, Kd, setpoint=0, dt=1.0, anti_windup_gain=0.0, output_limits=(0, 0.999)):
 
@@ -20,14 +23,16 @@ class PIDController:
         self.prev_error = 0
         self.last_output = 0
 
-    def compute(self, measurement):
+    def compute(self, measurement, dt=None):
+        # dt medido desde el cálculo anterior; sin indicarlo se usa el nominal self.dt
+        dt = self.dt if dt is None else dt
         error = self.setpoint - measurement
 
         # Derivada y error previo
-        derivative = (error - self.prev_error) / self.dt
+        derivative = (error - self.prev_error) / dt
 
         # Acumulador de la integral
-        self.integral += error * self.dt
+        self.integral += error * dt
 
         # PID antes del clamping
         u = self.Kp * error + self.Ki * self.integral + self.Kd * derivative
@@ -50,3 +55,131 @@ class PIDController:
         self.Kd = setKd
         self.setpoint = newSetPoint
         self.anti_windup_gain = setAntiWindupGain
+
+
+'''
+Banco de PIDs vectorizado: muchos lazos (estaciones, o juegos de ganancias candidatos) con las
+ganancias, referencias, integradores, errores previos, límites y ganancias anti-windup en
+arreglos de NumPy. compute() calcula todas las salidas en una sola llamada con las mismas
+ecuaciones de PIDController; canal(i) entrega un canal con la interfaz de PIDController.
+'''
+
+
+def _arreglo(valor, n):
+    return np.array(np.broadcast_to(np.asarray(valor, dtype=float), (n,)))
+
+
+class PIDBank:
+    def __init__(self, n, Kp=0.0, Ki=0.0, Kd=0.0, setpoint=0, dt=1.0, anti_windup_gain=0.0, output_limits=(0, 0.999)):
+        # Cada parámetro puede ser un escalar (igual para todos los canales) o un arreglo de largo n
+        self.n = n
+        self.Kp = _arreglo(Kp, n)
+        self.Ki = _arreglo(Ki, n)
+        self.Kd = _arreglo(Kd, n)
+        self.setpoint = _arreglo(setpoint, n)
+
+        self.dt = _arreglo(dt, n)
+        self.integral = np.zeros(n)
+        self.prev_error = np.zeros(n)
+        self.anti_windup_gain = _arreglo(anti_windup_gain, n)
+
+        self.u_min = _arreglo(output_limits[0], n)
+        self.u_max = _arreglo(output_limits[1], n)
+        self.last_output = np.zeros(n)
+
+    def __len__(self):
+        return self.n
+
+    def reset(self, canales=None):
+        canales = slice(None) if canales is None else canales
+        self.integral[canales] = 0
+        self.prev_error[canales] = 0
+        self.last_output[canales] = 0
+
+    def compute(self, measurements, dt=None):
+        # measurements: arreglo de largo n; dt opcional (escalar o por canal) en lugar de self.dt
+        dt = self.dt if dt is None else dt
+        error = self.setpoint - np.asarray(measurements, dtype=float)
+
+        # Derivada y acumulador de la integral
+        derivative = (error - self.prev_error) / dt
+        self.integral += error * dt
+
+        # PID antes del clamping y límites por canal
+        u = self.Kp * error + self.Ki * self.integral + self.Kd * derivative
+        u_clamped = np.maximum(self.u_min, np.minimum(u, self.u_max))
+
+        # Anti-windup solo en los canales con ganancia positiva (como PIDController)
+        self.integral += np.where(self.anti_windup_gain > 0, self.anti_windup_gain * (u_clamped - u), 0.0)
+
+        self.prev_error = error
+        self.last_output = u_clamped
+        return u_clamped
+
+    def setParams(self, setKp, setKi, setKd, newSetPoint, setAntiWindupGain, canales=None):
+        canales = slice(None) if canales is None else canales
+        self.Kp[canales] = setKp
+        self.Ki[canales] = setKi
+        self.Kd[canales] = setKd
+        self.setpoint[canales] = newSetPoint
+        self.anti_windup_gain[canales] = setAntiWindupGain
+
+    def canal(self, i):
+        return CanalPID(self, i)
+
+
+def _campo(nombre):
+    # Atributo de PIDController leído/escrito en la posición del canal dentro del banco
+    def leer(self):
+        return float(getattr(self.banco, nombre)[self.i])
+
+    def escribir(self, valor):
+        getattr(self.banco, nombre)[self.i] = valor
+    return property(leer, escribir)
+
+
+class CanalPID:
+    # Un canal de PIDBank con la interfaz de PIDController (compute, reset, setParams y atributos)
+    Kp = _campo('Kp')
+    Ki = _campo('Ki')
+    Kd = _campo('Kd')
+    setpoint = _campo('setpoint')
+    dt = _campo('dt')
+    integral = _campo('integral')
+    prev_error = _campo('prev_error')
+    anti_windup_gain = _campo('anti_windup_gain')
+    last_output = _campo('last_output')
+
+    def __init__(self, banco, i):
+        self.banco = banco
+        self.i = i
+
+    @property
+    def output_limits(self):
+        return (float(self.banco.u_min[self.i]), float(self.banco.u_max[self.i]))
+
+    @output_limits.setter
+    def output_limits(self, limites):
+        self.banco.u_min[self.i], self.banco.u_max[self.i] = limites
+
+    def reset(self):
+        self.banco.reset(self.i)
+
+    def compute(self, measurement, dt=None):
+        # Mismas ecuaciones que PIDController.compute, sobre la posición i del banco
+        b, i = self.banco, self.i
+        dt = float(b.dt[i]) if dt is None else dt
+        error = float(b.setpoint[i]) - measurement
+        derivative = (error - float(b.prev_error[i])) / dt
+        integral = float(b.integral[i]) + error * dt
+        u = float(b.Kp[i]) * error + float(b.Ki[i]) * integral + float(b.Kd[i]) * derivative
+        u_clamped = max(float(b.u_min[i]), min(u, float(b.u_max[i])))
+        if b.anti_windup_gain[i] > 0:
+            integral += float(b.anti_windup_gain[i]) * (u_clamped - u)
+        b.integral[i] = integral
+        b.prev_error[i] = error
+        b.last_output[i] = u_clamped
+        return u_clamped
+
+    def setParams(self, setKp, setKi, setKd, newSetPoint, setAntiWindupGain):
+        self.banco.setParams(setKp, setKi, setKd, newSetPoint, setAntiWindupGain, canales=self.i)
@@ -0,0 +1,146 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from opcua import ua
+
+'''
+Planificador de tareas del servidor OPC UA.
+
+Reemplaza el loop fijo de 100 ms que revisaba en secuencia las alarmas de cada namespace.
+Cada namespace registra sus tareas periódicas, con su periodo y plazo (deadline) propios.
+Una tarea se puede adelantar con disparar() (por ejemplo, desde MotorAlarmas.al_cambiar al
+llegar un cambio de datos): corre en el instante pedido y no en el siguiente múltiplo de 100 ms.
+Un thread despacha las tareas a un pool de workers, por lo que una tarea lenta no atrasa a
+las demás; una misma tarea nunca corre en paralelo consigo misma. Por tarea se registran
+ejecuciones, atrasos (terminó después de su plazo), omitidas (seguía corriendo al volver a
+tocarle) y latencia y duración máximas, y se pueden publicar como variables del servidor.
+'''
+
+CAMPOS_STATS = ('ejecuciones', 'atrasos', 'omitidas', 'latencia_max', 'duracion_max')
+
+
+class Tarea():
+    def __init__(self, nombre, funcion, periodo=None, plazo=None):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.periodo = periodo  # s
+        self.plazo = plazo if plazo is not None else periodo
+        self.proxima = None     # instante (time.monotonic) en que debe ejecutarse
+        self.en_curso = False
+        self.stats = {'ejecuciones': 0, 'atrasos': 0, 'omitidas': 0, 'latencia_max': 0.0,
+                      'duracion_max': 0.0, 'ultima_duracion': None}
+
+
+class Planificador():
+    def __init__(self, n_workers=4, nombre='planificador'):
+        self.nombre = nombre
+        self.tareas = {}
+        self._cond = threading.Condition()
+        self._pool = ThreadPoolExecutor(n_workers, thread_name_prefix=nombre)
+        self._thread = None
+        self._detener = False
+        self._write_params = None
+
+    def periodica(self, nombre, funcion, periodo, plazo=None):
+        tarea = Tarea(nombre, funcion, periodo, plazo)
+        with self._cond:
+            tarea.proxima = time.monotonic()
+            self.tareas[nombre] = tarea
+            self._cond.notify()
+        return tarea
+
+    def disparar(self, nombre, en=None):
+        """Ejecuta la tarea ahora o en el instante `en` (epoch, time.time()), lo que ocurra antes."""
+        objetivo = time.monotonic() if en is None else time.monotonic() + (en - time.time())
+        with self._cond:
+            tarea = self.tareas[nombre]
+            if objetivo < tarea.proxima:
+                tarea.proxima = objetivo
+                self._cond.notify()
+
+    def iniciar(self):
+        if self._thread is not None:
+            return
+        self._detener = False
+        self._thread = threading.Thread(target=self._correr, name=self.nombre, daemon=True)
+        self._thread.start()
+
+    def detener(self):
+        with self._cond:
+            self._detener = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._thread = None
+        self._pool.shutdown(wait=False)
+
+    def _correr(self):
+        with self._cond:
+            while not self._detener:
+                ahora = time.monotonic()
+                for tarea in self.tareas.values():
+                    if tarea.proxima > ahora:
+                        continue
+                    if tarea.en_curso:  # le tocaba y sigue corriendo: se omite
+                        tarea.stats['omitidas'] += 1
+                        tarea.stats['atrasos'] += 1
+                        tarea.proxima = max(tarea.proxima + tarea.periodo, ahora)
+                        continue
+                    programada = tarea.proxima
+                    # Sin ráfagas para recuperar periodos perdidos
+                    tarea.proxima = programada + tarea.periodo
+                    if tarea.proxima <= ahora:
+                        tarea.proxima = ahora + tarea.periodo
+                    tarea.en_curso = True
+                    self._pool.submit(self._ejecutar, tarea, programada)
+
+                proximas = [tarea.proxima for tarea in self.tareas.values() if not tarea.en_curso]
+                self._cond.wait(max(0.0, min(proximas) - time.monotonic()) if proximas else None)
+
+    def _ejecutar(self, tarea, programada):
+        inicio = time.monotonic()
+        try:
+            tarea.funcion()
+        except Exception as e:
+            print('Error en la tarea {}: {}'.format(tarea.nombre, e))
+        fin = time.monotonic()
+        with self._cond:
+            stats = tarea.stats
+            stats['ejecuciones'] += 1
+            stats['latencia_max'] = max(stats['latencia_max'], inicio - programada)
+            stats['ultima_duracion'] = fin - inicio
+            stats['duracion_max'] = max(stats['duracion_max'], fin - inicio)
+            if tarea.plazo is not None and fin - programada > tarea.plazo:
+                stats['atrasos'] += 1
+            tarea.en_curso = False
+            self._cond.notify()
+
+    def estadisticas(self):
+        with self._cond:
+            return {nombre: dict(tarea.stats) for nombre, tarea in self.tareas.items()}
+
+    def exponer(self, server, idx, periodo=1.0):
+        """
+        Publica las estadísticas de cada tarea registrada en Objects/Planificador/<tarea>/<campo>,
+        actualizadas cada `periodo` s con un único Write interno.
+        """
+        carpeta = server.get_objects_node().add_folder(idx, 'Planificador')
+        self._write_params = ua.WriteParameters()
+        self._campos = []
+        for nombre in list(self.tareas) + ['planificador.stats']:
+            obj = carpeta.add_object(idx, nombre)
+            for campo in CAMPOS_STATS:
+                var = obj.add_variable(idx, campo, 0.0)
+                attr = ua.WriteValue()
+                attr.NodeId = var.nodeid
+                attr.AttributeId = ua.AttributeIds.Value
+                self._write_params.NodesToWrite.append(attr)
+                self._campos.append((nombre, campo))
+        self._server = server
+        self.periodica('planificador.stats', self._publicar, periodo)
+
+    def _publicar(self):
+        stats = self.estadisticas()
+        for attr, (nombre, campo) in zip(self._write_params.NodesToWrite, self._campos):
+            attr.Value = ua.DataValue(ua.Variant(float(stats[nombre][campo]), ua.VariantType.Double))
+        self._server.iserver.isession.write(self._write_params)
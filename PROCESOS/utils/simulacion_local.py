@@ -0,0 +1,118 @@
+import random
+import threading
+import time
+from datetime import datetime
+from opcua import ua
+from QuadrupleTank import QuadrupleTankEnsemble
+
+'''
+Simulación de las plantas dentro del proceso del servidor OPC UA.
+
+En lugar del simulador externo (QuadrupleTank.py, un cliente OPC que por cada tick lee válvulas
+y razones y escribe niveles y temperaturas por TCP), el modelo corre en un thread del servidor
+a paso fijo y lee/escribe los nodos del address space local: un Read y un Write internos por
+tick para todas las estaciones, sin red ni serialización. En el mismo Write va el arreglo Estado
+de cada estación, con la muestra completa y su contador. Todas las estaciones se integran
+juntas con QuadrupleTankEnsemble. Las escrituras pasan por el servicio Write interno, así que
+suscripciones, alarmas e historial funcionan igual que con el simulador externo.
+'''
+
+
+class SimulacionLocal():
+    def __init__(self, server, namespaces, Ts=0.01, x0=(40, 40, 40, 40), Hmax=50, voltmax=10, integrador='rk4'):
+        for namespace in namespaces:
+            if len(namespace.niveles) != 4 or len(namespace.u_Valvulas) != 2:
+                raise ValueError('La simulación local requiere estaciones de cuatro tanques')
+        self.server = server
+        self.namespaces = list(namespaces)
+        self.Ts = Ts
+        self.modelo = QuadrupleTankEnsemble(x0, Hmax, voltmax, len(self.namespaces), integrador=integrador)
+        self.stats = {'ticks': 0, 'atrasos': 0, 'entradas_invalidas': 0, 'ultimo_calculo': None, 'max_calculo': 0.0}
+
+        # Read de entradas y Write de estado de todas las estaciones, armados una sola vez
+        self._read_params = ua.ReadParameters()
+        for namespace in self.namespaces:
+            for node in namespace.u_Valvulas + namespace.u_Razones:
+                rv = ua.ReadValueId()
+                rv.NodeId = node.nodeid
+                rv.AttributeId = ua.AttributeIds.Value
+                self._read_params.NodesToRead.append(rv)
+        self._write_params = ua.WriteParameters()
+        for namespace in self.namespaces:
+            for node in namespace.niveles + namespace.temperaturas + [namespace.estado]:
+                attr = ua.WriteValue()
+                attr.NodeId = node.nodeid
+                attr.AttributeId = ua.AttributeIds.Value
+                self._write_params.NodesToWrite.append(attr)
+
+        self._detener = threading.Event()
+        self._thread = None
+
+    def iniciar(self):
+        if self._thread is not None:
+            return
+        self._detener.clear()
+        self._thread = threading.Thread(target=self._correr, name='simulacion_local', daemon=True)
+        self._thread.start()
+
+    def detener(self):
+        self._detener.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    # Entradas fuera de rango se ignoran (se mantiene el último valor válido de la estación)
+    def _leer_entradas(self):
+        resultados = self.server.iserver.isession.read(self._read_params)
+        valores = [dv.Value.Value if dv.StatusCode.is_good() else None for dv in resultados]
+        for i in range(len(self.namespaces)):
+            v1, v2, g1, g2 = valores[4*i:4*i + 4]
+            if None in (v1, v2, g1, g2) or not (-1 <= v1 <= 1 and -1 <= v2 <= 1 and 0 <= g1 <= 1 and 0 <= g2 <= 1):
+                self.stats['entradas_invalidas'] += 1
+                continue
+            self.modelo.volt[i] = (v1, v2)
+            self.modelo.gamma[i] = (g1, g2)
+
+    def _escribir_estado(self, x):
+        ahora = datetime.utcnow()  # misma marca de tiempo para toda la muestra
+        attrs = iter(self._write_params.NodesToWrite)
+        for i, alturas in enumerate(x):
+            muestra = list(alturas) + [22 + random.randrange(-7, 7, 1) for _ in range(4)]
+            for valor in muestra:
+                dv = ua.DataValue(ua.Variant(float(valor), ua.VariantType.Double))
+                dv.SourceTimestamp = ahora
+                next(attrs).Value = dv
+            # Arreglo Estado: contador de muestra, niveles, temperaturas y entradas aplicadas en el paso
+            estado = [float(self.stats['ticks'] + 1)] + muestra + list(self.modelo.volt[i]) + list(self.modelo.gamma[i])
+            dv = ua.DataValue(ua.Variant([float(v) for v in estado], ua.VariantType.Double))
+            dv.SourceTimestamp = ahora
+            next(attrs).Value = dv
+        for resultado in self.server.iserver.isession.write(self._write_params):
+            resultado.check()
+
+    def paso(self):
+        t0 = time.perf_counter()
+        self._leer_entradas()
+        x = self.modelo.paso(self.Ts)
+        self._escribir_estado(x)
+        calculo = time.perf_counter() - t0
+        self.stats['ticks'] += 1
+        self.stats['ultimo_calculo'] = calculo
+        self.stats['max_calculo'] = max(self.stats['max_calculo'], calculo)
+
+    # Paso fijo Ts contra el reloj monotónico; si un tick se atrasa más de un periodo no se recupera en ráfaga
+    def _correr(self):
+        siguiente = time.perf_counter()
+        while not self._detener.is_set():
+            try:
+                self.paso()
+            except Exception as e:
+                print('Error en la simulación local: {}'.format(e))
+            siguiente += self.Ts
+            espera = siguiente - time.perf_counter()
+            if espera > 0:
+                self._detener.wait(espera)
+            else:
+                self.stats['atrasos'] += 1
+                if espera < -self.Ts:
+                    siguiente = time.perf_counter()